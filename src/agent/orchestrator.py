@@ -1,19 +1,161 @@
+"""
+Orquestador BI + RAG.
+Con route 'both' las ramas BI (DuckDB) y RAG (embedding + búsqueda + LLM) se ejecutan en
+paralelo en un pool de hilos compartido, cada una con su timeout: si una rama no llega a
+tiempo se devuelve la respuesta parcial de la otra. La respuesta incluye tiempos por rama.
+Las respuestas completas se cachean (texto normalizado) hasta que cambian índice o datos BI.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from src.agent.router import classify
 from src.agent import sql_exec
-from src.rag.pipeline import answer as rag_answer
+from src.app.config import settings
+from src.app.telemetry import run_traced
+from src.bi.engine import get_engine
+from src.rag.answer_cache import AnswerCache
+from src.rag.pipeline import answer as rag_answer, astream_answer as rag_astream, index_version
 
-def agent_answer(query: str, top_k: int = 5):
-    route = classify(query)
-    bi_out, rag_out = None, None
-    if route.action in ("bi","both"):
-        bi_out = sql_exec.run(route.bi_intent)
-    if route.action in ("rag","both"):
-        rag_out = rag_answer(query, top_k=top_k)
+_cache = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.agent_workers, thread_name_prefix="agent")
+    return _pool
+
+def _submit(fn, *args, **kwargs):
+    # Copia del contexto: los spans de la rama se suman a la traza de la petición y el
+    # perfilador muestrea este hilo solo mientras trabaja para ella
+    return _executor().submit(contextvars.copy_context().run, run_traced, fn, *args, **kwargs)
+
+def _answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _pool_lock:
+            if _cache is None:
+                # Solo coincidencia exacta: una pregunta parecida puede enrutar a otra intención BI
+                _cache = AnswerCache("agent", max_entries=settings.answer_cache_size, ttl=settings.answer_cache_ttl)
+    return _cache
+
+def data_version(route):
+    # Solo las fuentes que usa la ruta: una pregunta solo-BI no carga el índice vectorial
+    return (index_version() if route.action in ("rag", "both") else None,
+            get_engine().version() if route.action in ("bi", "both") else None)
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000
+
+def _compose(bi_out, rag_out):
     # Composición final
     parts = []
-    mode = route.action
     if bi_out and bi_out["result"]:
         parts.append(f"[BI/{bi_out['intent']}] SQL: {bi_out['sql']}")
     if rag_out:
         parts.append(f"[RAG/{rag_out['mode']}] {rag_out['answer']}")
-    return {"mode": mode, "bi": bi_out, "rag": rag_out, "answer": "\n\n".join(parts)}
+    return "\n\n".join(parts)
+
+def agent_answer(query: str, top_k: int = 5):
+    cache = _answer_cache()
+    if not cache.enabled:
+        return _agent_answer(query, top_k)
+    t0 = time.perf_counter()
+    route = classify(query)
+    version = data_version(route)
+    hit = cache.get(query, top_k, version)
+    if hit is not None:
+        return {**hit, "cached": "exact",
+                "timings": {"bi_ms": None, "rag_ms": None, "total_ms": (time.perf_counter() - t0) * 1000}}
+    out = _agent_answer(query, top_k, route)
+    # Como en pipeline.answer: una rama RAG en fallback (Ollama caído) no se cachea
+    fallback = out["rag"] is not None and out["rag"]["mode"] != settings.generator_mode.lower()
+    if not out["partial"] and not fallback:
+        cache.put(query, top_k, version, out)
+    return out
+
+def _agent_answer(query: str, top_k: int = 5, route=None):
+    route = route or classify(query)
+    t0 = time.perf_counter()
+    branches = {}
+    if route.action in ("bi","both"):
+        branches["bi"] = (_submit(_timed, sql_exec.run, route.bi_intent), settings.agent_bi_timeout)
+    if route.action in ("rag","both"):
+        branches["rag"] = (_submit(_timed, rag_answer, query, top_k=top_k), settings.agent_rag_timeout)
+
+    outputs, timings, timed_out, errors = {}, {}, [], {}
+    for name, (fut, timeout) in branches.items():
+        # Cada rama tiene su propio plazo contado desde el inicio (corren a la vez)
+        remaining = max(timeout - (time.perf_counter() - t0), 0)
+        try:
+            outputs[name], timings[f"{name}_ms"] = fut.result(timeout=remaining)
+        except FutureTimeout:
+            # El hilo no se puede interrumpir: termina en segundo plano y su resultado se descarta
+            timed_out.append(name)
+            timings[f"{name}_ms"] = None
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+            timings[f"{name}_ms"] = None
+    timings["total_ms"] = (time.perf_counter() - t0) * 1000
+
+    bi_out, rag_out = outputs.get("bi"), outputs.get("rag")
+    return {
+        "mode": route.action,
+        "bi": bi_out,
+        "rag": rag_out,
+        "answer": _compose(bi_out, rag_out),
+        "partial": bool(timed_out or errors),
+        "timed_out": timed_out,
+        "errors": errors,
+        "timings": timings,
+        "cached": None,
+    }
+
+async def astream_agent_answer(query: str, top_k: int = 5):
+    # Variante en streaming: BI corre en paralelo a la recuperación/generación RAG;
+    # su resultado se emite en cuanto está y los tokens RAG según se generan
+    route = classify(query)
+    yield {"event": "route", "mode": route.action, "bi_intent": route.bi_intent}
+    parts = []
+    bi_task = None
+    if route.action in ("bi","both"):
+        bi_task = asyncio.ensure_future(asyncio.wait_for(
+            asyncio.to_thread(run_traced, sql_exec.run, route.bi_intent), timeout=settings.agent_bi_timeout))
+
+    errors = {}
+
+    async def bi_event():
+        try:
+            bi_out = await bi_task
+        except asyncio.TimeoutError:
+            errors["bi"] = "timeout"
+            return {"event": "bi", "intent": route.bi_intent, "timed_out": True}
+        except Exception as e:
+            # Como en agent_answer: la rama fallida deja una respuesta parcial, no corta el stream
+            errors["bi"] = f"{type(e).__name__}: {e}"
+            return {"event": "bi", "intent": route.bi_intent, "error": errors["bi"]}
+        if bi_out["result"]:
+            parts.insert(0, f"[BI/{bi_out['intent']}] SQL: {bi_out['sql']}")
+        return {"event": "bi", **bi_out}
+
+    if route.action in ("rag","both"):
+        async for ev in rag_astream(query, top_k=top_k):
+            if bi_task is not None and bi_task.done():
+                yield await bi_event()
+                bi_task = None
+            if ev["event"] == "done":
+                parts.append(f"[RAG/{ev['mode']}] {ev['answer']}")
+            else:
+                yield ev
+    if bi_task is not None:
+        yield await bi_event()
+    yield {"event": "done", "mode": route.action, "answer": "\n\n".join(parts), "partial": bool(errors)}
@@ -1,27 +1,29 @@
-import duckdb, pandas as pd
-from src.bi.load_data import load_all
+"""
+Plantillas de agregados seguras por intent, ejecutadas en el motor analítico persistente
+(src/bi/engine.py): sin recargar CSV por petición, con caché de resultados y resueltas
+sobre el rollup más pequeño que las responde (src/bi/rollups.py).
+"""
+
+from src.app.telemetry import span
+from src.bi.engine import get_engine
+from src.bi.rollups import Aggregate, raw_sql
+
+INTENTS = {
+    "sales_total": Aggregate("sales", select=(("total_sales", "{sales}"), ("profit", "{sales} - {cost}"))),
+    "sales_by_region": Aggregate("sales", ("region",), (("s", "{sales}"),), order_by="s DESC"),
+    "sales_by_product": Aggregate("sales", ("product",), (("s", "{sales}"),), order_by="s DESC"),
+    "sales_trend_m": Aggregate("sales", ("month",), (("s", "{sales}"),), order_by="1", aliases=(("month", "m"),)),
+    "support_kpis": Aggregate("support", select=(("tickets", "{tickets}"),
+                                                 ("avg_h", "{resolution_hours} / NULLIF({resolved}, 0)"))),
+}
+
+# SQL equivalente sobre las filas crudas (referencia y línea base del benchmark)
+INTENT_SQL = {intent: raw_sql(spec) for intent, spec in INTENTS.items()}
 
 def run(intent: str):
-    sales, support = load_all()
-    con = duckdb.connect(database=":memory:")
-    con.register("sales", sales)
-    con.register("support", support)
-    if intent == "sales_total":
-        df = con.execute("SELECT SUM(sales) AS total_sales, SUM(sales-cost) AS profit FROM sales").fetchdf()
-        sql = "SELECT SUM(sales) AS total_sales, SUM(sales-cost) AS profit FROM sales"
-    elif intent == "sales_by_region":
-        df = con.execute("SELECT region, SUM(sales) s FROM sales GROUP BY 1 ORDER BY s DESC").fetchdf()
-        sql = "SELECT region, SUM(sales) s FROM sales GROUP BY 1 ORDER BY s DESC"
-    elif intent == "sales_by_product":
-        df = con.execute("SELECT product, SUM(sales) s FROM sales GROUP BY 1 ORDER BY s DESC").fetchdf()
-        sql = "SELECT product, SUM(sales) s FROM sales GROUP BY 1 ORDER BY s DESC"
-    elif intent == "sales_trend_m":
-        df = con.execute("SELECT date_trunc('month',date) m, SUM(sales) s FROM sales GROUP BY 1 ORDER BY 1").fetchdf()
-        sql = "SELECT date_trunc('month',date) m, SUM(sales) s FROM sales GROUP BY 1 ORDER BY 1"
-    elif intent == "support_kpis":
-        df = con.execute("SELECT COUNT(*) tickets, AVG(resolution_hours) avg_h FROM support").fetchdf()
-        sql = "SELECT COUNT(*) tickets, AVG(resolution_hours) avg_h FROM support"
-    else:
-        df = pd.DataFrame()
-        sql = ""
-    return {"intent": intent, "sql": sql, "result": df.to_dict(orient="records")}
+    spec = INTENTS.get(intent)
+    if spec is None:
+        return {"intent": intent, "sql": "", "result": []}
+    with span("bi.query", intent=intent):
+        sql, rows = get_engine().aggregate(spec)
+        return {"intent": intent, "sql": sql, "result": rows}
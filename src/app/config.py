@@ -13,13 +13,106 @@ load_dotenv()
 class Settings(BaseModel):
     rag_backend: str = Field(default=os.getenv("RAG_BACKEND", "faiss"))
     embeddings_model: str = Field(default=os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+    # Qdrant: servidor (gRPC preferido) o modo local con QDRANT_LOCATION (":memory:" o ruta);
+    # subidas en lotes de QDRANT_BATCH_SIZE puntos con QDRANT_PARALLEL procesos
+    qdrant_host: str = Field(default=os.getenv("QDRANT_HOST", "127.0.0.1"))
+    qdrant_port: int = Field(default=int(os.getenv("QDRANT_PORT", "6333")))
+    qdrant_grpc_port: int = Field(default=int(os.getenv("QDRANT_GRPC_PORT", "6334")))
+    qdrant_prefer_grpc: bool = Field(default=os.getenv("QDRANT_PREFER_GRPC", "1").lower() in ("1", "true", "yes"))
+    qdrant_location: str = Field(default=os.getenv("QDRANT_LOCATION", ""))
+    qdrant_collection: str = Field(default=os.getenv("QDRANT_COLLECTION", "rag_chunks"))
+    qdrant_batch_size: int = Field(default=int(os.getenv("QDRANT_BATCH_SIZE", "256")))
+    qdrant_parallel: int = Field(default=int(os.getenv("QDRANT_PARALLEL", "1")))
     ollama_base_url: str = Field(default=os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434"))
     ollama_model: str = Field(default=os.getenv("OLLAMA_MODEL", "llama3"))
+    # Generación: timeout entre fragmentos, generaciones simultáneas y espera máxima por un hueco (s)
+    ollama_timeout: float = Field(default=float(os.getenv("OLLAMA_TIMEOUT", "30")))
+    ollama_max_concurrency: int = Field(default=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")))
+    ollama_queue_timeout: float = Field(default=float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "5")))
     generator_mode: str = Field(default=os.getenv("GENERATOR_MODE", "ollama"))  # ollama|stub
+    # Contexto del prompt: tokens máximos (0 = sin límite), mínimo para incluir un pasaje recortado
+    # y codificación de tiktoken con la que se cuentan
+    prompt_max_tokens: int = Field(default=int(os.getenv("PROMPT_MAX_TOKENS", "1536")))
+    prompt_min_passage_tokens: int = Field(default=int(os.getenv("PROMPT_MIN_PASSAGE_TOKENS", "64")))
+    prompt_tokenizer: str = Field(default=os.getenv("PROMPT_TOKENIZER", "cl100k_base"))
     data_dir: Path = Field(default=Path(os.getenv("DATA_DIR", "./data")))
     processed_dir: Path = Field(default=Path(os.getenv("PROCESSED_DIR", "./data/processed")))
     chunk_target_tokens: int = Field(default=int(os.getenv("CHUNK_TARGET_TOKENS", "700")))
     chunk_overlap_tokens: int = Field(default=int(os.getenv("CHUNK_OVERLAP_TOKENS", "120")))
+    chunk_mode: str = Field(default=os.getenv("CHUNK_MODE", "words"))  # words|sentences
+    # Ingesta en pipeline: procesos de extracción (0 = auto, 1 = secuencial), chunks por lote y lotes en cola
+    ingest_workers: int = Field(default=int(os.getenv("INGEST_WORKERS", "0")))
+    ingest_batch_size: int = Field(default=int(os.getenv("INGEST_BATCH_SIZE", "256")))
+    ingest_queue_depth: int = Field(default=int(os.getenv("INGEST_QUEUE_DEPTH", "4")))
+    # Páginas de PDF por tarea del pool de extracción (un PDF grande se reparte entre todos los procesos)
+    pdf_pages_per_task: int = Field(default=int(os.getenv("PDF_PAGES_PER_TASK", "16")))
+
+    # Caché de embeddings: entradas máximas en disco (0 = desactivada) y consultas en la LRU en memoria
+    emb_cache_max_entries: int = Field(default=int(os.getenv("EMB_CACHE_MAX_ENTRIES", "500000")))
+    query_cache_size: int = Field(default=int(os.getenv("QUERY_CACHE_SIZE", "1024")))
+
+    # Búsqueda híbrida: BM25 (índice invertido creado en la ingesta) + densa, fusionadas con RRF.
+    # hybrid_candidates: candidatos por cada lado antes de fusionar
+    hybrid_search: bool = Field(default=os.getenv("HYBRID_SEARCH", "1").lower() in ("1", "true", "yes"))
+    hybrid_candidates: int = Field(default=int(os.getenv("HYBRID_CANDIDATES", "20")))
+    rrf_k: int = Field(default=int(os.getenv("RRF_K", "60")))
+    bm25_k1: float = Field(default=float(os.getenv("BM25_K1", "1.2")))
+    bm25_b: float = Field(default=float(os.getenv("BM25_B", "0.75")))
+
+    # Reordenado con cross-encoder (CPU): se piden rerank_candidates pasajes y se quedan los top_k.
+    # rerank_budget_ms: si el reordenado no cabe en el presupuesto se devuelve el orden denso
+    rerank_enabled: bool = Field(default=os.getenv("RERANK_ENABLED", "0").lower() in ("1", "true", "yes"))
+    rerank_model: str = Field(default=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    rerank_candidates: int = Field(default=int(os.getenv("RERANK_CANDIDATES", "20")))
+    rerank_batch_size: int = Field(default=int(os.getenv("RERANK_BATCH_SIZE", "16")))
+    rerank_budget_ms: float = Field(default=float(os.getenv("RERANK_BUDGET_MS", "500")))
+    rerank_cache_size: int = Field(default=int(os.getenv("RERANK_CACHE_SIZE", "10000")))
+
+    # Caché de respuestas (/ask y /agent_ask): entradas (0 = desactivada), TTL en segundos y
+    # umbral coseno para aciertos semánticos (0 = solo coincidencia exacta del texto normalizado)
+    answer_cache_size: int = Field(default=int(os.getenv("ANSWER_CACHE_SIZE", "1024")))
+    answer_cache_ttl: float = Field(default=float(os.getenv("ANSWER_CACHE_TTL", "600")))
+    answer_cache_semantic_threshold: float = Field(default=float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0")))
+
+    # Carga de modelo e índice al arrancar la API (en segundo plano; /health expone "ready")
+    warmup_on_startup: bool = Field(default=os.getenv("WARMUP_ON_STARTUP", "1").lower() in ("1", "true", "yes"))
+    # Agente: hilos compartidos y timeout por rama (s); si una rama no llega se responde con la otra
+    agent_workers: int = Field(default=int(os.getenv("AGENT_WORKERS", "8")))
+    agent_bi_timeout: float = Field(default=float(os.getenv("AGENT_BI_TIMEOUT", "10")))
+    agent_rag_timeout: float = Field(default=float(os.getenv("AGENT_RAG_TIMEOUT", "45")))
+    # Índice FAISS: flat (exacto) | hnsw | ivf_flat | ivf_pq, con parámetros de construcción y búsqueda
+    faiss_index: str = Field(default=os.getenv("FAISS_INDEX", "flat"))
+    faiss_nlist: int = Field(default=int(os.getenv("FAISS_NLIST", "1024")))
+    faiss_pq_m: int = Field(default=int(os.getenv("FAISS_PQ_M", "16")))
+    faiss_hnsw_m: int = Field(default=int(os.getenv("FAISS_HNSW_M", "32")))
+    faiss_ef_construction: int = Field(default=int(os.getenv("FAISS_EF_CONSTRUCTION", "200")))
+    faiss_nprobe: int = Field(default=int(os.getenv("FAISS_NPROBE", "16")))
+    faiss_ef_search: int = Field(default=int(os.getenv("FAISS_EF_SEARCH", "64")))
+    faiss_train_size: int = Field(default=int(os.getenv("FAISS_TRAIN_SIZE", "100000")))
+    # Precisión de los vectores en el índice: fp32 | fp16 | sq8 (int8) | pq; FAISS_RERANK > 0 guarda los
+    # float32 en disco y reordena top_k * FAISS_RERANK candidatos con producto interno exacto
+    faiss_precision: str = Field(default=os.getenv("FAISS_PRECISION", "fp32"))
+    faiss_rerank: int = Field(default=int(os.getenv("FAISS_RERANK", "0")))
+    # RAG_BACKEND=faiss_sharded: número de shards, reparto (source | round_robin) e hilos de búsqueda (0 = uno por shard)
+    faiss_shards: int = Field(default=int(os.getenv("FAISS_SHARDS", "4")))
+    faiss_shard_by: str = Field(default=os.getenv("FAISS_SHARD_BY", "source"))
+    faiss_shard_workers: int = Field(default=int(os.getenv("FAISS_SHARD_WORKERS", "0")))
+    # BI: fuentes de ventas/soporte (CSV o dataset Parquet particionado por mes); vacío = datos de ejemplo
+    bi_sales_path: str = Field(default=os.getenv("BI_SALES_PATH", ""))
+    bi_support_path: str = Field(default=os.getenv("BI_SUPPORT_PATH", ""))
+    # BI: enrutar agregados a los rollups materializados (0 = siempre sobre las filas crudas)
+    bi_rollups: bool = Field(default=os.getenv("BI_ROLLUPS", "1").lower() in ("1", "true", "yes"))
+    # Telemetría: histogramas por etapa/endpoint en /metrics; perfilado por muestreo de peticiones
+    # que superen PROFILE_SLOW_MS (0 = desactivado) en una fracción PROFILE_SAMPLE_RATE de ellas
+    metrics_enabled: bool = Field(default=os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes"))
+    profile_slow_ms: float = Field(default=float(os.getenv("PROFILE_SLOW_MS", "0")))
+    profile_sample_rate: float = Field(default=float(os.getenv("PROFILE_SAMPLE_RATE", "0.1")))
+    profile_interval_ms: float = Field(default=float(os.getenv("PROFILE_INTERVAL_MS", "5")))
+
+    def resolved_ingest_workers(self) -> int:
+        if self.ingest_workers > 0:
+            return self.ingest_workers
+        return max((os.cpu_count() or 2) - 1, 1)
 
     def ensure_dirs(self) -> None:
         self.data_dir.mkdir(parents=True, exist_ok=True)
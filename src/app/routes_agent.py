@@ -1,13 +1,25 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from src.agent.orchestrator import agent_answer
+from src.agent.orchestrator import agent_answer, astream_agent_answer
+from src.app.streaming import sse_response
+from src.app.telemetry import trace
 
 router = APIRouter()
 
 class AgentAsk(BaseModel):
     query: str
     top_k: int = 5
+    # Añade a "timings" el desglose por etapa ("stages") de ambas ramas
+    timings: bool = False
 
 @router.post("/agent_ask")
 def agent_ask(req: AgentAsk):
-    return agent_answer(req.query, top_k=req.top_k)
+    with trace("agent_ask") as tr:
+        res = agent_answer(req.query, top_k=req.top_k)
+    if req.timings:
+        res = {**res, "timings": {**res["timings"], "stages": tr.timings()["stages"]}}
+    return res
+
+@router.post("/agent_ask_stream")
+async def agent_ask_stream(req: AgentAsk):
+    return sse_response(astream_agent_answer(req.query, top_k=req.top_k))
@@ -1,22 +1,78 @@
 """
-Rutas de API para el RAG: /health y /ask
+Rutas de API para el RAG: /health, /ask, /ask_stream (SSE), /ask_batch y /cache_stats
 """
 
+from datetime import date
+from typing import List, Optional
 from fastapi import APIRouter
-from pydantic import BaseModel
-from ..rag.pipeline import answer
+from pydantic import BaseModel, Field
+from ..rag.pipeline import answer, answer_many, astream_answer, get_answer_cache, get_reranker, is_ready
+from ..rag.answer_cache import CACHES
+from ..rag.filters import SearchFilter
+from .streaming import sse_response
+from .telemetry import trace
 
 router = APIRouter()
 
+class AskFilters(BaseModel):
+    # Restringe la recuperación; date_from/date_to (inclusivos) sobre la fecha de modificación del fichero
+    source: Optional[List[str]] = None
+    doc_type: Optional[List[str]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+    def to_search_filter(self) -> Optional[SearchFilter]:
+        return SearchFilter.build(self.source, self.doc_type, self.date_from, self.date_to)
+
+def _filters(f: Optional[AskFilters]) -> Optional[SearchFilter]:
+    return f.to_search_filter() if f is not None else None
+
 class AskRequest(BaseModel):
     query: str
     top_k: int = 5
+    filters: Optional[AskFilters] = None
+    # Añade a la respuesta el bloque "timings" (total y milisegundos por etapa)
+    timings: bool = False
+
+class AskBatchRequest(BaseModel):
+    # Lotes grandes para evaluación offline o etiquetado masivo (un encode + una búsqueda)
+    queries: List[str] = Field(..., min_length=1, max_length=1024)
+    top_k: int = 5
+    filters: Optional[AskFilters] = None
+    timings: bool = False
 
 @router.get("/health")
 def health():
-    return {"status": "ok"}
+    # ready: modelo de embeddings e índice cargados (warmup completado)
+    return {"status": "ok", "ready": is_ready()}
 
 @router.post("/ask")
 def ask(req: AskRequest):
-    res = answer(req.query, top_k=req.top_k)
+    with trace("ask") as tr:
+        res = answer(req.query, top_k=req.top_k, filters=_filters(req.filters))
+    if req.timings:
+        res = {**res, "timings": tr.timings()}
     return res
+
+@router.post("/ask_stream")
+async def ask_stream(req: AskRequest):
+    return sse_response(astream_answer(req.query, top_k=req.top_k, filters=_filters(req.filters)))
+
+@router.post("/ask_batch")
+def ask_batch(req: AskBatchRequest):
+    with trace("ask_batch") as tr:
+        out = {"results": answer_many(req.queries, top_k=req.top_k, filters=_filters(req.filters))}
+    if req.timings:
+        out["timings"] = tr.timings()
+    return out
+
+@router.get("/cache_stats")
+def cache_stats():
+    # Contadores de las cachés de respuestas ("rag" para /ask, "agent" para /agent_ask)
+    # y del reordenado con cross-encoder si está activo
+    get_answer_cache()
+    out = {name: cache.stats() for name, cache in CACHES.items()}
+    reranker = get_reranker()
+    if reranker is not None:
+        out["rerank"] = reranker.stats()
+    return out
@@ -4,9 +4,16 @@ Arranque local: uvicorn src.app.server:app --reload
 """
 
 # src/app/server.py
+from contextlib import asynccontextmanager
+import logging
+import threading
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
+from .config import settings
 from .routes_rag import router as rag_router
+from . import telemetry
+from ..rag import ollama, pipeline
+from ..rag.answer_cache import CACHES
 
 # routes_agent es opcional: si no existe, la API sigue funcionando
 try:
@@ -15,13 +22,44 @@ try:
 except Exception:
     HAS_AGENT = False
 
-app = FastAPI(title="RAG+BI POC", version="1.0.0")
+log = logging.getLogger(__name__)
+
+def _warmup() -> None:
+    try:
+        pipeline.warmup()
+    except Exception:
+        log.exception("Warmup fallido: el modelo/índice se cargará en la primera petición")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warmup en segundo plano: la API responde /health (ready=false) mientras carga
+    if settings.warmup_on_startup:
+        threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    yield
+    # cierra los clientes HTTP compartidos con Ollama (pool de conexiones)
+    await ollama.aclose()
+
+app = FastAPI(title="RAG+BI POC", version="1.0.0", lifespan=lifespan)
 
 # registra rutas
 app.include_router(rag_router, prefix="")
 if HAS_AGENT:
     app.include_router(agent_router, prefix="")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Formato de exposición Prometheus: histogramas por etapa/endpoint y contadores de cachés
+    samples = [({"cache": name, "result": r}, st[r]) for name, cache in CACHES.items()
+               for st in [cache.stats()] for r in ("hits", "semantic_hits", "misses")]
+    extra = telemetry.render_samples("app_answer_cache_lookups_total", "Consultas a las cachés de respuestas",
+                                     "counter", samples)
+    reranker = pipeline.get_reranker()
+    if reranker is not None:
+        st = reranker.stats()
+        extra += telemetry.render_samples("app_rerank_total", "Reordenados con cross-encoder", "counter",
+                                          [({"result": "reranked"}, st["reranked"]), ({"result": "degraded"}, st["degraded"])])
+    return PlainTextResponse(telemetry.render(extra), media_type=telemetry.CONTENT_TYPE)
+
 # raíz → docs
 @app.get("/")
 def root():
@@ -0,0 +1,20 @@
+"""
+Respuestas en streaming (Server-Sent Events) para /ask_stream y /agent_ask_stream.
+Cada evento del pipeline {"event": nombre, ...} se emite como:
+  event: nombre
+  data: {...json...}
+"""
+
+from typing import AsyncIterator, Dict
+import json
+from fastapi.responses import StreamingResponse
+
+def sse_response(events: AsyncIterator[Dict]) -> StreamingResponse:
+    async def body():
+        async for ev in events:
+            name = ev.get("event", "message")
+            data = {k: v for k, v in ev.items() if k != "event"}
+            yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    # Sin caché ni buffering en proxies: el cliente ve cada token en cuanto se genera
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,219 @@
+"""
+Instrumentación ligera y sin dependencias: spans por etapa, métricas Prometheus y
+perfilado por muestreo de peticiones lentas.
+
+- span("search.dense", backend="faiss"): cronometra un bloque. Alimenta el histograma
+  app_stage_seconds{stage, <etiquetas>} y, si hay una traza activa, suma su duración a la
+  etapa correspondiente de la petición (tiempo acumulado: ramas paralelas se suman).
+- trace("ask"): abre la traza de una petición (contextvar). Sus tiempos por etapa forman el
+  bloque opcional "timings" de la respuesta y el total va a app_request_seconds{endpoint}.
+  asyncio.to_thread propaga la traza; para un ThreadPoolExecutor hay que enviar la tarea con
+  contextvars.copy_context().run (lo hace el orquestador). run_traced(fn, ...) marca además
+  el hilo como trabajador de la petición mientras ejecuta fn (lo usa el perfilador).
+- render(): texto de exposición de Prometheus para /metrics.
+- PROFILE_SLOW_MS > 0: una fracción PROFILE_SAMPLE_RATE de las peticiones se muestrea cada
+  PROFILE_INTERVAL_MS desde un hilo aparte (sys._current_frames del hilo de la petición y de
+  los hilos que trabajan para ella vía run_traced; no los que atienden otras peticiones).
+  Si la petición supera el umbral, las pilas agregadas se guardan en
+  processed_dir/profiles en formato "collapsed" (flamegraph.pl, speedscope).
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return f"{{{body}}}" if body else ""
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[Tuple, list] = {}  # etiquetas -> [cuentas por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                s[0][i] += 1
+            s[1] += seconds
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(c), total, n) for k, (c, total, n) in self._series.items())
+        for key, counts, total, n in series:
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', repr(le)),))} {acc}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {n}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {n}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+STAGES = Histogram("app_stage_seconds", "Duración de cada etapa (encode, búsqueda, prompt, generación, BI...)")
+REQUESTS = Histogram("app_request_seconds", "Duración total de las peticiones por endpoint")
+
+def render_samples(name: str, help: str, kind: str, samples: List[Tuple[Dict, float]]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(sorted((k, str(v)) for k, v in labels.items()))} {value}" for labels, value in samples]
+    return lines
+
+def render(extra: Optional[List[str]] = None) -> str:
+    return "\n".join(STAGES.render() + REQUESTS.render() + (extra or [])) + "\n"
+
+# ---------- Trazas por petición ----------
+class Trace:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.threads: Counter = Counter()  # hilos ejecutando trabajo de esta petición
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def enter(self, thread_id: int) -> None:
+        with self._lock:
+            self.threads[thread_id] += 1
+
+    def leave(self, thread_id: int) -> None:
+        with self._lock:
+            self.threads[thread_id] -= 1
+            if self.threads[thread_id] <= 0:
+                del self.threads[thread_id]
+
+    def worker_threads(self) -> set:
+        with self._lock:
+            return set(self.threads)
+
+    def timings(self) -> Dict:
+        with self._lock:
+            stages = {k: round(v, 3) for k, v in self.stages.items()}
+        return {"total_ms": round((time.perf_counter() - self.t0) * 1000, 3), "stages": stages}
+
+_CURRENT: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+def current() -> Optional[Trace]:
+    return _CURRENT.get()
+
+def run_traced(fn, *args, **kwargs):
+    """Ejecuta fn registrando el hilo actual en la traza activa (para enviar a un pool con su contexto)."""
+    tr = _CURRENT.get()
+    if tr is None:
+        return fn(*args, **kwargs)
+    tid = threading.get_ident()
+    tr.enter(tid)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        tr.leave(tid)
+
+@contextmanager
+def span(stage: str, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        if settings.metrics_enabled:
+            STAGES.observe(dt, stage=stage, **labels)
+        tr = _CURRENT.get()
+        if tr is not None:
+            tr.add(stage, dt)
+
+@contextmanager
+def trace(endpoint: str):
+    tr = Trace(endpoint)
+    token = _CURRENT.set(tr)
+    sampler = _maybe_profile(tr)
+    try:
+        yield tr
+    finally:
+        _CURRENT.reset(token)
+        dt = time.perf_counter() - tr.t0
+        if settings.metrics_enabled:
+            REQUESTS.observe(dt, endpoint=endpoint)
+        if sampler is not None:
+            sampler.finish(endpoint, dt)
+
+# ---------- Perfilado por muestreo ----------
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+def _collapse(frame) -> Optional[str]:
+    if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+        return None  # hilo esperando (pool ocioso, result() de un future): no es trabajo
+    stack = []
+    while frame is not None:
+        stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+class SlowRequestSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float, trace: Optional[Trace] = None):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.trace = trace
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            wanted = {self.thread_id} | (self.trace.worker_threads() if self.trace is not None else set())
+            for tid, frame in sys._current_frames().items():
+                if tid in wanted:
+                    stack = _collapse(frame)
+                    if stack:
+                        self.stacks[stack] += 1
+
+    def finish(self, endpoint: str, seconds: float) -> Optional[str]:
+        self._done.set()
+        self.join()
+        if seconds * 1000 < settings.profile_slow_ms or not self.stacks:
+            return None
+        out = settings.processed_dir / "profiles"
+        out.mkdir(parents=True, exist_ok=True)
+        path = out / f"{time.strftime('%Y%m%d-%H%M%S')}_{endpoint}_{int(seconds * 1000)}ms.collapsed"
+        path.write_text("".join(f"{s} {n}\n" for s, n in self.stacks.most_common()), encoding="utf-8")
+        log.warning("Petición lenta %s: %.0f ms, perfil en %s", endpoint, seconds * 1000, path)
+        return str(path)
+
+def _maybe_profile(tr: Optional[Trace] = None) -> Optional[SlowRequestSampler]:
+    if settings.profile_slow_ms <= 0 or random.random() >= settings.profile_sample_rate:
+        return None
+    sampler = SlowRequestSampler(threading.get_ident(), max(settings.profile_interval_ms, 1) / 1000, tr)
+    sampler.start()
+    return sampler
@@ -0,0 +1,154 @@
+"""
+Informe recall vs. latencia de los índices aproximados frente al índice Flat exacto.
+
+Uso:
+  python -m src.bench.ann                         # vectores sintéticos (sin modelo)
+  python -m src.bench.ann --source chunks         # embeddings de data/processed/chunks.parquet
+  python -m src.bench.ann --n 200000 --json out.json
+  python -m src.bench.ann --suite precision       # solo fp32 vs fp16 / sq8 / pq (+ rerank)
+
+Suite "ann": para cada tipo de índice (HNSW, IVF-Flat, IVF-PQ) y cada valor del parámetro
+de búsqueda (efSearch / nprobe) mide recall@k, latencia por consulta (p50/p95), tiempo de
+construcción y tamaño serializado del índice.
+Suite "precision": Flat/HNSW con vectores fp16, sq8 y pq, con y sin reordenado exacto en
+float32 (rerank_mb: vectores float32 que ese modo guarda en disco, leídos con mmap).
+"""
+
+from typing import Dict, List, Optional
+from dataclasses import replace
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+
+from ..rag.vectorstore import IndexConfig, make_index, rerank_exact, search_params
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    # Vectores agrupados (más realistas que ruido uniforme) y normalizados como los embeddings
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+def chunk_vectors(limit: Optional[int] = None) -> np.ndarray:
+    import pandas as pd
+    from ..app.config import settings
+    from ..rag.embeddings import Embeddings
+    texts = pd.read_parquet(settings.processed_dir / "chunks.parquet", columns=["text"])["text"].tolist()
+    emb = Embeddings(settings.embeddings_model, cache_dir=settings.processed_dir / "emb_cache",
+                     cache_max_entries=settings.emb_cache_max_entries)
+    vecs = emb.encode(texts[:limit] if limit else texts)
+    emb.flush()
+    return vecs
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(t.tolist()) & set(f[f >= 0].tolist())) for t, f in zip(truth, found))
+    return hits / float(truth.shape[0] * k)
+
+def _searcher(index, base: np.ndarray, k: int, params, rerank: int):
+    # Búsqueda tal como la hace FaissStore: con rerank, top_k*rerank candidatos reordenados en float32
+    def search(queries: np.ndarray) -> np.ndarray:
+        if rerank <= 0:
+            return index.search(queries, k, params=params)[1]
+        _, cand = index.search(queries, k * rerank, params=params)
+        return rerank_exact(queries, cand, lambda ids: base[ids])[1][:, :k]
+    return search
+
+def _latencies(search, queries: np.ndarray) -> np.ndarray:
+    out = np.empty(len(queries))
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        search(queries[i:i + 1])
+        out[i] = (time.perf_counter() - t0) * 1000
+    return out
+
+def evaluate(config: IndexConfig, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+             sweep: List[int]) -> List[Dict]:
+    ids = np.arange(len(base), dtype="int64")
+    t0 = time.perf_counter()
+    train = base[:config.train_size] if config.needs_training else None
+    index = make_index(config, base.shape[1], train)
+    index.add_with_ids(base, ids)
+    build_s = time.perf_counter() - t0
+    size_mb = len(faiss.serialize_index(index)) / 2**20
+
+    rows = []
+    for value in sweep or [0]:
+        cfg = replace(config, nprobe=value or config.nprobe, ef_search=value or config.ef_search)
+        params = search_params(cfg, config.kind)
+        search = _searcher(index, base, k, params, config.rerank)
+        found = search(queries)
+        lat = _latencies(search, queries)
+        rows.append({
+            "index": config.kind,
+            "precision": "pq" if config.kind == "ivf_pq" else config.precision,
+            "rerank": config.rerank,
+            "param": ("nprobe" if config.kind.startswith("ivf") else "efSearch" if config.kind == "hnsw" else None),
+            "value": value or None,
+            f"recall@{k}": round(recall_at_k(truth, found), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "build_s": round(build_s, 2),
+            "size_mb": round(size_mb, 1),
+            "rerank_mb": round(base.nbytes / 2**20, 1) if config.rerank > 0 else 0.0,
+        })
+    return rows
+
+def run_report(base: np.ndarray, n_queries: int = 200, k: int = 10, base_config: Optional[IndexConfig] = None,
+               suite: str = "all") -> List[Dict]:
+    cfg = replace(base_config or IndexConfig(), precision="fp32", rerank=0)
+    rng = np.random.default_rng(1)
+    queries = base[rng.choice(len(base), min(n_queries, len(base)), replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    flat = make_index(replace(cfg, kind="flat"), base.shape[1])
+    flat.add_with_ids(base, np.arange(len(base), dtype="int64"))
+    _, truth = flat.search(queries, k)
+
+    rows = evaluate(replace(cfg, kind="flat"), base, queries, truth, k, [])
+    if suite in ("all", "ann"):
+        rows += evaluate(replace(cfg, kind="hnsw"), base, queries, truth, k, [16, 32, 64, 128, 256])
+        rows += evaluate(replace(cfg, kind="ivf_flat"), base, queries, truth, k, [1, 4, 16, 64])
+        rows += evaluate(replace(cfg, kind="ivf_pq"), base, queries, truth, k, [1, 4, 16, 64])
+    if suite in ("all", "precision"):
+        for precision in ("fp16", "sq8", "pq"):
+            for rerank in (0, 4):
+                if precision == "fp16" and rerank:
+                    continue  # fp16 apenas pierde recall: el reordenado no aporta
+                rows += evaluate(replace(cfg, kind="flat", precision=precision, rerank=rerank), base, queries, truth, k, [])
+        for precision, rerank in (("fp16", 0), ("sq8", 0), ("sq8", 4)):
+            rows += evaluate(replace(cfg, kind="hnsw", precision=precision, rerank=rerank), base, queries, truth, k, [cfg.ef_search])
+    return rows
+
+def print_table(rows: List[Dict]) -> None:
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Recall vs. latencia de índices FAISS aproximados")
+    ap.add_argument("--source", choices=["synthetic", "chunks"], default="synthetic")
+    ap.add_argument("--n", type=int, default=50_000, help="vectores (sintéticos o máximo de chunks)")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--suite", choices=["all", "ann", "precision"], default="all")
+    ap.add_argument("--json", type=str, default=None, help="guarda las filas en un fichero JSON")
+    args = ap.parse_args(argv)
+
+    base = synthetic_vectors(args.n, args.dim) if args.source == "synthetic" else chunk_vectors(args.n)
+    rows = run_report(base, n_queries=args.queries, k=args.k, base_config=IndexConfig.from_settings(), suite=args.suite)
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"n": len(base), "dim": int(base.shape[1]), "k": args.k, "rows": rows}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
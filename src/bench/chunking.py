@@ -0,0 +1,102 @@
+"""
+Micro-benchmark del chunker: implementación anterior (lista de palabras + join por ventana)
+frente a la actual por offsets (slices del texto original), en modo words y sentences.
+
+Uso:
+  python -m src.bench.chunking                    # documento sintético de 500 páginas
+  python -m src.bench.chunking --pages 2000 --json out.json
+
+Mide tiempo (mejor de --repeat ejecuciones) y memoria pico de Python (tracemalloc, en una
+ejecución aparte para no contaminar el tiempo).
+"""
+
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import re
+import time
+import tracemalloc
+import numpy as np
+
+from ..app.config import settings
+from ..rag.chunk import chunk_text, clean_text
+
+def legacy_chunk_text(text: str, target_tokens: int = 700, overlap_tokens: int = 120, metadata: Dict = None) -> List[Dict]:
+    # Implementación anterior, conservada como referencia
+    words = re.findall(r"\S+", text)
+    if not words:
+        return []
+    chunks = []
+    start = 0
+    chunk_id = 0
+    step = max(target_tokens - overlap_tokens, 1)
+    while start < len(words):
+        end = min(start + target_tokens, len(words))
+        chunks.append({"text": " ".join(words[start:end]), "metadata": {**(metadata or {}), "chunk_id": chunk_id}})
+        chunk_id += 1
+        start += step
+    return chunks
+
+def synthetic_document(pages: int, words_per_page: int = 450, seed: int = 0) -> str:
+    # Frases de 5-25 palabras, párrafos de 3-8 frases y un título por página
+    rng = np.random.default_rng(seed)
+    vocab = [f"palabra{i}" for i in range(5000)] + ["de", "la", "el", "en", "y", "que", "los", "por"]
+    out = []
+    for p in range(pages):
+        out.append(f"Sección {p + 1}\n")
+        n = 0
+        while n < words_per_page:
+            sentences = []
+            for _ in range(int(rng.integers(3, 9))):
+                k = int(rng.integers(5, 26))
+                sentences.append(" ".join(vocab[j] for j in rng.integers(0, len(vocab), k)).capitalize() + ".")
+                n += k
+            out.append(" ".join(sentences) + "\n\n")
+    return clean_text("".join(out))
+
+def _measure(fn: Callable[[], List[Dict]], repeat: int) -> Dict:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = fn()
+        best = min(best, time.perf_counter() - t0)
+    del chunks
+    tracemalloc.start()
+    chunks = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "chunks": len(chunks),
+        "time_ms": round(best * 1000, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "out_mb": round(sum(len(c["text"]) for c in chunks) / 2**20, 1),
+    }
+
+def run_report(text: str, target: int, overlap: int, repeat: int = 3) -> List[Dict]:
+    cases = [
+        ("legacy (join)", lambda: legacy_chunk_text(text, target, overlap)),
+        ("offsets words", lambda: chunk_text(text, target, overlap, mode="words")),
+        ("offsets sentences", lambda: chunk_text(text, target, overlap, mode="sentences")),
+    ]
+    return [{"impl": name, **_measure(fn, repeat)} for name, fn in cases]
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Tiempo y memoria del chunker")
+    ap.add_argument("--pages", type=int, default=500)
+    ap.add_argument("--target", type=int, default=settings.chunk_target_tokens)
+    ap.add_argument("--overlap", type=int, default=settings.chunk_overlap_tokens)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", type=str, default=None, help="guarda las filas en un fichero JSON")
+    args = ap.parse_args(argv)
+
+    text = synthetic_document(args.pages)
+    rows = run_report(text, args.target, args.overlap, args.repeat)
+    print(f"documento: {args.pages} páginas, {len(text) / 2**20:.1f} MB de texto")
+    from .ann import print_table
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"pages": args.pages, "chars": len(text), "rows": rows}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
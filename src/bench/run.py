@@ -0,0 +1,339 @@
+"""
+Benchmark de extremo a extremo sobre un corpus sintético, sin red y en modo stub.
+
+Uso:
+  python -m src.bench.run                                  # 200 documentos, informe en pantalla
+  python -m src.bench.run --docs 2000 --json report.json   # informe JSON (claves ordenadas)
+  python -m src.bench.run --json new.json --compare old.json
+  python -m src.bench.run --embeddings model               # embeddings reales (descarga el modelo)
+
+Mide, en un directorio de trabajo temporal (no toca data/processed):
+- ingesta: documentos/s y chunks/s;
+- embeddings: textos/s (por defecto embeddings deterministas por hashing de términos, que
+  no necesitan modelo; con --embeddings model, el modelo de EMBEDDINGS_MODEL);
+- búsqueda: latencia p50/p95/p99 de la búsqueda densa y de la recuperación completa
+  (encode + híbrida + rerank si está activo), recall@k del índice configurado frente a la
+  búsqueda exacta y hit@k (el documento de origen de la pregunta está entre los k primeros);
+- /ask y /agent_ask por HTTP (TestClient) con --concurrency peticiones simultáneas, con la
+  caché de respuestas desactivada; las preguntas incluyen golden_questions.jsonl;
+- BI: latencia de cada plantilla de sql_exec sobre filas crudas, sobre su rollup y a través de la caché del motor.
+"""
+
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+from ..app.config import settings
+from ..rag.sparse import term_hash, tokenize
+
+class HashEmbeddings:
+    """Embeddings deterministas por hashing de términos con signo: sin modelo ni red."""
+    def __init__(self, dim: int = 384):
+        self._dim = dim
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self._dim), dtype="float32")
+        for i, text in enumerate(texts):
+            terms = tokenize(text)
+            if not terms:
+                continue
+            h = np.fromiter((term_hash(t) for t in terms), dtype="uint64", count=len(terms))
+            np.add.at(out[i], (h % np.uint64(self._dim)).astype("int64"), np.where(h >> np.uint64(63), -1.0, 1.0))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        return self.encode(queries)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return self.encode([query])[0]
+
+    def flush(self) -> None:
+        pass
+
+# ---------- Corpus sintético ----------
+TOPICS = ["devoluciones", "garantía", "envíos", "facturación", "seguridad", "vacaciones", "soporte", "contratos"]
+
+def synthetic_corpus(raw_dir: Path, n_docs: int, words: int, seed: int = 0) -> List[Dict]:
+    """Escribe n_docs documentos .md y devuelve una pregunta por documento (con su fuente)."""
+    rng = np.random.default_rng(seed)
+    common = [f"término{i}" for i in range(3000)] + ["de", "la", "el", "en", "y", "que", "los", "por", "para"]
+    questions = []
+    for i in range(n_docs):
+        topic = TOPICS[i % len(TOPICS)]
+        code = f"POL-{i:05d}"
+        own = [f"{topic}{j}" for j in rng.integers(0, 500, 8)]
+        body = []
+        for _ in range(max(words // 12, 1)):
+            sentence = list(rng.choice(common, 10)) + [own[int(rng.integers(0, len(own)))], topic]
+            body.append(" ".join(sentence).capitalize() + ".")
+        body.insert(int(rng.integers(0, len(body))), f"La política {code} regula {topic} con {own[0]} y {own[1]}.")
+        path = raw_dir / f"doc_{i:05d}.md"
+        path.write_text(f"# Política {code} de {topic}\n\n" + " ".join(body), encoding="utf-8")
+        questions.append({"question": f"¿Qué regula la política {code} sobre {topic}?", "source": str(path)})
+    return questions
+
+BI_QUESTIONS = [
+    "¿Cuál es la facturación total y el beneficio?",
+    "Ventas por región",
+    "Ventas por producto",
+    "Tendencia de ventas por mes",
+    "Tickets y tiempo medio de resolución",
+    "Según el manual, ¿cómo evoluciona la facturación?",
+]
+
+# ---------- Medidas ----------
+def percentiles(ms: List[float]) -> Dict:
+    a = np.asarray(ms, dtype="float64")
+    return {
+        "n": int(len(a)),
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+        "mean_ms": round(float(a.mean()), 3),
+    }
+
+def _timed_ms(fn, *args, **kwargs) -> float:
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - t0) * 1000
+
+def bench_ingest(raw_dir: Path, processed_dir: Path) -> Dict:
+    import pandas as pd
+    from ..rag import ingest
+    n_docs = len(ingest.discover_files(raw_dir))
+    t0 = time.perf_counter()
+    ingest.run_ingest()
+    secs = time.perf_counter() - t0
+    n_chunks = len(pd.read_parquet(processed_dir / "chunks.parquet", columns=["id"]))
+    return {"docs": n_docs, "chunks": n_chunks, "seconds": round(secs, 3),
+            "docs_per_s": round(n_docs / secs, 1), "chunks_per_s": round(n_chunks / secs, 1)}
+
+def bench_embeddings(emb, texts: List[str]) -> Dict:
+    t0 = time.perf_counter()
+    emb.encode(texts)
+    secs = time.perf_counter() - t0
+    return {"texts": len(texts), "seconds": round(secs, 3), "texts_per_s": round(len(texts) / secs, 1)}
+
+def bench_search(emb, questions: List[Dict], texts: List[str], ids: np.ndarray, k: int) -> Dict:
+    from ..rag import pipeline
+    store = pipeline.get_store()
+    queries = [q["question"] for q in questions]
+    qv = emb.encode_queries(queries)
+    dense = [_timed_ms(store.search, qv[i:i + 1], k) for i in range(len(queries))]
+    retrieve = [_timed_ms(pipeline._retrieve, q, k) for q in queries]
+
+    # Recall@k frente a la búsqueda exacta sobre los mismos vectores
+    base = emb.encode(texts)
+    exact = ids[np.argsort(-(qv @ base.T), axis=1)[:, :k]]
+    found = [[m["id"] for _, m in hits] for hits in store.search_many(qv, top_k=k)]
+    recall = np.mean([len(set(e.tolist()) & set(f)) / k for e, f in zip(exact, found)])
+    # hit@k: el documento del que sale la pregunta aparece en la recuperación completa
+    hits = [q["source"] in {p["source"] for p in pipeline._retrieve(q["question"], k)} for q in questions]
+    return {
+        "k": k,
+        "dense": percentiles(dense),
+        "retrieve": percentiles(retrieve),
+        f"recall@{k}": round(float(recall), 4),
+        f"hit@{k}": round(float(np.mean(hits)), 4),
+        "index": settings.faiss_index if settings.rag_backend.lower() != "qdrant" else "qdrant",
+        "chunks": len(ids),
+    }
+
+def bench_http(client, path: str, queries: List[str], n_requests: int, concurrency: int, top_k: int) -> Dict:
+    def call(q: str):
+        t0 = time.perf_counter()
+        r = client.post(path, json={"query": q, "top_k": top_k})
+        return (time.perf_counter() - t0) * 1000, r.status_code == 200
+    workload = [queries[i % len(queries)] for i in range(n_requests)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, workload))
+    secs = time.perf_counter() - t0
+    ok = [ms for ms, good in results if good]
+    out = {"requests": n_requests, "concurrency": concurrency, "errors": n_requests - len(ok),
+           "rps": round(n_requests / secs, 1)}
+    if ok:
+        out.update(percentiles(ok))
+    return out
+
+def bench_bi(repeat: int) -> Dict:
+    from ..agent import sql_exec
+    from ..bi.engine import get_engine
+    engine = get_engine()
+    out = {}
+    for intent, sql in sql_exec.INTENT_SQL.items():
+        planned = engine.plan(sql_exec.INTENTS[intent])
+        raw = [_timed_ms(lambda: engine.cursor().execute(sql).fetchdf()) for _ in range(repeat)]
+        rollup = [_timed_ms(lambda: engine.cursor().execute(planned).fetchdf()) for _ in range(repeat)]
+        cached = [_timed_ms(sql_exec.run, intent) for _ in range(repeat)]
+        out[intent] = {"query": percentiles(raw), "rollup": percentiles(rollup), "cached": percentiles(cached)}
+    return out
+
+# ---------- Informe ----------
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def _configure(workdir: Path, args, emb) -> Callable[[], None]:
+    """Apunta settings y las instancias compartidas al directorio de trabajo; devuelve cómo deshacerlo."""
+    from ..agent import orchestrator
+    from ..bi import engine
+    from ..rag import ingest, pipeline
+    saved_settings = settings.model_dump()
+    saved = [(m, name, getattr(m, name)) for m, name in (
+        (ingest, "Embeddings"), (pipeline, "_EMB"), (pipeline, "_VEC"), (pipeline, "_SPARSE"),
+        (pipeline, "_ANSWERS"), (pipeline, "_RERANKER"), (engine, "_engine"), (orchestrator, "_cache"),
+    )]
+    settings.data_dir = workdir / "data"
+    settings.processed_dir = workdir / "data" / "processed"
+    settings.generator_mode = "stub"
+    settings.answer_cache_size = 0  # latencias reales, no aciertos de caché
+    settings.warmup_on_startup = False
+    if args.faiss_index:
+        settings.faiss_index = args.faiss_index
+    if args.workers is not None:
+        settings.ingest_workers = args.workers
+    ingest.Embeddings = lambda *a, **kw: emb
+    pipeline._EMB = emb
+    pipeline._VEC = pipeline._SPARSE = pipeline._ANSWERS = None
+    engine._engine = orchestrator._cache = None
+
+    def restore() -> None:
+        for k, v in saved_settings.items():
+            setattr(settings, k, v)
+        for m, name, value in saved:
+            setattr(m, name, value)
+    return restore
+
+def run(args) -> Dict:
+    from ..bi.load_data import load_golden
+    from ..rag.embeddings import Embeddings
+    golden = load_golden()
+    real_raw = settings.data_dir / "raw"
+    emb = HashEmbeddings() if args.embeddings == "hash" else Embeddings(settings.embeddings_model)
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    restore = _configure(workdir, args, emb)
+    try:
+        return _run(args, emb, golden, real_raw)
+    finally:
+        restore()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def _run(args, emb, golden: List[Dict], real_raw: Path) -> Dict:
+    import pandas as pd
+    from ..rag import pipeline
+    raw = settings.data_dir / "raw"
+    raw.mkdir(parents=True, exist_ok=True)
+    settings.processed_dir.mkdir(parents=True, exist_ok=True)
+    questions = synthetic_corpus(raw, args.docs, args.words, seed=args.seed)
+    # Los documentos reales (sample.md...) para que las preguntas golden tengan respuesta
+    for f in real_raw.glob("*"):
+        if f.is_file():
+            shutil.copy2(f, raw / f.name)
+
+    rng = np.random.default_rng(args.seed)
+    sample = [questions[i] for i in rng.choice(len(questions), min(args.queries, len(questions)), replace=False)]
+    report: Dict = {"meta": {
+        "git": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": {
+            "docs": args.docs, "words": args.words, "queries": len(sample), "requests": args.requests,
+            "concurrency": args.concurrency, "top_k": args.top_k, "embeddings": args.embeddings,
+            "backend": settings.rag_backend, "faiss_index": settings.faiss_index,
+            "hybrid_search": settings.hybrid_search, "rerank_enabled": settings.rerank_enabled,
+            "chunk_mode": settings.chunk_mode,
+        },
+    }}
+    report["ingest"] = bench_ingest(raw, settings.processed_dir)
+    df = pd.read_parquet(settings.processed_dir / "chunks.parquet", columns=["id", "text"])
+    texts = df["text"].tolist()
+    report["embeddings"] = {"kind": args.embeddings, **bench_embeddings(emb, texts)}
+    pipeline.warmup()
+    report["search"] = bench_search(emb, sample, texts, df["id"].to_numpy(), args.top_k)
+
+    from fastapi.testclient import TestClient
+    from ..app.server import app
+    doc_queries = [g["question"] for g in golden] + [q["question"] for q in sample]
+    with TestClient(app) as client:
+        report["ask"] = bench_http(client, "/ask", doc_queries, args.requests, args.concurrency, args.top_k)
+        report["agent_ask"] = bench_http(client, "/agent_ask", BI_QUESTIONS + doc_queries[:len(BI_QUESTIONS)],
+                                         args.requests, args.concurrency, args.top_k)
+    report["bi"] = bench_bi(args.bi_repeat)
+    # Respuestas golden que contienen el texto esperado (modo stub: extractivo)
+    found = [g["expected_contains"].lower() in pipeline.answer(g["question"], top_k=args.top_k)["answer"].lower()
+             for g in golden if g.get("expected_contains")]
+    report["golden"] = {"questions": len(found), "contains_expected": int(sum(found))}
+    return report
+
+def flatten(report: Dict, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for k, v in report.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+def compare(old: Dict, new: Dict) -> List[Dict]:
+    """Métricas numéricas comunes a dos informes, con su variación relativa."""
+    a, b = flatten({k: v for k, v in old.items() if k != "meta"}), flatten({k: v for k, v in new.items() if k != "meta"})
+    rows = []
+    for key in sorted(set(a) & set(b)):
+        change = (b[key] - a[key]) / a[key] * 100 if a[key] else None
+        rows.append({"metric": key, "old": a[key], "new": b[key],
+                     "change_%": round(change, 1) if change is not None else None})
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Benchmark offline de ingesta, búsqueda, API y BI")
+    ap.add_argument("--docs", type=int, default=200, help="documentos sintéticos")
+    ap.add_argument("--words", type=int, default=800, help="palabras por documento")
+    ap.add_argument("--queries", type=int, default=100, help="preguntas para búsqueda y /ask")
+    ap.add_argument("--requests", type=int, default=200, help="peticiones por endpoint")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("-k", "--top-k", dest="top_k", type=int, default=5)
+    ap.add_argument("--bi-repeat", type=int, default=20)
+    ap.add_argument("--embeddings", choices=["hash", "model"], default="hash")
+    ap.add_argument("--faiss-index", default=None, help="flat|hnsw|ivf_flat|ivf_pq (por defecto FAISS_INDEX)")
+    ap.add_argument("--workers", type=int, default=None, help="procesos de ingesta (por defecto INGEST_WORKERS)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", default=None, help="directorio de trabajo (por defecto uno temporal)")
+    ap.add_argument("--keep", action="store_true", help="no borra el directorio de trabajo")
+    ap.add_argument("--json", default=None, help="guarda el informe en un fichero JSON")
+    ap.add_argument("--compare", default=None, help="informe JSON anterior con el que comparar")
+    args = ap.parse_args(argv)
+
+    report = run(args)
+    from .ann import print_table
+    print_table([{"metric": k, "value": v} for k, v in flatten({k: v for k, v in report.items() if k != "meta"}).items()])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, sort_keys=True, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print()
+            print_table(compare(json.load(f), report))
+
+if __name__ == "__main__":
+    main()
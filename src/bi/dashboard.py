@@ -1,29 +1,36 @@
 """
 Dashboard Streamlit:
-- KPIs y gráficos de ventas y soporte (DuckDB para consultas simples).
+- KPIs y gráficos de ventas y soporte, resueltos por el motor BI sobre rollups pre-agregados.
 - Pestaña RAG con formulario que llama a la API FastAPI local o al pipeline directo.
 - Muestra pasajes recuperados y tiempos aproximados.
 
+Capa de datos compartida por todas las sesiones del proceso: un único motor BI
+(st.cache_resource: una conexión DuckDB sobre los Parquet, rollups y caché de resultados por
+SQL + versión de datos, sin copiar ni hashear DataFrames en cada rerun). Los gráficos reciben
+tablas Arrow inmutables y el pipeline RAG solo se importa si se usa la llamada local.
+
 Ejecución: streamlit run src/bi/dashboard.py
 """
 
 import streamlit as st
-import duckdb
 import pandas as pd
 import time
 import requests
 from src.app.config import settings
-from src.rag.pipeline import answer as local_answer
-from src.bi.load_data import load_all
+from src.bi.engine import AnalyticsEngine, get_engine
+from src.bi.rollups import Aggregate
 
 
 st.set_page_config(page_title="RAG + BI POC", layout="wide")
 
-@st.cache_data
-def get_data():
-    return load_all()
+@st.cache_resource
+def bi_engine() -> AnalyticsEngine:
+    return get_engine()
+
+engine = bi_engine()
 
-sales, support = get_data()
+def fmt_int(v) -> str:
+    return f"{int(v):,}".replace(",", ".")
 
 # --------- Layout ----------
 st.title("POC: RAG + Business Intelligence (100% local y gratuito)")
@@ -33,67 +40,58 @@ tabs = st.tabs(["Ventas", "Soporte", "RAG", "Agente"])
 # ---- Ventas ----
 with tabs[0]:
     st.header("Indicadores de Ventas")
-    con = duckdb.connect(database=":memory:")
-    con.register("sales", sales)
-
-    kpis = con.execute("""
-        SELECT
-          SUM(sales) AS total_sales,
-          SUM(cost)  AS total_cost,
-          SUM(sales - cost) AS total_profit
-        FROM sales
-    """).fetchdf()
+    _, rows = engine.aggregate(Aggregate("sales", select=(
+        ("total_sales", "{sales}"), ("total_cost", "{cost}"), ("total_profit", "{sales} - {cost}"),
+    )))
+    kpis = rows[0]
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("Ventas totales", f"{int(kpis['total_sales'][0]):,}".replace(",", "."))
-    col2.metric("Coste total", f"{int(kpis['total_cost'][0]):,}".replace(",", "."))
-    col3.metric("Beneficio total", f"{int(kpis['total_profit'][0]):,}".replace(",", "."))
+    col1.metric("Ventas totales", fmt_int(kpis["total_sales"]))
+    col2.metric("Coste total", fmt_int(kpis["total_cost"]))
+    col3.metric("Beneficio total", fmt_int(kpis["total_profit"]))
 
-    mtrend = con.execute("""
-        SELECT date_trunc('month', date) AS month,
-               SUM(sales) AS sales_m
-        FROM sales
-        GROUP BY 1 ORDER BY 1
-    """).fetchdf()
+    mtrend = engine.aggregate_arrow(Aggregate("sales", ("month",), (("sales_m", "{sales}"),), order_by="1"))
 
     st.subheader("Serie temporal de ventas")
-    st.line_chart(mtrend.set_index("month"))
+    st.line_chart(mtrend, x="month", y="sales_m")
 
     st.subheader("Ventas por región y producto")
-    by_cat = con.execute("""
-        SELECT region, product, SUM(sales) AS s
-        FROM sales
-        GROUP BY 1,2
-        ORDER BY 1,2
-    """).fetchdf()
+    by_cat = engine.aggregate_arrow(Aggregate("sales", ("region", "product"), (("s", "{sales}"),), order_by="1, 2"))
     st.dataframe(by_cat, use_container_width=True)
 
 # ---- Soporte ----
 with tabs[1]:
     st.header("Indicadores de Soporte")
-    con = duckdb.connect(database=":memory:")
-    con.register("support", support)
-
-    agg = con.execute("""
-        SELECT
-          COUNT(*) AS tickets,
-          AVG(resolution_hours) AS avg_hours
-        FROM support
-    """).fetchdf()
+    _, rows = engine.aggregate(Aggregate("support", select=(
+        ("tickets", "{tickets}"), ("avg_hours", "{resolution_hours} / NULLIF({resolved}, 0)"),
+    )))
+    agg = rows[0]
 
     c1, c2 = st.columns(2)
-    c1.metric("Tickets", int(agg["tickets"][0]))
-    c2.metric("Resolución media (h)", f"{agg['avg_hours'][0]:.1f}")
+    c1.metric("Tickets", int(agg["tickets"]))
+    c2.metric("Resolución media (h)", f"{agg['avg_hours']:.1f}")
 
     st.subheader("Tickets por prioridad")
-    pr = con.execute("""
-        SELECT priority, COUNT(*) AS n
-        FROM support GROUP BY 1 ORDER BY 1
-    """).fetchdf()
-    st.bar_chart(pr.set_index("priority"))
+    pr = engine.aggregate_arrow(Aggregate("support", ("priority",), (("n", "{tickets}"),), order_by="1"))
+    st.bar_chart(pr, x="priority", y="n")
+
+    st.subheader("Tiempo medio de resolución (media móvil de 7 días)")
+    # Ventana de 7 días naturales (no de 7 filas: hay días sin tickets) y ponderada por
+    # tickets resueltos: suma de horas / recuento no nulo en la ventana
+    daily = engine.plan(Aggregate("support", ("day",), (("hours", "{resolution_hours}"), ("n", "{resolved}"))))
+    rolling = engine.query_arrow(
+        "SELECT day, SUM(hours) OVER w / NULLIF(SUM(n) OVER w, 0) AS avg_hours FROM (" + daily + ") "
+        "WINDOW w AS (ORDER BY day RANGE BETWEEN INTERVAL 6 DAY PRECEDING AND CURRENT ROW) "
+        "QUALIFY day >= MIN(day) OVER () + INTERVAL 6 DAY ORDER BY day"
+    )
+    st.line_chart(rolling, x="day", y="avg_hours")
 
     st.subheader("Distribución de tiempos de resolución")
-    st.line_chart(support[["resolved_at", "resolution_hours"]].set_index("resolved_at").rolling(7).mean().dropna())
+    dist = engine.query_arrow(
+        "SELECT resolved_at, AVG(resolution_hours) OVER (ORDER BY resolved_at ROWS 6 PRECEDING) AS resolution_hours "
+        "FROM support QUALIFY ROW_NUMBER() OVER (ORDER BY resolved_at) >= 7 ORDER BY resolved_at"
+    )
+    st.line_chart(dist, x="resolved_at", y="resolution_hours")
 
 # ---- RAG ----
 with tabs[2]:
@@ -113,6 +111,8 @@ with tabs[2]:
                 st.error(f"No se pudo contactar con la API: {e}")
                 st.stop()
         else:
+            # Import perezoso: el modelo de embeddings solo se carga (una vez por proceso) si se usa
+            from src.rag.pipeline import answer as local_answer
             out = local_answer(q, top_k=top_k)
         t1 = time.time()
 
@@ -151,6 +151,15 @@ with tabs[3]:
         st.subheader("Respuesta combinada")
         st.write(data.get("answer", ""))
         st.caption(f"Modo: {data.get('mode','?')} | Tiempo: {(t1 - t0)*1000:.0f} ms")
+        tm = data.get("timings") or {}
+        if tm:
+            fmt = lambda v: "—" if v is None else f"{v:.0f} ms"
+            st.caption(f"BI: {fmt(tm.get('bi_ms'))} | RAG: {fmt(tm.get('rag_ms'))} (ramas en paralelo)")
+        timed_out, errors = data.get("timed_out") or [], data.get("errors") or {}
+        if data.get("partial") or timed_out or errors:
+            reasons = [f"{b}: sin respuesta a tiempo" for b in timed_out]
+            reasons += [f"{b}: {err}" for b, err in errors.items()]
+            st.warning(f"Respuesta parcial. {'; '.join(reasons) or '—'}")
 
         # Tabla BI si existe
         bi = data.get("bi")
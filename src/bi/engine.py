@@ -0,0 +1,217 @@
+"""
+Motor analítico BI de larga vida (DuckDB) para el agente y el dashboard:
+- Cada CSV fuente se convierte una sola vez a Parquet particionado por mes
+  (processed_dir/bi/<tabla>/period=YYYY-MM/) con tipos explícitos y compactos, ordenado por
+  fecha, y solo se regenera cuando el CSV cambia (tamaño o mtime). Una fuente también puede
+  ser directamente un dataset Parquet con esa estructura (p. ej. load_data.write_fixture).
+- Una base DuckDB en memoria por proceso con vistas sobre los Parquet; cada hilo usa
+  su propio cursor (las conexiones DuckDB no se comparten entre hilos). load() lee filas
+  tipadas con Arrow, podando columnas y meses.
+- Caché de resultados por SQL (filas o tablas Arrow), invalidada automáticamente cuando
+  cambia la versión de los datos fuente.
+- Rollups pre-agregados (rollups.py) mantenidos al refrescar cada fuente; aggregate()
+  enruta los agregados del agente y del dashboard al rollup más pequeño que los responde.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import shutil
+import threading
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from ..app.config import settings
+from ..app.telemetry import span
+from . import load_data
+from .rollups import Aggregate, RollupManager, raw_sql
+
+# Tipos explícitos: evita la inferencia por muestreo en ficheros grandes
+SCHEMAS = {
+    "sales": {"date": "TIMESTAMP", "region": "VARCHAR", "product": "VARCHAR", "sales": "INTEGER", "cost": "INTEGER"},
+    "support": {"created_at": "TIMESTAMP", "resolved_at": "TIMESTAMP", "priority": "VARCHAR", "resolution_hours": "DOUBLE"},
+}
+# Columna temporal que define la partición mensual (period=YYYY-MM)
+PARTITION_BY = {"sales": "date", "support": "created_at"}
+# Dimensiones de baja cardinalidad: diccionario en Parquet, categóricas en pandas
+CATEGORIES = {"sales": ["region", "product"], "support": ["priority"]}
+
+class AnalyticsEngine:
+    def __init__(self, sources: Dict[str, Path], parquet_dir: Path, cache_size: int = 256):
+        self.sources = sources
+        self.parquet_dir = parquet_dir
+        self.parquet_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size
+        self._con = duckdb.connect(database=":memory:")
+        self._con.execute("SET enable_progress_bar = false")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        self._cache: "OrderedDict[str, Tuple[Tuple, List[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rollups = RollupManager(self._con, parquet_dir / "rollups")
+        self.refresh()
+
+    # ---------- Datos fuente ----------
+    def dataset_path(self, table: str) -> Path:
+        """Directorio del Parquet particionado de la tabla (la propia fuente si ya lo es)."""
+        source = self.sources[table]
+        return source if source.is_dir() else self.parquet_dir / table
+
+    @staticmethod
+    def _signature(path: Path) -> Tuple[int, int]:
+        if path.is_dir():
+            stats = [p.stat() for p in path.rglob("*.parquet")]
+            return (sum(st.st_size for st in stats), max((st.st_mtime_ns for st in stats), default=0))
+        st = path.stat()
+        return (st.st_size, st.st_mtime_ns)
+
+    def version(self) -> Tuple:
+        """Versión de los datos BI: cambia cuando cambia cualquier fichero fuente."""
+        return tuple(sorted((t, self._signature(p)) for t, p in self.sources.items()))
+
+    def refresh(self) -> None:
+        """Regenera los Parquet cuyo CSV ha cambiado. Coste: un stat por fuente si nada cambió."""
+        with self._lock:
+            for table, source in self.sources.items():
+                sig = self._signature(source)
+                if self._signatures.get(table) == sig:
+                    continue
+                data = self.dataset_path(table)
+                if not source.is_dir():
+                    stamp = self.parquet_dir / f"{table}.sig"
+                    if not (data.exists() and stamp.exists() and stamp.read_text() == f"{sig[0]}:{sig[1]}"):
+                        with span("bi.convert", table=table):
+                            self._convert(table, source, data)
+                        stamp.write_text(f"{sig[0]}:{sig[1]}")
+                self._con.execute(
+                    f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM "
+                    f"read_parquet('{data.as_posix()}/**/*.parquet', hive_partitioning=true)"
+                )
+                with span("bi.rollups", table=table):
+                    self.rollups.refresh(table, source, sig, lambda path, t=table: _read_csv_sql(t, path))
+                self._signatures[table] = sig
+
+    def _convert(self, table: str, csv: Path, dest: Path) -> None:
+        # CSV -> Parquet particionado en streaming dentro de DuckDB (sin pasar por pandas). Ordenar
+        # por fecha deja min/max útiles por row group; el directorio se sustituye de una vez
+        col = PARTITION_BY[table]
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        old = dest.with_name(f"{dest.name}.{os.getpid()}.old")
+        shutil.rmtree(tmp, ignore_errors=True)
+        self._con.execute(
+            f"COPY (SELECT *, strftime({col}, '%Y-%m') AS period FROM ({_read_csv_sql(table, csv)}) ORDER BY {col}) "
+            f"TO '{tmp.as_posix()}' (FORMAT PARQUET, PARTITION_BY (period))"
+        )
+        if dest.exists():
+            dest.rename(old)
+        tmp.rename(dest)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def load(self, table: str, columns: Optional[Sequence[str]] = None, start=None, end=None) -> pd.DataFrame:
+        """
+        Filas tipadas de la tabla leídas con Arrow: solo las columnas pedidas y, con start/end
+        (inclusivos, sobre la columna de partición), solo los meses de ese rango.
+        """
+        with span("bi.refresh"):
+            self.refresh()
+        col = PARTITION_BY[table]
+        fmt = ds.ParquetFileFormat(read_options={"dictionary_columns": CATEGORIES[table]})
+        dataset = ds.dataset(self.dataset_path(table), format=fmt, partitioning="hive")
+        conds = []
+        if start is not None:
+            start = pd.Timestamp(start)
+            conds += [ds.field("period") >= f"{start:%Y-%m}", ds.field(col) >= start.to_pydatetime()]
+        if end is not None:
+            end = pd.Timestamp(end)
+            conds += [ds.field("period") <= f"{end:%Y-%m}", ds.field(col) <= end.to_pydatetime()]
+        cond = None
+        for c in conds:
+            cond = c if cond is None else cond & c
+        with span("bi.load", table=table):
+            return dataset.to_table(columns=list(columns or SCHEMAS[table]), filter=cond).to_pandas()
+
+    # ---------- Consultas ----------
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        cur = getattr(self._local, "cursor", None)
+        if cur is None:
+            cur = self._con.cursor()
+            self._local.cursor = cur
+        return cur
+
+    def query_df(self, sql: str, params: Optional[list] = None) -> pd.DataFrame:
+        with span("bi.refresh"):
+            self.refresh()
+        with span("bi.execute"):
+            return self.cursor().execute(sql, params or []).fetchdf()
+
+    def query(self, sql: str, params: Optional[list] = None) -> List[Dict]:
+        """Filas como lista de dicts, con caché por (sql, params) y versión de datos."""
+        return list(self._cached(("rows", sql, params),
+                                 lambda: self.cursor().execute(sql, params or []).fetchdf().to_dict(orient="records")))
+
+    def query_arrow(self, sql: str, params: Optional[list] = None) -> pa.Table:
+        """
+        Resultado como tabla Arrow, con la misma caché. Las tablas Arrow son inmutables:
+        se comparten entre hilos/sesiones sin copiarlas y los gráficos las leen directamente.
+        """
+        return self._cached(("arrow", sql, params), lambda: self.cursor().execute(sql, params or []).arrow())
+
+    def _cached(self, key: Tuple, compute):
+        with span("bi.refresh"):
+            self.refresh()
+        key = repr(key)
+        version = self.version()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == version:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+        self.misses += 1
+        with span("bi.execute"):
+            value = compute()
+        with self._lock:
+            self._cache[key] = (version, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    # ---------- Agregados ----------
+    def plan(self, spec: Aggregate) -> str:
+        """SQL con el que se resolverá el agregado (rollup más pequeño posible o tabla base)."""
+        self.refresh()
+        return self.rollups.plan(spec) if settings.bi_rollups else raw_sql(spec)
+
+    def aggregate(self, spec: Aggregate) -> Tuple[str, List[Dict]]:
+        sql = self.plan(spec)
+        return sql, self.query(sql)
+
+    def aggregate_df(self, spec: Aggregate) -> pd.DataFrame:
+        return self.query_df(self.plan(spec))
+
+    def aggregate_arrow(self, spec: Aggregate) -> pa.Table:
+        return self.query_arrow(self.plan(spec))
+
+def _read_csv_sql(table: str, csv: Path) -> str:
+    cols = ", ".join(f"'{c}': '{t}'" for c, t in SCHEMAS[table].items())
+    return f"SELECT * FROM read_csv('{csv.as_posix()}', header=true, columns={{{cols}}})"
+
+_engine: Optional[AnalyticsEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> AnalyticsEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                # Fuentes configuradas (CSV o dataset Parquet) o los datos de ejemplo, que se
+                # generan solo si faltan
+                sales = Path(settings.bi_sales_path) if settings.bi_sales_path else load_data.sales_csv()
+                support = Path(settings.bi_support_path) if settings.bi_support_path else load_data.support_csv()
+                _engine = AnalyticsEngine({"sales": sales, "support": support}, settings.processed_dir / "bi")
+    return _engine
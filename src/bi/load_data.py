@@ -2,14 +2,31 @@
 Generación/carga de datos de ejemplo para BI:
 - sales.csv: 24 meses, 3 regiones, 3 productos, ventas y coste.
 - support_tickets.csv: tickets con prioridad y tiempo de resolución.
+- golden_questions.jsonl: preguntas de referencia (una por línea, JSON) para el benchmark.
 
-Si los ficheros no existen, se crean determinísticamente.
+Si los ficheros no existen, se crean determinísticamente (generadores vectorizados con numpy).
+ensure_sales/ensure_support devuelven el CSV como DataFrame; sales_csv/support_csv, su ruta.
+
+Los CSV son solo la fuente editable: el motor BI los convierte a Parquet particionado por
+mes con tipos compactos, y load_sales/load_support leen de ahí con Arrow (solo las columnas
+pedidas y solo los meses del rango; región, producto y prioridad como categóricas).
+
+write_fixture() escribe directamente un dataset Parquet particionado de N filas (p. ej. 100M
+para pruebas de carga) mes a mes y por bloques, sin pasar por CSV; el motor lo acepta como
+fuente (BI_SALES_PATH / BI_SUPPORT_PATH):
+    python -m src.bi.load_data sales data/processed/fixtures/sales --rows 100000000
 """
 
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import argparse
+import ast
+import json
+import time
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
 from ..app.config import settings
 
 EX_DIR = settings.data_dir / "examples"
@@ -19,40 +36,111 @@ SALES = EX_DIR / "sales.csv"
 SUPPORT = EX_DIR / "support_tickets.csv"
 GOLDEN = EX_DIR / "golden_questions.jsonl"
 
-def ensure_sales():
-    if SALES.exists():
-        return pd.read_csv(SALES, parse_dates=["date"])
-    # 24 meses desde hoy hacia atrás
-    periods = 24
-    base = pd.date_range(end=pd.Timestamp.today().normalize(), periods=periods, freq="MS")
-    regions = ["Norte", "Centro", "Sur"]
-    products = ["Alpha", "Beta", "Gamma"]
-    rows = []
-    rng = np.random.default_rng(42)
-    for d in base:
-        for r in regions:
-            for p in products:
-                sales = max(1000, int(rng.normal(5000, 1200)))
-                cost = int(sales * rng.uniform(0.45, 0.7))
-                rows.append([d, r, p, sales, cost])
-    df = pd.DataFrame(rows, columns=["date", "region", "product", "sales", "cost"])
-    df.to_csv(SALES, index=False)
-    return df
-
-def ensure_support():
-    if SUPPORT.exists():
-        return pd.read_csv(SUPPORT, parse_dates=["created_at", "resolved_at"])
-    n = 600
-    rng = np.random.default_rng(7)
-    start = pd.Timestamp.today().normalize() - pd.offsets.MonthBegin(24)
-    created = [start + pd.Timedelta(days=int(rng.integers(0, 730))) for _ in range(n)]
-    priorities = rng.choice(["low", "medium", "high"], size=n, p=[0.5, 0.35, 0.15])
-    resolve_hours = rng.integers(2, 120, size=n)
-    resolved = [c + pd.Timedelta(hours=int(h)) for c, h in zip(created, resolve_hours)]
-    df = pd.DataFrame({"created_at": created, "resolved_at": resolved, "priority": priorities})
-    df["resolution_hours"] = (df["resolved_at"] - df["created_at"]).dt.total_seconds() / 3600.0
-    df.to_csv(SUPPORT, index=False)
-    return df
+REGIONS = ["Norte", "Centro", "Sur"]
+PRODUCTS = ["Alpha", "Beta", "Gamma"]
+PRIORITIES = ["low", "medium", "high"]
+PRIORITY_P = [0.5, 0.35, 0.15]
+
+def _month_starts(months: int) -> pd.DatetimeIndex:
+    # `months` meses hasta el actual (inclusive)
+    return pd.date_range(end=pd.Timestamp.today().normalize(), periods=months, freq="MS")
+
+def _categorical(codes: np.ndarray, categories: List[str]) -> pa.DictionaryArray:
+    return pa.DictionaryArray.from_arrays(pa.array(codes.astype(np.int8)), pa.array(categories))
+
+def _sales_batch(rng: np.random.Generator, dates: np.ndarray, region: np.ndarray, product: np.ndarray) -> pa.Table:
+    sales = np.maximum(1000, rng.normal(5000, 1200, len(dates))).astype(np.int32)
+    cost = (sales * rng.uniform(0.45, 0.7, len(dates))).astype(np.int32)
+    return pa.table({
+        "date": pa.array(dates.astype("datetime64[us]")),
+        "region": _categorical(region, REGIONS),
+        "product": _categorical(product, PRODUCTS),
+        "sales": sales,
+        "cost": cost,
+    })
+
+def _support_batch(rng: np.random.Generator, created: np.ndarray) -> pa.Table:
+    n = len(created)
+    hours = rng.integers(2, 120, size=n)
+    priority = rng.choice(len(PRIORITIES), size=n, p=PRIORITY_P)
+    created = created.astype("datetime64[us]")
+    return pa.table({
+        "created_at": pa.array(created),
+        "resolved_at": pa.array(created + hours.astype("timedelta64[h]")),
+        "priority": _categorical(priority, PRIORITIES),
+        "resolution_hours": hours.astype(np.float64),
+    })
+
+def sales_table(months: int = 24, seed: int = 42) -> pa.Table:
+    """Una fila por mes × región × producto (el conjunto de ejemplo)."""
+    base = _month_starts(months).values
+    grid = len(REGIONS) * len(PRODUCTS)
+    return _sales_batch(
+        np.random.default_rng(seed),
+        np.repeat(base, grid),
+        np.tile(np.repeat(np.arange(len(REGIONS)), len(PRODUCTS)), months),
+        np.tile(np.arange(len(PRODUCTS)), months * len(REGIONS)),
+    )
+
+def support_table(n: int = 600, days: int = 730, seed: int = 7) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    start = (pd.Timestamp.today().normalize() - pd.offsets.MonthBegin(24)).to_datetime64()
+    return _support_batch(rng, start + rng.integers(0, days, size=n).astype("timedelta64[D]"))
+
+def sales_csv() -> Path:
+    """Ruta del CSV de ventas de ejemplo (se genera si no existe); fuente del motor BI."""
+    if not SALES.exists():
+        sales_table().to_pandas().to_csv(SALES, index=False)
+    return SALES
+
+def support_csv() -> Path:
+    if not SUPPORT.exists():
+        support_table().to_pandas().to_csv(SUPPORT, index=False)
+    return SUPPORT
+
+def ensure_sales() -> pd.DataFrame:
+    return pd.read_csv(sales_csv(), parse_dates=["date"])
+
+def ensure_support() -> pd.DataFrame:
+    return pd.read_csv(support_csv(), parse_dates=["created_at", "resolved_at"])
+
+def write_fixture(table: str, root: Path, rows: int, months: int = 24, seed: int = 0,
+                  batch_rows: int = 5_000_000) -> int:
+    """
+    Dataset Parquet particionado por mes (<root>/period=YYYY-MM/part-NNNNN.parquet) con `rows`
+    filas repartidas entre `months` meses. Genera y escribe por bloques de batch_rows filas:
+    la memoria no depende del tamaño total. Devuelve el número de ficheros escritos.
+    """
+    if table not in ("sales", "support"):
+        raise ValueError(f"Tabla desconocida: {table}")
+    rng = np.random.default_rng(seed)
+    root = Path(root)
+    files = 0
+    for i, month in enumerate(_month_starts(months)):
+        n_month = rows // months + (1 if i < rows % months else 0)
+        days = month.days_in_month
+        out = root / f"period={month:%Y-%m}"
+        out.mkdir(parents=True, exist_ok=True)
+        for k, start in enumerate(range(0, n_month, batch_rows)):
+            n = min(batch_rows, n_month - start)
+            dates = month.to_datetime64() + rng.integers(0, days, size=n).astype("timedelta64[D]")
+            if table == "sales":
+                batch = _sales_batch(rng, dates, rng.integers(0, len(REGIONS), size=n),
+                                     rng.integers(0, len(PRODUCTS), size=n))
+            else:
+                batch = _support_batch(rng, dates)
+            pq.write_table(batch, out / f"part-{k:05d}.parquet")
+            files += 1
+    return files
+
+def load_sales(columns: Optional[Sequence[str]] = None, start=None, end=None) -> pd.DataFrame:
+    """Ventas tipadas desde el Parquet particionado; start/end (inclusivos) podan meses."""
+    from .engine import get_engine
+    return get_engine().load("sales", columns, start, end)
+
+def load_support(columns: Optional[Sequence[str]] = None, start=None, end=None) -> pd.DataFrame:
+    from .engine import get_engine
+    return get_engine().load("support", columns, start, end)
 
 def ensure_golden():
     if GOLDEN.exists():
@@ -63,10 +151,38 @@ def ensure_golden():
     ]
     with open(GOLDEN, "w", encoding="utf-8") as f:
         for it in items:
-            f.write(f'{it}\n')
+            f.write(json.dumps(it, ensure_ascii=False) + "\n")
+
+def load_golden(path: Path = GOLDEN) -> List[Dict]:
+    ensure_golden()
+    items = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            # Versiones anteriores escribían el repr del dict en lugar de JSON
+            items.append(ast.literal_eval(line))
+    return items
 
 def load_all():
-    sales = ensure_sales()
-    support = ensure_support()
+    sales = load_sales()
+    support = load_support()
     ensure_golden()
     return sales, support
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Dataset BI sintético en Parquet particionado por mes")
+    ap.add_argument("table", choices=["sales", "support"])
+    ap.add_argument("out", help="directorio del dataset")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--months", type=int, default=24)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    files = write_fixture(args.table, Path(args.out), args.rows, months=args.months, seed=args.seed)
+    print(f"{args.rows:,} filas en {files} ficheros ({time.perf_counter() - t0:.1f} s) -> {args.out}")
+
+if __name__ == "__main__":
+    main()
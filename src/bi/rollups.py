@@ -0,0 +1,255 @@
+"""
+Rollups BI materializados y enrutado de agregados.
+
+Los KPIs del dashboard y las intenciones del agente son agregados sobre pocas dimensiones:
+en lugar de recorrer las filas crudas en cada petición se mantienen tablas pre-agregadas
+- sales_month_region_product: mes × región × producto (ventas, coste, filas)
+- support_day_priority: día × prioridad (tickets, suma y recuento no nulo de horas de resolución)
+Las medidas son aditivas (SUM/COUNT) y las medias se derivan al consultar (suma / recuento),
+así que un rollup se puede re-agregar a dimensiones más gruesas (día → mes, o un total).
+
+Las consultas se describen con Aggregate (tabla, dimensiones, expresiones sobre medidas y
+orden); RollupManager.plan() las compila contra el rollup más pequeño que puede responderlas
+o, si ninguno sirve, contra la tabla base.
+
+Materialización incremental: si la fuente solo ha crecido (CSV con bytes añadidos al final,
+comprobado con un hash de los últimos bytes ya procesados; o dataset Parquet con ficheros
+nuevos y los anteriores intactos) se agregan únicamente las filas nuevas y se fusionan con el
+rollup existente; en otro caso se reconstruye desde la tabla base. Los rollups se guardan en
+<dir>/<nombre>.parquet con un state.json, y otro proceso los reutiliza sin recalcular
+mientras la fuente no cambie.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import duckdb
+
+# Dimensiones y medidas lógicas por tabla: expresión sobre las filas crudas
+DIMENSIONS = {
+    "sales": {
+        "month": "date_trunc('month', date)", "day": "date_trunc('day', date)",
+        "region": "region", "product": "product",
+    },
+    "support": {
+        "month": "date_trunc('month', created_at)", "day": "date_trunc('day', created_at)",
+        "priority": "priority",
+    },
+}
+# medida -> (agregado sobre filas crudas, tipo con el que se guarda en el rollup)
+MEASURES = {
+    "sales": {"sales": ("SUM(sales)", "BIGINT"), "cost": ("SUM(cost)", "BIGINT"), "n_rows": ("COUNT(*)", "BIGINT")},
+    "support": {"tickets": ("COUNT(*)", "BIGINT"), "resolution_hours": ("SUM(resolution_hours)", "DOUBLE"),
+                "resolved": ("COUNT(resolution_hours)", "BIGINT")},  # no nulos: SUM/resolved == AVG
+}
+# Dimensiones que se pueden derivar de otra más fina presente en el rollup
+DERIVED = {"month": ("day", "date_trunc('month', day)")}
+
+TAIL_BYTES = 64 * 1024
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    table: str
+    dims: Tuple[str, ...]
+    measures: Tuple[str, ...]
+
+ROLLUPS = (
+    Rollup("sales_month_region_product", "sales", ("month", "region", "product"), ("sales", "cost", "n_rows")),
+    Rollup("support_day_priority", "support", ("day", "priority"), ("tickets", "resolution_hours", "resolved")),
+)
+
+@dataclass(frozen=True)
+class Aggregate:
+    """
+    Consulta agregada: select son pares (alias, expresión con {medida}), p. ej. ("profit", "{sales} - {cost}");
+    aliases renombra dimensiones en el resultado, p. ej. (("month", "m"),).
+    """
+    table: str
+    dims: Tuple[str, ...] = ()
+    select: Tuple[Tuple[str, str], ...] = ()
+    order_by: str = ""
+    aliases: Tuple[Tuple[str, str], ...] = ()
+
+    def measures(self) -> set:
+        return {field for _, expr in self.select for _, field, _, _ in Formatter().parse(expr) if field}
+
+def compile_sql(spec: Aggregate, source: str, dims: Dict[str, str], measures: Dict[str, str]) -> str:
+    names = dict(spec.aliases)
+    cols = [dims[d] if dims[d] == names.get(d, d) else f"{dims[d]} AS {names.get(d, d)}" for d in spec.dims]
+    cols += [f"{expr.format(**measures)} AS {alias}" for alias, expr in spec.select]
+    sql = f"SELECT {', '.join(cols)} FROM {source}"
+    if spec.dims:
+        sql += " GROUP BY " + ", ".join(str(i) for i in range(1, len(spec.dims) + 1))
+    if spec.order_by:
+        sql += f" ORDER BY {spec.order_by}"
+    return sql
+
+def raw_sql(spec: Aggregate) -> str:
+    """SQL equivalente sobre la tabla base (filas crudas)."""
+    measures = {m: expr for m, (expr, _) in MEASURES[spec.table].items()}
+    return compile_sql(spec, spec.table, DIMENSIONS[spec.table], measures)
+
+def _dim_expr(rollup: Rollup, dim: str) -> Optional[str]:
+    if dim in rollup.dims:
+        return dim
+    finer = DERIVED.get(dim)
+    if finer is not None and finer[0] in rollup.dims:
+        return finer[1]
+    return None
+
+def can_answer(rollup: Rollup, spec: Aggregate) -> bool:
+    return (rollup.table == spec.table and spec.measures() <= set(rollup.measures)
+            and all(_dim_expr(rollup, d) is not None for d in spec.dims))
+
+def _tail_hash(path: Path, size: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(max(size - TAIL_BYTES, 0))
+        return hashlib.blake2b(f.read(size - max(size - TAIL_BYTES, 0)), digest_size=16).hexdigest()
+
+def _definition(rollups: List[Rollup]) -> List:
+    return [[r.name, list(r.dims), list(r.measures)] for r in rollups]
+
+class RollupManager:
+    def __init__(self, con: duckdb.DuckDBPyConnection, root: Path, rollups: Tuple[Rollup, ...] = ROLLUPS):
+        self.con = con
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.rollups = rollups
+        self.rows: Dict[str, int] = {}  # filas de cada rollup disponible (para elegir el más pequeño)
+        self.rebuilds = 0
+        self.incremental = 0
+        state = self.root / "state.json"
+        self._state: Dict[str, Dict] = json.loads(state.read_text(encoding="utf-8")) if state.exists() else {}
+
+    def path(self, rollup: Rollup) -> Path:
+        return self.root / f"{rollup.name}.parquet"
+
+    # ---------- Materialización ----------
+    def refresh(self, table: str, source: Path, sig: Tuple[int, int], read_csv: Callable[[Path], str]) -> None:
+        """
+        Pone al día los rollups de `table` tras un cambio de su fuente: un CSV (read_csv(path) da
+        el SQL que lo lee) o un dataset Parquet particionado (directorio).
+        """
+        rollups = [r for r in self.rollups if r.table == table]
+        if not rollups:
+            return
+        state = self._state.get(table)
+        if state is not None and state.get("defs") != _definition(rollups):
+            state = None  # cambiaron dimensiones o medidas: los rollups guardados no sirven
+        on_disk = all(self.path(r).exists() for r in rollups)
+        if not (on_disk and state is not None and tuple(state["sig"]) == tuple(sig)):
+            delta = self._delta(source, sig, state, read_csv) if on_disk and state is not None else None
+            if delta is None:
+                for r in rollups:
+                    self._write(r, self._select(r, table))
+                self.rebuilds += 1
+            else:
+                sql, cleanup = delta
+                try:
+                    self._merge(rollups, sql)
+                finally:
+                    cleanup()
+                self.incremental += 1
+            self._state[table] = {**self._fingerprint(source, sig), "defs": _definition(rollups)}
+            self._save_state()
+        for r in rollups:
+            self.con.execute(f"CREATE OR REPLACE VIEW rollup_{r.name} AS SELECT * FROM read_parquet('{self.path(r).as_posix()}')")
+            self.rows[r.name] = self.con.execute(f"SELECT COUNT(*) FROM rollup_{r.name}").fetchone()[0]
+
+    @staticmethod
+    def _fingerprint(source: Path, sig: Tuple[int, int]) -> Dict:
+        if source.is_dir():
+            files = {p.relative_to(source).as_posix(): [p.stat().st_size, p.stat().st_mtime_ns]
+                     for p in source.rglob("*.parquet")}
+            return {"sig": list(sig), "files": files}
+        return {"sig": list(sig), "size": sig[0], "tail": _tail_hash(source, sig[0])}
+
+    def _delta(self, source: Path, sig: Tuple[int, int], state: Dict,
+               read_csv: Callable[[Path], str]) -> Optional[Tuple[str, Callable[[], None]]]:
+        """(SQL con solo las filas nuevas, limpieza) si el cambio es solo-añadido; None si hay que reconstruir."""
+        if source.is_dir():
+            # Dataset particionado: solo-añadido = ficheros nuevos y los ya procesados intactos
+            before = state.get("files")
+            now = self._fingerprint(source, sig)["files"]
+            if before is None or any(now.get(p) != v for p, v in before.items()):
+                return None
+            new = sorted(p for p in now if p not in before)
+            if not new:
+                return None
+            files = ", ".join(f"'{(source / p).as_posix()}'" for p in new)
+            return f"SELECT * FROM read_parquet([{files}], hive_partitioning=true)", lambda: None
+        offset = self._append_offset(source, sig[0], state)
+        if offset is None:
+            return None
+        delta = self._tail_csv(source, offset, sig[0])
+        return read_csv(delta), lambda: delta.unlink(missing_ok=True)
+
+    def _append_offset(self, csv: Path, size: int, state: Dict) -> Optional[int]:
+        # CSV solo-añadido: ha crecido, lo ya procesado no ha cambiado y acababa en fin de línea
+        done = state.get("size")
+        if done is None or size <= done or _tail_hash(csv, done) != state["tail"]:
+            return None
+        with open(csv, "rb") as f:
+            f.seek(done - 1)
+            return done if f.read(1) == b"\n" else None
+
+    def _tail_csv(self, csv: Path, start: int, stop: int) -> Path:
+        # Cabecera + bytes [start, stop) del CSV en un fichero temporal
+        delta = self.root / f"delta.{os.getpid()}.csv"
+        with open(csv, "rb") as src, open(delta, "wb") as out:
+            out.write(src.readline())
+            src.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                block = src.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                out.write(block)
+                remaining -= len(block)
+        return delta
+
+    def _merge(self, rollups: List[Rollup], delta_sql: str) -> None:
+        source = f"({delta_sql})"
+        for r in rollups:
+            merged = ", ".join(f"CAST(SUM({m}) AS {MEASURES[r.table][m][1]}) AS {m}" for m in r.measures)
+            self._write(r, f"SELECT {', '.join(r.dims)}, {merged} FROM ("
+                           f"SELECT * FROM read_parquet('{self.path(r).as_posix()}') "
+                           f"UNION ALL BY NAME {self._select(r, source)}) GROUP BY ALL")
+
+    def _select(self, rollup: Rollup, source: str) -> str:
+        dims = DIMENSIONS[rollup.table]
+        cols = [f"{dims[d]} AS {d}" for d in rollup.dims]
+        cols += [f"CAST({expr} AS {kind}) AS {m}" for m, (expr, kind) in MEASURES[rollup.table].items()
+                 if m in rollup.measures]
+        return f"SELECT {', '.join(cols)} FROM {source} GROUP BY ALL"
+
+    def _write(self, rollup: Rollup, sql: str) -> None:
+        tmp = self.path(rollup).with_suffix(f".{os.getpid()}.tmp")
+        self.con.execute(f"COPY ({sql}) TO '{tmp.as_posix()}' (FORMAT PARQUET)")
+        tmp.replace(self.path(rollup))
+
+    def _save_state(self) -> None:
+        tmp = self.root / f"state.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(self._state), encoding="utf-8")
+        tmp.replace(self.root / "state.json")
+
+    # ---------- Enrutado ----------
+    def choose(self, spec: Aggregate) -> Optional[Rollup]:
+        candidates = [r for r in self.rollups if r.name in self.rows and can_answer(r, spec)]
+        return min(candidates, key=lambda r: self.rows[r.name]) if candidates else None
+
+    def plan(self, spec: Aggregate) -> str:
+        """SQL del agregado contra el rollup más pequeño que lo responde (o la tabla base)."""
+        rollup = self.choose(spec)
+        if rollup is None:
+            return raw_sql(spec)
+        dims = {d: _dim_expr(rollup, d) for d in spec.dims}
+        return compile_sql(spec, f"rollup_{rollup.name}", dims, {m: f"SUM({m})" for m in rollup.measures})
+
+    def stats(self) -> Dict:
+        return {"rows": dict(self.rows), "rebuilds": self.rebuilds, "incremental": self.incremental}
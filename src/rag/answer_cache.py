@@ -0,0 +1,152 @@
+"""
+Caché de respuestas para /ask y /agent_ask.
+- Exacta: clave = texto normalizado (minúsculas, espacios colapsados) + parámetros.
+- Semántica (opcional): si el embedding de la consulta está a similitud coseno >= umbral
+  de una consulta cacheada con los mismos parámetros, se reutiliza su respuesta.
+- Memoria acotada: LRU con max_entries y caducidad por TTL.
+- Invalidación: cada entrada guarda la versión de los datos (índice vectorial, datos BI);
+  si la versión actual difiere, la caché entera se vacía.
+Contadores (aciertos, fallos, expulsiones...) disponibles en stats() y en GET /cache_stats.
+"""
+
+from typing import Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+import numpy as np
+from .emb_cache import normalize_text
+
+# Registro de cachés con nombre, para exponer sus contadores
+CACHES: Dict[str, "AnswerCache"] = {}
+
+@dataclass
+class _Entry:
+    value: Dict
+    scope: Hashable
+    created: float
+    vec: Optional[np.ndarray]
+
+def normalize_query(query: str) -> str:
+    return normalize_text(query).lower()
+
+class AnswerCache:
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 600.0,
+                 semantic_threshold: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold or None
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._version: Hashable = None
+        self._matrix: Optional[np.ndarray] = None  # vectores de las entradas (modo semántico)
+        self._matrix_keys: list = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        CACHES[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created > self.ttl
+
+    def get(self, query: str, scope: Hashable, version: Hashable) -> Optional[Dict]:
+        """Búsqueda exacta por texto normalizado."""
+        if not self.enabled:
+            return None
+        key = (normalize_query(query), scope)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.monotonic()):
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if self.semantic_threshold is None:
+                    self.misses += 1  # sin modo semántico, esta es la única consulta
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def get_similar(self, query_vec: np.ndarray, scope: Hashable, version: Hashable) -> Optional[Dict]:
+        """Búsqueda semántica: la entrada más parecida por encima del umbral (vectores normalizados)."""
+        if not self.enabled or self.semantic_threshold is None:
+            return None
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = [k for k, e in self._entries.items() if e.vec is not None]
+                self._matrix = (np.stack([self._entries[k].vec for k in self._matrix_keys])
+                                if self._matrix_keys else np.zeros((0, len(query_vec)), dtype="float32"))
+            sims = self._matrix @ np.asarray(query_vec, dtype="float32").ravel() if len(self._matrix) else np.zeros(0)
+            now = time.monotonic()
+            for j in np.argsort(-sims):
+                if sims[j] < self.semantic_threshold:
+                    break
+                key = self._matrix_keys[j]
+                entry = self._entries.get(key)
+                if entry is None or entry.scope != scope or self._expired(entry, now):
+                    continue
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                return entry.value
+            self.misses += 1
+            return None
+
+    def put(self, query: str, scope: Hashable, version: Hashable, value: Dict,
+            query_vec: Optional[np.ndarray] = None) -> None:
+        if not self.enabled:
+            return
+        key = (normalize_query(query), scope)
+        vec = np.asarray(query_vec, dtype="float32").ravel() if query_vec is not None else None
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = _Entry(value, scope, time.monotonic(), vec)
+            self._entries.move_to_end(key)
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _drop(self, key: Tuple) -> None:
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -4,18 +4,33 @@ Chunking sencillo y robusto.
 - Limpia espacios y normaliza.
 - Divide por ~tokens usando aproximación por palabras (evita dependencias complejas).
 - Controla solape entre chunks para preservar contexto (ventana deslizante).
+
+Las fronteras de palabra se calculan una sola vez como offsets de carácter (array numpy) y
+cada chunk es un slice del texto limpio: no se crea un str por palabra ni se recompone cada
+ventana con join. Los metadatos llevan char_start/char_end del chunk en el texto limpio.
+Modo "sentences": cada chunk termina, si puede, en fin de frase o de línea (títulos, párrafos)
+y el solape empieza al principio de una frase.
+
+Los PDF se extraen por páginas (pdf.py) y los chunks llevan page/page_end (1-based); sus
+offsets se refieren al texto de las páginas limpias unidas por saltos de línea.
 """
 
 from pathlib import Path
-from typing import List, Dict
-from pypdf import PdfReader
+from typing import List, Dict, Optional
 from markdown_it import MarkdownIt
 import re
+import numpy as np
+from .pdf import PageCache, read_pdf_pages
+
+# Espacios de str.split()/\\s (ASCII y Unicode) y signos de fin de frase, como code points
+_SPACES = np.array([9, 10, 11, 12, 13, 28, 29, 30, 31, 32, 0x85, 0xA0, 0x1680, *range(0x2000, 0x200B),
+                    0x2028, 0x2029, 0x202F, 0x205F, 0x3000], dtype="uint32")
+_SENTENCE_END = np.array([ord(c) for c in ".!?…:;"], dtype="uint32")
+_CLOSERS = np.array([ord(c) for c in "\"'”»)]"], dtype="uint32")
+CHUNK_MODES = ("words", "sentences")
 
 def read_pdf(path: Path) -> str:
-    reader = PdfReader(str(path))
-    pages = [page.extract_text() or "" for page in reader.pages]
-    return "\n".join(pages)
+    return "\n".join(read_pdf_pages(path))
 
 def read_md(path: Path) -> str:
     text = path.read_text(encoding="utf-8", errors="ignore")
@@ -38,43 +53,134 @@ def word_tokenize(s: str) -> List[str]:
     # Suficiente para chunking. Evitamos NLTK pesada y aseguramos portabilidad.
     return re.findall(r"\S+", s)
 
+_BLOCK = 1 << 16  # caracteres por bloque: los temporales de numpy no crecen con el documento
+
+def _blocks(text: str):
+    for a in range(0, len(text), _BLOCK):
+        yield a, np.frombuffer(text[a:a + _BLOCK].encode("utf-32-le"), dtype="<u4")
+
+def word_offsets(text: str) -> np.ndarray:
+    """(n_palabras, 2) int64 con [inicio, fin) de cada palabra (secuencia sin espacios) en text."""
+    starts, ends = [], []
+    in_word = 0
+    for a, cp in _blocks(text):
+        word = ~np.isin(cp, _SPACES)
+        edges = np.diff(word.view("int8"), prepend=in_word)
+        starts.append(np.flatnonzero(edges == 1) + a)
+        ends.append(np.flatnonzero(edges == -1) + a)
+        in_word = int(word[-1])
+    if in_word:
+        ends.append(np.array([len(text)]))
+    if not starts:
+        return np.zeros((0, 2), dtype="int64")
+    return np.stack([np.concatenate(starts), np.concatenate(ends)], axis=1).astype("int64")
+
+def sentence_breaks(text: str, offsets: np.ndarray) -> np.ndarray:
+    """Índices de las palabras tras las que termina una frase (.!?… y comillas de cierre) o una línea."""
+    last = offsets[:, 1] - 1  # último carácter de cada palabra
+    ends = np.zeros(len(offsets), dtype=bool)
+    newlines = []
+    after_punct = False
+    for a, cp in _blocks(text):
+        punct = np.isin(cp, _SENTENCE_END)
+        end = punct | (np.isin(cp, _CLOSERS) & np.concatenate([[after_punct], punct[:-1]]))
+        lo, hi = np.searchsorted(last, [a, a + len(cp)])
+        ends[lo:hi] = end[last[lo:hi] - a]
+        newlines.append(np.flatnonzero(cp == 10) + a)
+        after_punct = bool(punct[-1])
+    # Salto de línea entre el fin de una palabra y el inicio de la siguiente
+    nl = np.concatenate(newlines) if newlines else np.zeros(0, dtype="int64")
+    ends[:-1] |= np.searchsorted(nl, offsets[:-1, 1]) < np.searchsorted(nl, offsets[1:, 0])
+    return np.flatnonzero(ends)
+
+def _windows(n: int, target: int, overlap: int, breaks: np.ndarray = None):
+    """Ventanas [inicio, fin) en índices de palabra."""
+    step = max(target - overlap, 1)
+    if breaks is None:
+        # Mismas ventanas que el chunker original (incluidas las de cola): mismos ids de chunk
+        return [(s, min(s + target, n)) for s in range(0, n, step)]
+    out = []
+    start = 0
+    while True:
+        end = min(start + target, n)
+        if end < n:
+            # Último fin de frase en la segunda mitad de la ventana
+            lo = np.searchsorted(breaks, start + target // 2, side="left")
+            hi = np.searchsorted(breaks, end - 1, side="right")
+            if hi > lo:
+                end = int(breaks[hi - 1]) + 1
+        out.append((start, end))
+        if end >= n:
+            return out
+        # El solape arranca en la primera frase que empieza dentro de los últimos `overlap` palabras
+        nxt = max(end - overlap, start + 1)
+        j = np.searchsorted(breaks, nxt - 1, side="left")
+        if j < len(breaks) and breaks[j] + 1 < end:
+            nxt = int(breaks[j]) + 1
+        start = nxt
+
 def chunk_text(
     text: str,
     target_tokens: int = 700,
     overlap_tokens: int = 120,
     metadata: Dict = None,
+    mode: str = "words",
 ) -> List[Dict]:
     """
-    Devuelve lista de dicts: { 'text': str, 'metadata': {..., 'chunk_id': int} }
+    Devuelve lista de dicts: { 'text': str, 'metadata': {..., 'chunk_id': int, 'char_start': int, 'char_end': int} }
     """
-    words = word_tokenize(text)
-    if not words:
+    if mode not in CHUNK_MODES:
+        raise ValueError(f"Modo de chunking desconocido: {mode!r} (usa {', '.join(CHUNK_MODES)})")
+    offsets = word_offsets(text)
+    if not len(offsets):
         return []
+    breaks = sentence_breaks(text, offsets) if mode == "sentences" else None
     chunks = []
-    start = 0
-    chunk_id = 0
-    step = max(target_tokens - overlap_tokens, 1)
-
-    while start < len(words):
-        end = min(start + target_tokens, len(words))
-        piece = " ".join(words[start:end])
+    for chunk_id, (s, e) in enumerate(_windows(len(offsets), max(target_tokens, 1), overlap_tokens, breaks)):
+        start, end = int(offsets[s, 0]), int(offsets[e - 1, 1])
         chunks.append({
-            "text": piece,
-            "metadata": {**(metadata or {}), "chunk_id": chunk_id}
+            "text": text[start:end],
+            "metadata": {**(metadata or {}), "chunk_id": chunk_id, "char_start": start, "char_end": end}
         })
-        chunk_id += 1
-        start += step
     return chunks
 
-def load_and_chunk_file(path: Path, target_tokens=700, overlap_tokens=120) -> List[Dict]:
+def chunk_pages(
+    pages: List[str],
+    target_tokens: int = 700,
+    overlap_tokens: int = 120,
+    metadata: Dict = None,
+    mode: str = "words",
+) -> List[Dict]:
+    """chunk_text sobre las páginas unidas; cada chunk añade page y page_end (1-based)."""
+    cleaned = [clean_text(p) for p in pages]
+    starts = np.cumsum([0] + [len(p) + 1 for p in cleaned[:-1]])
+    chunks = chunk_text("\n".join(cleaned), target_tokens, overlap_tokens, metadata, mode)
+    for c in chunks:
+        m = c["metadata"]
+        m["page"] = int(np.searchsorted(starts, m["char_start"], side="right"))
+        m["page_end"] = int(np.searchsorted(starts, m["char_end"] - 1, side="right"))
+    return chunks
+
+def load_and_chunk_file(path: Path, target_tokens=700, overlap_tokens=120, mode: str = "words",
+                        digest: Optional[str] = None, cache: Optional[PageCache] = None) -> List[Dict]:
     suffix = path.suffix.lower()
     if suffix == ".pdf":
-        raw = read_pdf(path)
-    elif suffix in {".md", ".markdown"}:
+        pages = read_pdf_pages(path, digest, cache)
+        return chunk_pages(pages, target_tokens, overlap_tokens, metadata=file_metadata(path), mode=mode)
+    if suffix in {".md", ".markdown"}:
         raw = read_md(path)
     else:
         # Otros formatos: tratamos como texto plano
         raw = path.read_text(encoding="utf-8", errors="ignore")
     raw = clean_text(raw)
-    return chunk_text(raw, target_tokens, overlap_tokens, metadata={"source": str(path)})
+    return chunk_text(raw, target_tokens, overlap_tokens, metadata=file_metadata(path), mode=mode)
+
+def file_metadata(path: Path) -> Dict:
+    # Metadatos filtrables en búsqueda: fuente, tipo de documento y fecha de modificación (epoch)
+    suffix = path.suffix.lower().lstrip(".")
+    return {
+        "source": str(path),
+        "doc_type": "md" if suffix == "markdown" else (suffix or "txt"),
+        "mtime": int(path.stat().st_mtime),
+    }
 
@@ -0,0 +1,260 @@
+"""
+Almacén de textos y metadatos de chunks direccionado por id de vector.
+
+Formato (offsets + blob, sin dependencias):
+- <base>.blob: registros JSON utf-8 concatenados; solo se escribe al final.
+- <base>.idx:  por cada id, dos int64 (offset, longitud) en la posición id*16;
+               longitud -1 = borrado o inexistente.
+- <base>.attrs: por cada id, columnas filtrables (código de source, código de doc_type,
+               mtime); los valores de cada código viven en <base>.vals.json. Código -1 = sin valor.
+
+Ambos ficheros se leen con mmap: abrir el almacén es instantáneo, la memoria residente
+crece solo con los registros realmente leídos (y las páginas se comparten entre los
+workers de la API), y añadir chunks escribe únicamente los datos nuevos.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import json
+import mmap
+import threading
+import numpy as np
+
+_ENTRY = np.dtype([("offset", "<i8"), ("length", "<i8")])
+_ATTR = np.dtype([("source", "<i4"), ("doc_type", "<i4"), ("mtime", "<i8")])
+CATEGORICAL_FIELDS = ("source", "doc_type")
+
+class ChunkStore:
+    def __init__(self, base_path: Path):
+        self.blob_path = base_path.with_suffix(".blob")
+        self.idx_path = base_path.with_suffix(".idx")
+        self.attrs_path = base_path.with_suffix(".attrs")
+        self.vals_path = base_path.with_suffix(".vals.json")
+        self._lock = threading.Lock()
+        self._idx = None    # np.memmap de _ENTRY
+        self._attrs = None  # np.memmap de _ATTR
+        self._vals: Optional[Dict[str, List[str]]] = None
+        self._blob = None   # mmap.mmap de solo lectura
+        self._blob_file = None
+        self._live: Optional[int] = None
+
+    # ---------- Mapeos ----------
+    def _close_maps(self) -> None:
+        self._idx = self._attrs = None  # np.memmap se libera al perder la referencia
+        self._vals = None
+        if self._blob is not None:
+            self._blob.close()
+            self._blob_file.close()
+        self._blob = self._blob_file = None
+
+    def _entries(self) -> np.ndarray:
+        size = self.idx_path.stat().st_size if self.idx_path.exists() else 0
+        n = size // _ENTRY.itemsize
+        if self._idx is None or len(self._idx) != n:
+            # Otro proceso (o este) ha añadido ids: remapeamos
+            self._idx = np.memmap(self.idx_path, dtype=_ENTRY, mode="r", shape=(n,)) if n else np.zeros(0, dtype=_ENTRY)
+        return self._idx
+
+    def _attr_rows(self) -> np.ndarray:
+        size = self.attrs_path.stat().st_size if self.attrs_path.exists() else 0
+        n = size // _ATTR.itemsize
+        if self._attrs is None or len(self._attrs) != n:
+            self._attrs = np.memmap(self.attrs_path, dtype=_ATTR, mode="r", shape=(n,)) if n else np.zeros(0, dtype=_ATTR)
+        return self._attrs
+
+    def _values(self) -> Dict[str, List[str]]:
+        if self._vals is None:
+            self._vals = (json.loads(self.vals_path.read_text(encoding="utf-8")) if self.vals_path.exists()
+                          else {f: [] for f in CATEGORICAL_FIELDS})
+        return self._vals
+
+    def _blob_view(self, needed: int):
+        if self._blob is None or len(self._blob) < needed:
+            if self._blob is not None:
+                self._blob.close()
+                self._blob_file.close()
+            self._blob_file = open(self.blob_path, "rb")
+            self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._blob
+
+    # ---------- Lectura ----------
+    @property
+    def next_id(self) -> int:
+        return len(self._entries())
+
+    def get(self, i: int) -> Optional[Dict]:
+        with self._lock:
+            entries = self._entries()
+            if i < 0 or i >= len(entries):
+                return None
+            off, length = int(entries[i]["offset"]), int(entries[i]["length"])
+            if length < 0:
+                return None
+            raw = self._blob_view(off + length)[off:off + length]
+        return {**json.loads(raw), "id": int(i)}
+
+    def get_many(self, ids: Iterable[int]) -> List[Optional[Dict]]:
+        return [self.get(int(i)) for i in ids]
+
+    def live_mask(self) -> np.ndarray:
+        with self._lock:
+            return self._entries()["length"] >= 0
+
+    def live_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.live_mask()).astype("int64")
+
+    def attrs(self) -> np.ndarray:
+        """Columnas filtrables por id (un índice FAISS anterior a los filtros puede tenerlas más cortas)."""
+        with self._lock:
+            return self._attr_rows()
+
+    def codes(self, field: str, values: Iterable[str]) -> List[int]:
+        """Códigos de los valores conocidos de un campo categórico."""
+        with self._lock:
+            known = {v: c for c, v in enumerate(self._values()[field])}
+        return [known[v] for v in values if v in known]
+
+    def __len__(self) -> int:
+        if self._live is None:
+            self._live = int(len(self.live_ids()))
+        return self._live
+
+    # ---------- Escritura (solo añade) ----------
+    def put_many(self, ids: List[int], records: List[Dict]) -> None:
+        if not ids:
+            return
+        payloads = [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in records]
+        with self._lock:
+            with open(self.blob_path, "ab") as f:
+                start = f.tell()
+                f.write(b"".join(payloads))
+            lengths = np.fromiter((len(p) for p in payloads), dtype="int64", count=len(payloads))
+            offsets = start + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            ids = np.asarray(ids, dtype="int64")
+            self._write_entries(ids, offsets, lengths)
+            self._write_attrs(ids, records)
+        if self._live is not None:
+            self._live += len(ids)
+
+    def delete(self, ids: List[int]) -> None:
+        ids = np.asarray([i for i in ids if 0 <= int(i) < self.next_id], dtype="int64")
+        if not len(ids):
+            return
+        with self._lock:
+            entries = self._entries()
+            ids = ids[entries["length"][ids] >= 0]
+            self._write_entries(ids, np.zeros(len(ids), dtype="int64"), np.full(len(ids), -1, dtype="int64"))
+        if self._live is not None:
+            self._live -= len(ids)
+
+    def _write_entries(self, ids: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> None:
+        # Huecos de ids se marcan como inexistentes (-1)
+        self._idx = None
+        idx = _grow(self.idx_path, _ENTRY, ids, {"length": -1})
+        idx["offset"][ids] = offsets
+        idx["length"][ids] = lengths
+        idx.flush()
+        del idx
+
+    def _write_attrs(self, ids: np.ndarray, records: List[Dict]) -> None:
+        vals = self._values()
+        known = {f: {v: c for c, v in enumerate(vals[f])} for f in CATEGORICAL_FIELDS}
+        n_known = sum(len(v) for v in vals.values())
+        cols = {}
+        for f in CATEGORICAL_FIELDS:
+            codes = []
+            for r in records:
+                v = r.get(f)
+                if v is None:
+                    codes.append(-1)
+                    continue
+                if v not in known[f]:
+                    known[f][v] = len(vals[f])
+                    vals[f].append(v)
+                codes.append(known[f][v])
+            cols[f] = codes
+        if sum(len(v) for v in vals.values()) != n_known:
+            tmp = self.vals_path.with_name(self.vals_path.name + ".tmp")
+            tmp.write_text(json.dumps(vals, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.vals_path)
+        self._attrs = None
+        attrs = _grow(self.attrs_path, _ATTR, ids, {"source": -1, "doc_type": -1})
+        for f in CATEGORICAL_FIELDS:
+            attrs[f][ids] = cols[f]
+        attrs["mtime"][ids] = [int(r.get("mtime") or 0) for r in records]
+        attrs.flush()
+        del attrs
+
+    def clear(self) -> None:
+        with self._lock:
+            self._close_maps()
+            for path in (self.blob_path, self.idx_path, self.attrs_path, self.vals_path):
+                path.unlink(missing_ok=True)
+            self._live = 0
+
+class VectorFile:
+    """
+    Vectores float32 a precisión completa, fila = id (<base>.f32), para reordenar los
+    candidatos de un índice cuantizado. Se lee con mmap: solo se cargan las filas consultadas.
+    """
+    def __init__(self, path: Path, dim: int):
+        self.path = path
+        self.dim = dim
+        self._map = None
+
+    def _rows(self) -> np.ndarray:
+        size = self.path.stat().st_size if self.path.exists() else 0
+        n = size // (4 * self.dim)
+        if self._map is None or len(self._map) != n:
+            self._map = np.memmap(self.path, dtype="<f4", mode="r", shape=(n, self.dim)) if n else np.zeros((0, self.dim), "<f4")
+        return self._map
+
+    def __len__(self) -> int:
+        return len(self._rows())
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        rows = self._rows()
+        ids = np.asarray(ids, dtype="int64")
+        out = np.zeros((len(ids), self.dim), dtype="float32")
+        known = ids < len(rows)  # ids sin vector guardado puntúan 0
+        out[known] = rows[ids[known]]
+        return out
+
+    def has(self, ids: np.ndarray) -> np.ndarray:
+        """Máscara de ids con vector guardado (los huecos quedan a cero: un vector normalizado nunca lo es)."""
+        rows = self._rows()
+        ids = np.asarray(ids, dtype="int64")
+        found = ids < len(rows)
+        found[found] = np.any(rows[ids[found]] != 0, axis=1)
+        return found
+
+    def put(self, ids: np.ndarray, vecs: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype="int64")
+        if not len(ids):
+            return
+        n = int(ids.max()) + 1
+        current = len(self._rows())
+        if n > current:
+            with open(self.path, "ab") as f:
+                f.write(np.zeros((n - current, self.dim), dtype="<f4").tobytes())
+        self._map = None
+        rows = np.memmap(self.path, dtype="<f4", mode="r+", shape=(max(n, current), self.dim))
+        rows[ids] = vecs
+        rows.flush()
+        del rows
+
+    def clear(self) -> None:
+        self._map = None
+        self.path.unlink(missing_ok=True)
+
+def _grow(path: Path, dtype: np.dtype, ids: np.ndarray, fill: Dict) -> np.memmap:
+    """Amplía el fichero de registros fijos hasta cubrir ids (rellenando con fill) y lo abre r+."""
+    n = int(ids.max()) + 1 if len(ids) else 0
+    current = path.stat().st_size // dtype.itemsize if path.exists() else 0
+    if n > current:
+        gap = np.zeros(n - current, dtype=dtype)
+        for field, value in fill.items():
+            gap[field] = value
+        with open(path, "ab") as f:
+            f.write(gap.tobytes())
+    return np.memmap(path, dtype=dtype, mode="r+", shape=(max(n, current),))
@@ -0,0 +1,168 @@
+"""
+Caché persistente de embeddings en disco.
+- Clave: blake2b-128 de (modelo, texto normalizado).
+- Vectores en un np.memmap float32 (vectors.f32) y claves en otro memmap paralelo (keys.bin):
+  cada fila guarda su propia clave, así una escritura interrumpida nunca devuelve el
+  vector de otro texto.
+- El fichero crece por bloques hasta max_entries; al llenarse se expulsa ~10% de las
+  entradas menos usadas recientemente (LRU aproximado con un contador de último uso).
+Diseñada para un único escritor (la ingesta). El servidor usa solo la LRU en proceso.
+"""
+
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+import numpy as np
+
+KEY_BYTES = 16
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: Path, model_name: str, max_entries: int, initial_capacity: int = 4096):
+        self.dir = Path(cache_dir) / _slug(model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max(int(max_entries), 1)
+        self.initial_capacity = min(initial_capacity, self.max_entries)
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self._keys = None   # memmap (capacity, 16) uint8; fila a cero = libre
+        self._vecs = None   # memmap (capacity, dim) float32
+        self._atime = np.zeros(0, dtype="int64")
+        self._slots: Dict[bytes, int] = {}
+        self._free: List[int] = []
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    # ---------- Persistencia ----------
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    def _load(self) -> None:
+        if not self._meta_path.exists():
+            return
+        meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        dim, capacity = int(meta["dim"]), int(meta["capacity"])
+        keys_path, vecs_path = self.dir / "keys.bin", self.dir / "vectors.f32"
+        if (not keys_path.exists() or keys_path.stat().st_size != capacity * KEY_BYTES
+                or not vecs_path.exists() or vecs_path.stat().st_size != capacity * dim * 4):
+            return  # caché incoherente (p.ej. proceso interrumpido al crecer): se empieza de cero
+        self.dim, self.capacity = dim, capacity
+        self._open_maps()
+        occupied = np.asarray(self._keys).any(axis=1)
+        self._slots = {self._keys[i].tobytes(): int(i) for i in np.flatnonzero(occupied)}
+        self._free = np.flatnonzero(~occupied)[::-1].tolist()
+        atime_path = self.dir / "atime.npy"
+        self._atime = np.load(atime_path) if atime_path.exists() else np.zeros(capacity, dtype="int64")
+        if len(self._atime) != capacity:
+            self._atime = np.zeros(capacity, dtype="int64")
+        self._tick = int(self._atime.max(initial=0))
+
+    def _open_maps(self) -> None:
+        self._keys = np.memmap(self.dir / "keys.bin", dtype="uint8", mode="r+", shape=(self.capacity, KEY_BYTES))
+        self._vecs = np.memmap(self.dir / "vectors.f32", dtype="float32", mode="r+", shape=(self.capacity, self.dim))
+
+    def _grow(self, new_capacity: int) -> None:
+        for name, row_bytes in (("keys.bin", KEY_BYTES), ("vectors.f32", self.dim * 4)):
+            with open(self.dir / name, "ab") as f:
+                f.truncate(new_capacity * row_bytes)  # las filas nuevas quedan a cero (clave vacía)
+        self._free.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self._atime = np.concatenate([self._atime, np.zeros(new_capacity - self.capacity, dtype="int64")])
+        self.capacity = new_capacity
+        self._open_maps()
+        self._meta_path.write_text(json.dumps({"dim": self.dim, "capacity": self.capacity}), encoding="utf-8")
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._vecs is None:
+                return
+            self._vecs.flush()
+            self._keys.flush()
+            np.save(self.dir / "atime.npy", self._atime)
+
+    # ---------- API ----------
+    def key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=KEY_BYTES)
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(normalize_text(text).encode("utf-8"))
+        return h.digest()
+
+    def get_many(self, keys: List[bytes]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Devuelve (máscara de aciertos, vectores de los aciertos en orden)."""
+        found = np.zeros(len(keys), dtype=bool)
+        if self._vecs is None:
+            self.misses += len(keys)
+            return found, None
+        with self._lock:
+            rows = []
+            for i, k in enumerate(keys):
+                slot = self._slots.get(k)
+                if slot is not None and self._keys[slot].tobytes() == k:
+                    found[i] = True
+                    rows.append(slot)
+            self._tick += 1
+            if rows:
+                self._atime[rows] = self._tick
+            vecs = np.array(self._vecs[rows]) if rows else None
+        self.hits += int(found.sum())
+        self.misses += int(len(keys) - found.sum())
+        return found, vecs
+
+    def put_many(self, keys: List[bytes], vecs: np.ndarray) -> None:
+        if not keys:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+                self.capacity = 0
+                (self.dir / "keys.bin").write_bytes(b"")
+                (self.dir / "vectors.f32").write_bytes(b"")
+                self._grow(self.initial_capacity)
+            self._tick += 1
+            for k, v in zip(keys, vecs):
+                if k in self._slots:
+                    continue
+                slot = self._take_slot()
+                self._keys[slot] = np.frombuffer(k, dtype="uint8")
+                self._vecs[slot] = v
+                self._slots[k] = slot
+                self._atime[slot] = self._tick
+
+    def _take_slot(self) -> int:
+        if not self._free:
+            if self.capacity < self.max_entries:
+                self._grow(min(self.capacity * 2, self.max_entries))
+            else:
+                self._evict(max(self.capacity // 10, 1))
+        return self._free.pop()
+
+    def _evict(self, n: int) -> None:
+        used = np.flatnonzero(np.asarray(self._keys).any(axis=1))
+        if len(used) == 0:
+            return
+        n = min(n, len(used))
+        victims = used[np.argpartition(self._atime[used], n - 1)[:n]]
+        for slot in victims.tolist():
+            self._slots.pop(self._keys[slot].tobytes(), None)
+            self._keys[slot] = 0
+            self._free.append(slot)
+        self.evictions += n
+
+    def __len__(self) -> int:
+        return len(self._slots)
@@ -1,18 +1,141 @@
 """
 Embeddings con sentence-transformers (gratuito).
 Modelo por defecto: all-MiniLM-L6-v2 (rápido y ligero).
+
+Carga perezosa: el modelo (y torch) solo se importan y cargan en el primer encode.
+La dimensión se lee de la configuración del modelo cuando está en la caché local.
+
+Cachés:
+- Persistente en disco (opcional, cache_dir): solo los textos que no están en caché
+  pasan por el modelo. Útil en re-ingestas y chunks repetidos.
+- LRU en proceso para consultas (encode_query): las preguntas frecuentes de /ask
+  no repiten el forward del transformer.
 """
 
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional
+from collections import OrderedDict
+from pathlib import Path
+import json
+import threading
 import numpy as np
+from .emb_cache import EmbeddingCache, normalize_text
 
 class Embeddings:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        # Descarga la primera vez y cachea localmente (~80MB)
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        cache_dir: Optional[Path] = None,
+        cache_max_entries: int = 0,
+        query_cache_size: int = 1024,
+    ):
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self.cache = EmbeddingCache(cache_dir, model_name, cache_max_entries) if cache_dir and cache_max_entries > 0 else None
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._queries_lock = threading.Lock()
 
-    def encode(self, texts: List[str]) -> np.ndarray:
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    # Descarga la primera vez y cachea localmente (~80MB)
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = self._dim_from_config() or int(self.model.get_sentence_embedding_dimension())
+        return self._dim
+
+    def _dim_from_config(self) -> Optional[int]:
+        # Lee la dimensión de los ficheros de sentence-transformers sin cargar torch
+        try:
+            root = Path(self.model_name)
+            if root.is_dir():
+                def read(name: str) -> str:
+                    return (root / name).read_text(encoding="utf-8")
+            else:
+                from huggingface_hub import try_to_load_from_cache
+
+                def read(name: str) -> str:
+                    path = try_to_load_from_cache(self.model_name, name)
+                    if not isinstance(path, str):
+                        raise FileNotFoundError(name)
+                    return Path(path).read_text(encoding="utf-8")
+            modules = json.loads(read("modules.json"))
+            if any("Dense" in m.get("type", "") for m in modules):
+                return None  # una capa Dense cambia la dimensión final
+            pooling = next(m["path"] for m in modules if m.get("type", "").endswith("Pooling"))
+            return int(json.loads(read(f"{pooling}/config.json"))["word_embedding_dimension"])
+        except Exception:
+            return None
+
+    def _encode_model(self, texts: List[str]) -> np.ndarray:
         # Normalizamos float32 para compatibilidad FAISS
         vecs = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
         return vecs.astype("float32")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype="float32")
+        if self.cache is None:
+            return self._encode_model(texts)
+        keys = [self.cache.key(t) for t in texts]
+        found, cached = self.cache.get_many(keys)
+        if found.all():
+            return cached
+        # Fallos de caché, sin repetir textos idénticos dentro del mismo lote
+        miss_idx = np.flatnonzero(~found)
+        first: "OrderedDict[bytes, int]" = OrderedDict()
+        for i in miss_idx.tolist():
+            first.setdefault(keys[i], i)
+        new_vecs = self._encode_model([texts[i] for i in first.values()])
+        self.cache.put_many(list(first), new_vecs)
+
+        out = np.empty((len(texts), new_vecs.shape[1]), dtype="float32")
+        if cached is not None:
+            out[found] = cached
+        row = {k: j for j, k in enumerate(first)}
+        out[miss_idx] = new_vecs[[row[keys[i]] for i in miss_idx.tolist()]]
+        return out
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embedding de una consulta (1, dim) con LRU en proceso."""
+        return self.encode_queries([query])
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embeddings de un lote de consultas: aciertos de la LRU y un único encode para el resto."""
+        keys = [normalize_text(q) for q in queries]
+        rows: List[Optional[np.ndarray]] = [None] * len(queries)
+        with self._queries_lock:
+            for i, k in enumerate(keys):
+                vec = self._queries.get(k)
+                if vec is not None:
+                    self._queries.move_to_end(k)
+                    rows[i] = vec
+        missing = [i for i, r in enumerate(rows) if r is None]
+        if missing:
+            vecs = self.encode([queries[i] for i in missing])
+            for i, v in zip(missing, vecs):
+                rows[i] = v
+            if self.query_cache_size > 0:
+                with self._queries_lock:
+                    for i in missing:
+                        self._queries[keys[i]] = rows[i]
+                    while len(self._queries) > self.query_cache_size:
+                        self._queries.popitem(last=False)
+        return np.stack(rows).astype("float32", copy=False)
+
+    def flush(self) -> None:
+        if self.cache is not None:
+            self.cache.flush()
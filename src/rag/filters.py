@@ -0,0 +1,67 @@
+"""
+Filtros de búsqueda por metadatos: fuente, tipo de documento y rango de fechas.
+Cada vector store los traduce a su mecanismo nativo (payload filters en Qdrant,
+bitmaps de ids en FAISS); matches() evalúa el mismo filtro sobre un payload en Python.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+def date_to_epoch(d: date) -> int:
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """Condiciones en AND; dentro de sources/doc_types basta con que coincida un valor."""
+    sources: Tuple[str, ...] = ()
+    doc_types: Tuple[str, ...] = ()
+    mtime_from: Optional[int] = None   # epoch (s), inclusive
+    mtime_to: Optional[int] = None     # epoch (s), exclusivo
+
+    @classmethod
+    def build(
+        cls,
+        source: Optional[Iterable[str]] = None,
+        doc_type: Optional[Iterable[str]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Optional["SearchFilter"]:
+        """Filtro a partir de los campos de la API; None si no restringe nada. date_to es inclusivo."""
+        if isinstance(source, str):
+            source = [source]
+        if isinstance(doc_type, str):
+            doc_type = [doc_type]
+        flt = cls(
+            sources=tuple(sorted(set(source or ()))),
+            doc_types=tuple(sorted({t.lower().lstrip(".") for t in doc_type or ()})),
+            mtime_from=date_to_epoch(date_from) if date_from else None,
+            mtime_to=date_to_epoch(date_to + timedelta(days=1)) if date_to else None,
+        )
+        return None if flt.empty else flt
+
+    @property
+    def empty(self) -> bool:
+        return not (self.sources or self.doc_types or self.mtime_from is not None or self.mtime_to is not None)
+
+    def categorical(self) -> Dict[str, Tuple[str, ...]]:
+        return {f: v for f, v in (("source", self.sources), ("doc_type", self.doc_types)) if v}
+
+    def matches(self, meta: Dict) -> bool:
+        if self.sources and meta.get("source") not in self.sources:
+            return False
+        if self.doc_types and meta.get("doc_type") not in self.doc_types:
+            return False
+        mtime = meta.get("mtime")
+        if self.mtime_from is not None and (mtime is None or mtime < self.mtime_from):
+            return False
+        if self.mtime_to is not None and (mtime is None or mtime >= self.mtime_to):
+            return False
+        return True
+
+    def to_qdrant(self):
+        from qdrant_client.models import FieldCondition, Filter, MatchAny, Range
+        must = [FieldCondition(key=f, match=MatchAny(any=list(v))) for f, v in self.categorical().items()]
+        if self.mtime_from is not None or self.mtime_to is not None:
+            must.append(FieldCondition(key="mtime", range=Range(gte=self.mtime_from, lt=self.mtime_to)))
+        return Filter(must=must)
@@ -3,64 +3,369 @@ Ingesta:
 - Lee PDF/MD/TXT en data/raw
 - Chunquea (500-800 "tokens" aproximados por palabras)
 - Calcula embeddings y actualiza el índice vectorial (FAISS o Qdrant)
+- Mantiene un índice invertido BM25 (processed_dir/bm25) con los mismos chunks que chunks.parquet
 - Guarda artefactos en data/processed
 
-Idempotente: puede ejecutarse múltiples veces sin romper el índice.
+Incremental: un manifiesto (manifest.json en processed_dir) guarda por fichero
+tamaño, mtime, hash de contenido e ids de sus vectores.
+- Ficheros sin cambios: se saltan (ni se leen ni se embeben).
+- Ficheros modificados: se borran sus vectores antiguos y se reemplazan.
+- Ficheros eliminados: se purgan del índice.
+Si no hay manifiesto, cambian modelo/parámetros de chunking o faltan artefactos del índice
+(o no cuadran con el manifiesto), se reconstruye todo.
+
+Pipeline en streaming:
+- Un pool de procesos extrae y chunquea ficheros (pypdf es CPU-bound) mientras
+  el proceso principal calcula embeddings: ambas fases se solapan. Los PDF se reparten
+  por rangos de páginas y el texto de cada página queda en una caché (processed_dir/
+  pdf_pages, por hash de fichero + página): re-ingestar no vuelve a parsear PDFs.
+- Una cola acotada entrega lotes de tamaño fijo al embedder; cada lote se escribe
+  en el vector store y en chunks.parquet al terminar, así la memoria pico depende
+  de INGEST_BATCH_SIZE x INGEST_QUEUE_DEPTH y no del tamaño del corpus.
+
+Idempotente: puede ejecutarse múltiples veces sin duplicar vectores.
 """
 
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple, Iterator, Iterable
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import threading
+import queue
+import hashlib
+import json
 from ..app.config import settings
-from .chunk import load_and_chunk_file
+from .chunk import chunk_pages, file_metadata, load_and_chunk_file
+from .pdf import PageCache, extract_pages, missing_ranges, page_count
 from .embeddings import Embeddings
-from .vectorstore import build_store
+from .vectorstore import build_store, has_local_index, IndexConfig
+from .sparse import SparseIndexBuilder
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+MANIFEST_NAME = "manifest.json"
+META_FIELDS = ("source", "chunk_id", "doc_type", "mtime", "char_start", "char_end", "page", "page_end")
+PAGE_FIELDS = ("page", "page_end")  # solo PDF: enteros con nulos en chunks.parquet
+MANIFEST_VERSION = 5  # 2: doc_type y mtime (filtros); 3: offsets de carácter; 4: páginas; 5: ventanas de cola
 
 def discover_files(raw_dir: Path) -> List[Path]:
     exts = {".pdf", ".md", ".markdown", ".txt"}
     return [p for p in raw_dir.glob("*") if p.suffix.lower() in exts]
 
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def ingest_params() -> Dict:
+    # Si cambia cualquiera de estos valores, los vectores existentes dejan de ser válidos
+    params = {
+        "version": MANIFEST_VERSION,
+        "backend": settings.rag_backend.lower(),
+        "embeddings_model": settings.embeddings_model,
+        "chunk_target_tokens": settings.chunk_target_tokens,
+        "chunk_overlap_tokens": settings.chunk_overlap_tokens,
+        "chunk_mode": settings.chunk_mode,
+    }
+    if params["backend"] != "qdrant":
+        params["faiss_index"] = IndexConfig.from_settings().build_params()
+    if params["backend"] == "faiss_sharded":
+        params["faiss_shards"] = {"shards": settings.faiss_shards, "shard_by": settings.faiss_shard_by.lower()}
+    return params
+
+def load_manifest(processed_dir: Path) -> Dict:
+    path = processed_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_manifest(processed_dir: Path, manifest: Dict) -> None:
+    path = processed_dir / MANIFEST_NAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(path)  # escritura atómica: nunca dejamos un manifiesto a medias
+
+def store_in_sync(manifest: Dict) -> bool:
+    """
+    True si los artefactos locales cubren lo que dice el manifiesto: índice y chunks.parquet en
+    disco y tantos chunks vivos como ids registrados (p. ej. tras borrarlos a mano o con make clean).
+    """
+    backend = settings.rag_backend.lower()
+    expected = sum(len(e["ids"]) for e in manifest.get("files", {}).values())
+    if backend == "qdrant" or not expected:
+        return True
+    processed_dir = settings.processed_dir
+    if not has_local_index(backend, processed_dir) or not (processed_dir / "chunks.parquet").exists():
+        return False
+    return len(build_store(backend, dim=None, processed_dir=processed_dir)) == expected
+
+def plan_ingest(files: List[Path], manifest: Dict) -> Tuple[List[Tuple[Path, str]], List, Dict, bool]:
+    """
+    Compara los ficheros actuales con el manifiesto.
+    Devuelve (a_procesar [(path, sha256)], ids_a_borrar, entradas_vigentes, reconstruir_todo).
+    """
+    rebuild = not manifest or manifest.get("params") != ingest_params() or not store_in_sync(manifest)
+    old_entries: Dict[str, Dict] = {} if rebuild else dict(manifest.get("files", {}))
+    current = {str(p): p for p in files}
+
+    to_process: List[Tuple[Path, str]] = []
+    to_delete: List = []
+    entries: Dict[str, Dict] = {}
+    for key, p in current.items():
+        st = p.stat()
+        old = old_entries.get(key)
+        # Atajo barato: mismo tamaño y mtime -> sin cambios, no hace falta leer el fichero
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            entries[key] = old
+            continue
+        digest = file_sha256(p)
+        if old and old["sha256"] == digest:
+            # Solo ha cambiado el mtime (copia, touch...): conservamos los vectores
+            entries[key] = {**old, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            continue
+        if old:
+            to_delete.extend(old["ids"])
+        to_process.append((p, digest))
+
+    for key, old in old_entries.items():
+        if key not in current:
+            to_delete.extend(old["ids"])
+    return to_process, to_delete, entries, rebuild
+
+class ChunksTable:
+    """
+    Escritor en streaming de chunks.parquet (tabla auxiliar con todos los chunks vivos).
+    Copia las filas vigentes de la tabla anterior y añade los lotes nuevos según llegan,
+    sin cargar nunca la tabla completa en memoria.
+    """
+    def __init__(self, processed_dir: Path, deleted_ids: List, rebuild: bool):
+        self.path = processed_dir / "chunks.parquet"
+        self.tmp = processed_dir / "chunks.parquet.tmp"
+        self.writer = None
+        deleted = set(deleted_ids)
+        if rebuild or not self.path.exists():
+            return
+        old = pq.ParquetFile(self.path)
+        if "id" not in old.schema_arrow.names:
+            return  # tabla de una versión anterior sin ids: se regenera
+        for batch in old.iter_batches():
+            df = batch.to_pandas()
+            if deleted:
+                df = df[~df["id"].isin(deleted)]
+            self._write(df)
+
+    def _write(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def append(self, ids: List, texts: List[str], metas: List[Dict]) -> None:
+        self._write(pd.DataFrame({
+            "id": ids,
+            "text": texts,
+            **{k: pd.array([m[k] for m in metas], dtype="Int64") if k in PAGE_FIELDS else [m[k] for m in metas]
+               for k in META_FIELDS},
+        }))
+
+    def close(self) -> None:
+        if self.writer is None:
+            self.path.unlink(missing_ok=True)
+            return
+        self.writer.close()
+        self.tmp.replace(self.path)
+
+def _submit_file(pool, path: Path, digest: str, args: Tuple, cache: PageCache):
+    """Encola un fichero: entero si no es PDF, o sus rangos de páginas sin caché si lo es."""
+    if path.suffix.lower() != ".pdf":
+        return [(None, pool.submit(load_and_chunk_file, path, *args))], None
+    n = cache.page_count(digest)
+    if n is None:
+        n = page_count(path)
+        cache.set_page_count(digest, n)
+    pages = cache.get(digest)
+    futures = [(start, pool.submit(extract_pages, str(path), start, stop, str(cache.root), digest))
+               for start, stop in missing_ranges(n, pages, max(settings.pdf_pages_per_task, 1))]
+    return futures, (n, pages)
+
+def _collect_file(path: Path, futures, pdf, args: Tuple) -> List[Dict]:
+    if pdf is None:
+        return futures[0][1].result()
+    n, pages = pdf
+    for start, fut in futures:
+        pages.update({start + i: t for i, t in enumerate(fut.result())})
+    return chunk_pages([pages[i] for i in range(n)], *args[:2], metadata=file_metadata(path), mode=args[2])
+
+def iter_file_chunks(files: List[Tuple[Path, str]], workers: int) -> Iterator[Tuple[Path, List[Dict]]]:
+    """
+    Extrae y chunquea ficheros (path, sha256) en un pool de procesos, con una ventana acotada
+    de tareas en vuelo. Un PDF se reparte en rangos de páginas (un manual grande ocupa todos
+    los workers) y se chunquea al reunir sus páginas. Mantiene el orden de entrada para que
+    los ids sean deterministas.
+    """
+    args = (settings.chunk_target_tokens, settings.chunk_overlap_tokens, settings.chunk_mode)
+    cache = PageCache(settings.processed_dir / "pdf_pages")
+    if workers <= 1:
+        for f, digest in files:
+            yield f, load_and_chunk_file(f, *args, digest=digest, cache=cache)
+        return
+    # 'spawn': el proceso principal ya tiene hilos (torch); fork podría bloquearse
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        it = iter(files)
+        pending = deque()
+        in_flight = 0
+        while True:
+            while in_flight < workers * 2:
+                nxt = next(it, None)
+                if nxt is None:
+                    break
+                futures, pdf = _submit_file(pool, *nxt, args, cache)
+                pending.append((nxt[0], futures, pdf))
+                in_flight += max(len(futures), 1)
+            if not pending:
+                return
+            f, futures, pdf = pending.popleft()
+            yield f, _collect_file(f, futures, pdf, args)
+            in_flight -= max(len(futures), 1)
+
+def iter_batches(file_chunks: Iterable[Tuple[Path, List[Dict]]], batch_size: int) -> Iterator[List[Dict]]:
+    buf: List[Dict] = []
+    for _, chunks in file_chunks:
+        buf.extend(chunks)
+        while len(buf) >= batch_size:
+            yield buf[:batch_size]
+            buf = buf[batch_size:]
+    if buf:
+        yield buf
+
+_DONE = object()
+
+def _produce(batches: Iterator[List[Dict]], q: queue.Queue, stop: threading.Event) -> None:
+    def put(item) -> None:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    try:
+        for batch in batches:
+            if stop.is_set():
+                return
+            put(batch)
+        put(_DONE)
+    except BaseException as e:  # se relanza en el hilo consumidor
+        put(e)
+
+def iter_queued_batches(files: List[Tuple[Path, str]]) -> Iterator[List[Dict]]:
+    """Productor en segundo plano + cola acotada: la extracción avanza mientras se embebe."""
+    q: queue.Queue = queue.Queue(maxsize=max(settings.ingest_queue_depth, 1))
+    stop = threading.Event()
+    batches = iter_batches(
+        iter_file_chunks(files, settings.resolved_ingest_workers()),
+        max(settings.ingest_batch_size, 1),
+    )
+    producer = threading.Thread(target=_produce, args=(batches, q, stop), daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
 def run_ingest() -> None:
     raw_dir = settings.data_dir / "raw"
     processed_dir = settings.processed_dir
     processed_dir.mkdir(parents=True, exist_ok=True)
 
     files = discover_files(raw_dir)
-    if not files:
+    manifest = load_manifest(processed_dir)
+    if not files and not manifest.get("files"):
+        # Sin documentos ni nada indexado que purgar
         print(f"No se encontraron documentos en {raw_dir}. Añade PDF/MD/TXT y vuelve a ejecutar.")
         return
 
-    # Carga/Chunk
-    all_chunks: List[Dict] = []
-    for f in files:
-        chunks = load_and_chunk_file(
-            f,
-            target_tokens=settings.chunk_target_tokens,
-            overlap_tokens=settings.chunk_overlap_tokens
-        )
-        all_chunks.extend(chunks)
-
-    if not all_chunks:
-        print("No se generaron chunks. Revisa los documentos.")
+    to_process, to_delete, entries, rebuild = plan_ingest(files, manifest)
+    if not to_process and not to_delete and not rebuild:
+        if not (processed_dir / "bm25").exists():
+            # Índice creado antes de existir BM25: se construye desde chunks.parquet
+            SparseIndexBuilder(processed_dir / "bm25", [], False, processed_dir / "chunks.parquet").close()
+        save_manifest(processed_dir, {"params": ingest_params(), "files": entries})
+        print(f"Índice al día. Documentos sin cambios: {len(entries)}.")
         return
 
-    texts = [c["text"] for c in all_chunks]
-    metas = [{"source": c["metadata"]["source"], "chunk_id": c["metadata"]["chunk_id"]} for c in all_chunks]
+    EMB = Embeddings(
+        settings.embeddings_model,
+        cache_dir=processed_dir / "emb_cache",
+        cache_max_entries=settings.emb_cache_max_entries,
+    ) if to_process else None
+    store = None
+    table = ChunksTable(processed_dir, to_delete, rebuild)
+    sparse = SparseIndexBuilder(processed_dir / "bm25", to_delete, rebuild, processed_dir / "chunks.parquet")
+    ids_by_source: Dict[str, List] = {}
+    n_chunks = 0
+
+    # Carga/Chunk -> Embeddings -> Vector store, lote a lote
+    for batch in iter_queued_batches(to_process):
+        texts = [c["text"] for c in batch]
+        metas = [{k: c["metadata"].get(k) for k in META_FIELDS} for c in batch]
+        vecs = EMB.encode(texts)
+        if store is None:
+            store = _open_store(vecs.shape[1], rebuild, to_delete)
+        ids = store.add(texts, metas, vecs)
+        table.append(ids, texts, metas)
+        sparse.add(ids, texts)
+        for i, m in zip(ids, metas):
+            ids_by_source.setdefault(m["source"], []).append(i)
+        n_chunks += len(batch)
 
-    # Embeddings
-    EMB = Embeddings(settings.embeddings_model)
-    vecs = EMB.encode(texts)
+    if store is None:
+        # Nada que embeber (solo borrados o documentos vacíos)
+        store = _open_store(None, rebuild, to_delete)
+    store.save()
+    table.close()
+    sparse.close()
+    if EMB is not None:
+        EMB.flush()
 
-    # Vector store
-    store = build_store(settings.rag_backend, dim=vecs.shape[1], processed_dir=processed_dir)
-    store.add(texts, metas, vecs)
+    for f, digest in to_process:
+        st = f.stat()
+        entries[str(f)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "ids": ids_by_source.get(str(f), []),
+        }
+    save_manifest(processed_dir, {"params": ingest_params(), "files": entries})
+    PageCache(processed_dir / "pdf_pages").prune({e["sha256"] for e in entries.values()})
 
-    # Guardamos una tabla auxiliar para inspección
-    df = pd.DataFrame({"text": texts, "source": [m["source"] for m in metas], "chunk_id": [m["chunk_id"] for m in metas]})
-    df.to_parquet(processed_dir / "chunks.parquet", index=False)
+    print(
+        f"Ingesta completada. Documentos procesados: {len(to_process)}, sin cambios: {len(files) - len(to_process)}, "
+        f"chunks nuevos: {n_chunks}, vectores borrados: {len(to_delete)}. "
+        f"Backend: {settings.rag_backend}. Artefactos en {processed_dir}"
+    )
 
-    print(f"Ingesta completada. Chunks: {len(all_chunks)}. Backend: {settings.rag_backend}. Artefactos en {processed_dir}")
+def _open_store(dim, rebuild: bool, to_delete: List):
+    store = build_store(settings.rag_backend, dim=dim, processed_dir=settings.processed_dir)
+    store.autosave = False  # persistimos una sola vez al final (store.save())
+    if rebuild:
+        store.clear(dim=dim)
+    else:
+        store.delete(to_delete)
+    return store
 
 if __name__ == "__main__":
     run_ingest()
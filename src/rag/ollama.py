@@ -0,0 +1,128 @@
+"""
+Cliente del generador local (Ollama).
+- generate(): síncrono, con un httpx.Client compartido (pool de conexiones y keep-alive)
+  en lugar de abrir una conexión por petición.
+- astream(): asíncrono, con un httpx.AsyncClient compartido; consume el NDJSON de
+  /api/generate con "stream": true y entrega los tokens según llegan.
+- Límite de concurrencia (OLLAMA_MAX_CONCURRENCY): si el modelo va lento, las peticiones
+  esperan como mucho OLLAMA_QUEUE_TIMEOUT segundos y después caen al modo stub, de modo
+  que un modelo lento no agota los workers de la API.
+Cualquier fallo devuelve vacío: el pipeline decide el fallback.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+import threading
+import httpx
+from ..app.config import settings
+
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_sync_slots: Optional[threading.BoundedSemaphore] = None
+_aclient: Optional[httpx.AsyncClient] = None
+_aslots: Optional[asyncio.Semaphore] = None
+_aloop = None
+
+def _limits() -> httpx.Limits:
+    n = max(settings.ollama_max_concurrency, 1)
+    return httpx.Limits(max_connections=n, max_keepalive_connections=n)
+
+def _timeout() -> httpx.Timeout:
+    # Sin límite de lectura total en streaming: acotamos el tiempo entre fragmentos
+    return httpx.Timeout(settings.ollama_timeout, connect=5.0)
+
+def prompt_header(query: str) -> str:
+    return (
+        "Eres un sistema que responde con precisión usando SOLO los pasajes proporcionados.\n"
+        "Si falta información, admite la incertidumbre. Cita las fuentes al final como [n].\n\n"
+        "Pregunta:\n"
+        f"{query}\n\n"
+        "Pasajes:\n"
+    )
+
+def format_passage(i: int, p: Dict) -> str:
+    return f"[{i}] (source: {p['source']} chunk:{p['chunk_id']}) {p['text']}\n\n"
+
+def build_prompt(query: str, passages: List[Dict]) -> str:
+    parts = [prompt_header(query)]
+    for i, p in enumerate(passages, 1):
+        parts.append(format_passage(i, p))
+    return "".join(parts)
+
+def _payload(prompt: str, stream: bool) -> Dict:
+    return {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": stream,
+        "options": {"temperature": 0.1}
+    }
+
+# ---------- Síncrono ----------
+def _sync_client() -> httpx.Client:
+    global _client, _sync_slots
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(timeout=_timeout(), limits=_limits())
+            _sync_slots = threading.BoundedSemaphore(max(settings.ollama_max_concurrency, 1))
+        return _client
+
+def generate(prompt: str) -> str:
+    client = _sync_client()
+    if not _sync_slots.acquire(timeout=settings.ollama_queue_timeout):
+        return ""  # demasiadas generaciones en curso: fallback inmediato
+    try:
+        r = client.post(f"{settings.ollama_base_url}/api/generate", json=_payload(prompt, stream=False))
+        r.raise_for_status()
+        return r.json().get("response", "").strip()
+    except Exception:
+        # fallback en caso de que Ollama no esté levantado
+        return ""
+    finally:
+        _sync_slots.release()
+
+# ---------- Asíncrono / streaming ----------
+def _async_client() -> httpx.AsyncClient:
+    global _aclient, _aslots, _aloop
+    loop = asyncio.get_running_loop()
+    if _aclient is None or _aloop is not loop:
+        # Cliente y semáforo pertenecen a un event loop concreto (uno por proceso con uvicorn)
+        _aclient = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        _aslots = asyncio.Semaphore(max(settings.ollama_max_concurrency, 1))
+        _aloop = loop
+    return _aclient
+
+async def astream(prompt: str) -> AsyncIterator[str]:
+    """Tokens de Ollama según se generan. No entrega nada si Ollama no está disponible o está saturado."""
+    client = _async_client()
+    try:
+        await asyncio.wait_for(_aslots.acquire(), timeout=settings.ollama_queue_timeout)
+    except asyncio.TimeoutError:
+        return
+    try:
+        async with client.stream("POST", f"{settings.ollama_base_url}/api/generate",
+                                 json=_payload(prompt, stream=True)) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                token = data.get("response", "")
+                if token:
+                    yield token
+                if data.get("done"):
+                    break
+    except (httpx.HTTPError, ValueError):
+        return
+    finally:
+        _aslots.release()
+
+async def aclose() -> None:
+    global _aclient, _client
+    if _aclient is not None:
+        await _aclient.aclose()
+        _aclient = None
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,116 @@
+"""
+Extracción de PDF por páginas, paralelizable y con caché.
+
+pypdf es el paso más lento de la ingesta. Aquí:
+- el PDF se reparte en rangos de PDF_PAGES_PER_TASK páginas que extraen procesos distintos
+  (extract_pages es una función de módulo, serializable para ProcessPoolExecutor): un manual
+  de 1000 páginas usa todos los núcleos;
+- cada rango extraído se guarda en una caché en disco (processed_dir/pdf_pages) direccionada
+  por hash del fichero + número de página: re-ingestar o cambiar el chunking no vuelve a
+  parsear ningún PDF.
+
+Formato de la caché: <dir>/<sha256>/meta.json ({"pages": n}) y un JSON por rango extraído
+(<inicio>-<fin>.json con la lista de textos). Cada rango lo escribe un único proceso
+(escritura atómica), así que no hace falta coordinar a los workers.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import shutil
+from pypdf import PdfReader
+
+class PageCache:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _dir(self, digest: str) -> Path:
+        return self.root / digest
+
+    def page_count(self, digest: str) -> Optional[int]:
+        path = self._dir(digest) / "meta.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))["pages"]
+
+    def set_page_count(self, digest: str, n: int) -> None:
+        _write_json(self._dir(digest) / "meta.json", {"pages": n})
+
+    def get(self, digest: str) -> Dict[int, str]:
+        """Páginas ya extraídas: {número de página (0-based): texto}."""
+        pages: Dict[int, str] = {}
+        d = self._dir(digest)
+        if not d.exists():
+            return pages
+        for path in d.glob("*-*.json"):
+            start = int(path.stem.split("-")[0])
+            try:
+                texts = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError:
+                continue  # rango a medio escribir por una ingesta interrumpida
+            pages.update({start + i: t for i, t in enumerate(texts)})
+        return pages
+
+    def put(self, digest: str, start: int, texts: List[str]) -> None:
+        _write_json(self._dir(digest) / f"{start:06d}-{start + len(texts):06d}.json", texts)
+
+    def prune(self, keep: set) -> int:
+        """Borra las entradas de PDFs que ya no están en el corpus; devuelve cuántas."""
+        if not self.root.exists():
+            return 0
+        removed = 0
+        for d in self.root.iterdir():
+            if d.is_dir() and d.name not in keep:
+                shutil.rmtree(d, ignore_errors=True)
+                removed += 1
+        return removed
+
+def _write_json(path: Path, obj) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+def page_count(path: Path) -> int:
+    return len(PdfReader(str(path)).pages)
+
+def extract_pages(path: str, start: int, stop: int, cache_root: Optional[str] = None,
+                  digest: Optional[str] = None) -> List[str]:
+    """Texto de las páginas [start, stop); si hay caché, el rango queda guardado en ella."""
+    reader = PdfReader(path)
+    texts = [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    if cache_root and digest:
+        PageCache(Path(cache_root)).put(digest, start, texts)
+    return texts
+
+def missing_ranges(n_pages: int, cached: Dict[int, str], pages_per_task: int) -> List[Tuple[int, int]]:
+    """Rangos [inicio, fin) de páginas sin caché, de como mucho pages_per_task páginas."""
+    ranges = []
+    i = 0
+    while i < n_pages:
+        if i in cached:
+            i += 1
+            continue
+        j = i
+        while j < n_pages and j not in cached and j - i < pages_per_task:
+            j += 1
+        ranges.append((i, j))
+        i = j
+    return ranges
+
+def read_pdf_pages(path: Path, digest: Optional[str] = None, cache: Optional[PageCache] = None,
+                   pages_per_task: int = 16) -> List[str]:
+    """Todas las páginas en este proceso, reutilizando y completando la caché."""
+    if cache is None or digest is None:
+        reader = PdfReader(str(path))
+        return [page.extract_text() or "" for page in reader.pages]
+    n = cache.page_count(digest)
+    if n is None:
+        n = page_count(path)
+        cache.set_page_count(digest, n)
+    pages = cache.get(digest)
+    for start, stop in missing_ranges(n, pages, pages_per_task):
+        texts = extract_pages(str(path), start, stop, str(cache.root), digest)
+        pages.update({start + i: t for i, t in enumerate(texts)})
+    return [pages[i] for i in range(n)]
@@ -1,27 +1,122 @@
 """
 Pipeline RAG:
-1) Recupera top_k chunks por similitud semántica.
-2) Llama al generador LLM local (Ollama) para sintetizar respuesta con citas.
+1) Recupera top_k chunks por similitud semántica, fusionada (RRF) con BM25 si existe el
+   índice invertido (HYBRID_SEARCH). Con RERANK_ENABLED se recuperan RERANK_CANDIDATES y un
+   cross-encoder se queda con los top_k. En las citas, score es siempre la similitud densa;
+   el valor de la fusión va en rrf_score y el del cross-encoder en rerank_score.
+2) Llama al generador LLM local (Ollama) para sintetizar respuesta con citas, con un
+   contexto sin solapes y acotado a PROMPT_MAX_TOKENS (prompt.build_context).
 3) Fallback a modo 'stub' extractivo si no hay Ollama.
 
 La función pública principal es answer(query: str) -> dict
+answer_many(queries) resuelve un lote con un único encode y una única búsqueda matricial.
+astream_answer(query) emite eventos (meta, token..., done) para respuestas en streaming.
+Las tres aceptan filters (SearchFilter: fuente, tipo de documento, fechas), aplicado en el store.
+
+Modelo e índice se cargan de forma perezosa (get_embeddings/get_store): importar este
+módulo no carga torch ni lee el índice. La API llama a warmup() al arrancar. Si una ingesta
+externa reescribe el índice, get_store() lo recarga en la siguiente consulta.
+
+answer() pasa por una caché de respuestas (exacta y, opcionalmente, semántica) que se
+invalida cuando cambia la versión del índice.
 """
 
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional
 from pathlib import Path
+import asyncio
+import threading
 import numpy as np
-import httpx
 from .embeddings import Embeddings
-from .vectorstore import build_store
+from . import ollama
+from .prompt import build_context
+from .vectorstore import build_store, has_local_index
+from .answer_cache import AnswerCache
+from .sparse import SparseIndex, rrf_fuse
+from .rerank import CrossEncoderReranker
+from .filters import SearchFilter
 from ..app.config import settings
+from ..app.telemetry import run_traced, span
+
+# Instancias únicas, creadas bajo demanda
+_EMB: Optional[Embeddings] = None
+_VEC = None
+_SPARSE: Optional[SparseIndex] = None
+_ANSWERS: Optional[AnswerCache] = None
+_RERANKER: Optional[CrossEncoderReranker] = None
+_lock = threading.Lock()
+_ready = threading.Event()
+
+def get_embeddings() -> Embeddings:
+    global _EMB
+    if _EMB is None:
+        with _lock:
+            if _EMB is None:
+                _EMB = Embeddings(settings.embeddings_model, query_cache_size=settings.query_cache_size)
+    return _EMB
+
+def get_store():
+    global _VEC
+    if _VEC is None or _VEC.stale():
+        with _lock:
+            if _VEC is None or _VEC.stale():
+                # Con un índice FAISS en disco la dimensión sale del propio índice
+                has_index = has_local_index(settings.rag_backend, settings.processed_dir)
+                dim = None if has_index else get_embeddings().dim
+                _VEC = build_store(settings.rag_backend, dim=dim, processed_dir=settings.processed_dir)
+    return _VEC
+
+def get_sparse() -> Optional[SparseIndex]:
+    """Índice BM25 (None si aún no se ha ingerido con BM25); se recarga si la ingesta lo cambia."""
+    global _SPARSE
+    if _SPARSE is None or _SPARSE.stale():
+        with _lock:
+            if _SPARSE is None or _SPARSE.stale():
+                _SPARSE = SparseIndex.load(settings.processed_dir / "bm25", k1=settings.bm25_k1, b=settings.bm25_b)
+    return _SPARSE
+
+def get_answer_cache() -> AnswerCache:
+    global _ANSWERS
+    if _ANSWERS is None:
+        with _lock:
+            if _ANSWERS is None:
+                _ANSWERS = AnswerCache(
+                    "rag", max_entries=settings.answer_cache_size, ttl=settings.answer_cache_ttl,
+                    semantic_threshold=settings.answer_cache_semantic_threshold,
+                )
+    return _ANSWERS
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Cross-encoder de reordenado (None si RERANK_ENABLED está desactivado)."""
+    global _RERANKER
+    if not settings.rerank_enabled:
+        return None
+    if _RERANKER is None:
+        with _lock:
+            if _RERANKER is None:
+                _RERANKER = CrossEncoderReranker(
+                    settings.rerank_model, batch_size=settings.rerank_batch_size,
+                    budget_ms=settings.rerank_budget_ms, cache_size=settings.rerank_cache_size,
+                )
+    return _RERANKER
 
-# Instancias únicas
-EMB = Embeddings(settings.embeddings_model)
-VEC = build_store(settings.rag_backend, dim=EMB.encode(["x"]).shape[1], processed_dir=settings.processed_dir)
+def index_version():
+    """Versión del índice cargado (recargándolo si una ingesta lo ha cambiado)."""
+    return get_store().version()
 
-def _retrieve(query: str, top_k: int = 5) -> List[Dict]:
-    qv = EMB.encode([query])
-    hits = VEC.search(qv, top_k=top_k)
+def warmup() -> None:
+    """Carga modelo e índice y ejecuta un encode de prueba (primer forward de torch)."""
+    get_store()
+    get_sparse()
+    get_embeddings().encode(["warmup"])
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.warmup()
+    _ready.set()
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def _to_passages(hits) -> List[Dict]:
     # normalizamos estructura
     passages = []
     for score, m in hits:
@@ -29,69 +124,171 @@ def _retrieve(query: str, top_k: int = 5) -> List[Dict]:
             "score": score,
             "text": m["text"],
             "source": m.get("source"),
-            "chunk_id": m.get("chunk_id")
+            "chunk_id": m.get("chunk_id"),
+            "char_start": m.get("char_start"),
+            "char_end": m.get("char_end"),
+            "page": m.get("page"),
+            "page_end": m.get("page_end"),
         })
     return passages
 
-def _generate_with_ollama(query: str, passages: List[Dict]) -> str:
-    prompt = (
-        "Eres un sistema que responde con precisión usando SOLO los pasajes proporcionados.\n"
-        "Si falta información, admite la incertidumbre. Cita las fuentes al final como [n].\n\n"
-        "Pregunta:\n"
-        f"{query}\n\n"
-        "Pasajes:\n"
-    )
-    for i, p in enumerate(passages, 1):
-        prompt += f"[{i}] (source: {p['source']} chunk:{p['chunk_id']}) {p['text']}\n\n"
+def _retrieve(query: str, top_k: int = 5, filters: Optional[SearchFilter] = None) -> List[Dict]:
+    return _retrieve_many([query], top_k=top_k, filters=filters)[0]
 
-    payload = {
-        "model": settings.ollama_model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.1}
-    }
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            r = client.post(f"{settings.ollama_base_url}/api/generate", json=payload)
-            r.raise_for_status()
-            data = r.json()
-            return data.get("response", "").strip()
-    except Exception:
-        # fallback en caso de que Ollama no esté levantado
-        return ""
+def _retrieve_many(queries: List[str], top_k: int = 5, filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+    with span("encode"):
+        query_vecs = get_embeddings().encode_queries(queries)
+    return _search(queries, query_vecs, top_k=top_k, filters=filters)
+
+def _search(queries: List[str], query_vecs: np.ndarray, top_k: int = 5,
+            filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+    reranker = get_reranker()
+    if reranker is None:
+        return _candidates(queries, query_vecs, top_k, filters)
+    # Sobremuestreo: el cross-encoder elige los top_k entre rerank_candidates
+    candidates = _candidates(queries, query_vecs, max(settings.rerank_candidates, top_k), filters)
+    with span("rerank"):
+        return [reranker.rerank(q, passages, top_k) for q, passages in zip(queries, candidates)]
+
+def _candidates(queries: List[str], query_vecs: np.ndarray, top_k: int,
+                filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+    store = get_store()
+    sparse = get_sparse() if settings.hybrid_search else None
+    backend = settings.rag_backend.lower()
+    if sparse is None:
+        with span("search.dense", backend=backend):
+            dense = store.search_many(query_vecs, top_k=top_k, filters=filters)
+        return [_to_passages(hits) for hits in dense]
+    # Híbrida: candidatos densos y BM25 por separado, fusionados por rango (RRF)
+    depth = max(settings.hybrid_candidates, top_k)
+    with span("search.dense", backend=backend):
+        dense = store.search_many(query_vecs, top_k=depth, filters=filters)
+    with span("search.sparse"):
+        lexical = [sparse.search(q, top_k=depth) for q in queries]
+    with span("fuse", backend=backend):
+        return [_fuse(store, hits, lex, top_k, filters) for hits, lex in zip(dense, lexical)]
+
+def _fuse(store, dense_hits, sparse_hits, top_k: int, filters: Optional[SearchFilter] = None) -> List[Dict]:
+    metas = {m["id"]: m for _, m in dense_hits}
+    if filters is not None:
+        # BM25 no conoce los metadatos: sus candidatos se filtran con el payload del store
+        extra = store.get_many([i for _, i in sparse_hits if i not in metas])
+        metas.update({m["id"]: m for m in extra if m is not None and filters.matches(m)})
+        sparse_hits = [(score, i) for score, i in sparse_hits if i in metas]
+    fused = rrf_fuse([[m["id"] for _, m in dense_hits], [i for _, i in sparse_hits]], k=settings.rrf_k, top_k=top_k)
+    # Los aciertos solo léxicos se leen del store por id
+    missing = [i for _, i in fused if i not in metas]
+    metas.update({m["id"]: m for m in store.get_many(missing) if m is not None})
+    fused = [(rrf, i) for rrf, i in fused if i in metas]
+    # score conserva la similitud densa (None si solo lo encontró BM25); el valor RRF va en rrf_score
+    dense_scores = {m["id"]: score for score, m in dense_hits}
+    passages = _to_passages([(dense_scores.get(i), metas[i]) for _, i in fused])
+    for p, (rrf, _) in zip(passages, fused):
+        p["rrf_score"] = rrf
+    return passages
 
 def _generate_stub(query: str, passages: List[Dict]) -> str:
     # Estrategia extractiva: selecciona 2-3 pasajes más relevantes y los presenta con contexto y citas.
     selected = passages[:3]
     body = []
     for i, p in enumerate(selected, 1):
-        body.append(f"- Evidencia {i}: {p['text'][:500]} [...] (fuente: {p['source']}, chunk {p['chunk_id']})")
+        where = f", pág. {p['page']}" if p.get("page") else ""
+        body.append(f"- Evidencia {i}: {p['text'][:500]} [...] (fuente: {p['source']}, chunk {p['chunk_id']}{where})")
     return (
         "Respuesta basada en evidencia local (modo stub, sin LLM generativo):\n"
         + "\n".join(body)
         + "\nConclusión: La respuesta se ha construido extrayendo los fragmentos más relevantes de tus documentos."
     )
 
-def answer(query: str, top_k: int = 5) -> Dict:
-    passages = _retrieve(query, top_k=top_k)
+def answer(query: str, top_k: int = 5, filters: Optional[SearchFilter] = None) -> Dict:
+    cache = get_answer_cache()
+    if not cache.enabled:
+        return {**_answer_from_passages(query, _retrieve(query, top_k=top_k, filters=filters)), "cached": None}
+    version = index_version()
+    scope = (top_k, filters)
+    with span("cache.lookup", cache="rag"):
+        hit = cache.get(query, scope, version)
+    if hit is not None:
+        return {**hit, "query": query, "cached": "exact"}
+    with span("encode"):
+        qv = get_embeddings().encode_queries([query])
+    with span("cache.lookup", cache="rag"):
+        hit = cache.get_similar(qv[0], scope, version)
+    if hit is not None:
+        return {**hit, "query": query, "cached": "semantic", "cached_query": hit["query"]}
+    res = _answer_from_passages(query, _search([query], qv, top_k=top_k, filters=filters)[0])
+    # Una respuesta de fallback (Ollama caído o saturado) no se cachea: se reintenta la próxima vez
+    if res["mode"] == settings.generator_mode.lower():
+        cache.put(query, scope, version, res, qv[0])
+    return {**res, "cached": None}
+
+def answer_many(queries: List[str], top_k: int = 5, filters: Optional[SearchFilter] = None) -> List[Dict]:
+    passages = _retrieve_many(queries, top_k=top_k, filters=filters)
+    return [_answer_from_passages(q, p) for q, p in zip(queries, passages)]
+
+def _citations(passages: List[Dict]) -> List[Dict]:
+    citations = []
+    for i, p in enumerate(passages, 1):
+        citations.append({
+            "id": i, "source": p["source"], "chunk_id": p["chunk_id"], "score": p["score"],
+            "rrf_score": p.get("rrf_score"),  # solo con búsqueda híbrida
+            # solo con RERANK_ENABLED: logit del cross-encoder y posición antes de reordenar
+            "rerank_score": p.get("rerank_score"), "dense_rank": p.get("dense_rank"),
+            # Posición del pasaje en el texto extraído del documento (y páginas, en PDF)
+            "char_start": p.get("char_start"), "char_end": p.get("char_end"),
+            "page": p.get("page"), "page_end": p.get("page_end"),
+        })
+    return citations
+
+def _answer_from_passages(query: str, passages: List[Dict]) -> Dict:
+    prompt_tokens = None
     if settings.generator_mode.lower() == "ollama":
-        out = _generate_with_ollama(query, passages)
+        with span("prompt"):
+            ctx = build_context(query, passages)
+        with span("generate", generator="ollama"):
+            out = ollama.generate(ctx.prompt)
         if not out:
             out = _generate_stub(query, passages)
             mode = "stub"
         else:
-            mode = "ollama"
+            # Las citas [n] del modelo se refieren a los pasajes que entraron en el prompt
+            mode, passages, prompt_tokens = "ollama", ctx.passages, ctx.prompt_tokens
     else:
-        out = _generate_stub(query, passages)
+        with span("generate", generator="stub"):
+            out = _generate_stub(query, passages)
         mode = "stub"
 
-    citations = []
-    for i, p in enumerate(passages, 1):
-        citations.append({"id": i, "source": p["source"], "chunk_id": p["chunk_id"], "score": p["score"]})
-
     return {
         "query": query,
         "answer": out,
         "mode": mode,
-        "citations": citations
+        "citations": _citations(passages),
+        "prompt_tokens": prompt_tokens,
     }
+
+async def astream_answer(query: str, top_k: int = 5, filters: Optional[SearchFilter] = None) -> AsyncIterator[Dict]:
+    """
+    Variante en streaming de answer():
+    - {"event": "meta", "query", "citations", "prompt_tokens"} en cuanto termina la recuperación
+    - {"event": "token", "text"} por cada fragmento generado
+    - {"event": "done", "answer", "mode"} al final
+    """
+    # Embedding + búsqueda son CPU: fuera del event loop
+    passages = await asyncio.to_thread(run_traced, _retrieve, query, top_k, filters)
+    ctx = build_context(query, passages) if settings.generator_mode.lower() == "ollama" else None
+    if ctx is None:
+        yield {"event": "meta", "query": query, "citations": _citations(passages), "prompt_tokens": None}
+    else:
+        yield {"event": "meta", "query": query, "citations": _citations(ctx.passages), "prompt_tokens": ctx.prompt_tokens}
+
+    parts: List[str] = []
+    if ctx is not None:
+        async for token in ollama.astream(ctx.prompt):
+            parts.append(token)
+            yield {"event": "token", "text": token}
+    if parts:
+        yield {"event": "done", "answer": "".join(parts).strip(), "mode": "ollama"}
+        return
+    out = _generate_stub(query, passages)
+    yield {"event": "token", "text": out}
+    yield {"event": "done", "answer": out, "mode": "stub"}
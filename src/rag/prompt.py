@@ -0,0 +1,120 @@
+"""
+Contexto del generador con presupuesto de tokens.
+
+En CPU el prefill de Ollama (procesar el prompt) domina la latencia, y crece con cada token
+de contexto. build_context():
+- cuenta tokens reales con tiktoken (PROMPT_TOKENIZER); si el BPE no está disponible (sin red
+  ni caché local) usa una aproximación por trozos de palabra de hasta 4 caracteres;
+- quita el texto repetido entre chunks consecutivos de la misma fuente (el solape de la
+  ventana deslizante de chunk_text) y los pasajes idénticos;
+- empaqueta los pasajes por orden de relevancia hasta PROMPT_MAX_TOKENS, recortando el
+  último si queda sitio útil (PROMPT_MIN_PASSAGE_TOKENS) y descartando el resto.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import re
+import threading
+from . import ollama
+from ..app.config import settings
+
+_APPROX = re.compile(r"\w{1,4}|[^\w\s]")
+_WORD = re.compile(r"\S+")
+_ENCODERS: Dict[str, object] = {}  # nombre -> encoder de tiktoken (None si no se pudo cargar)
+_enc_lock = threading.Lock()
+
+def get_encoder(name: Optional[str] = None):
+    name = name or settings.prompt_tokenizer
+    if name not in _ENCODERS:
+        with _enc_lock:
+            if name not in _ENCODERS:
+                try:
+                    import tiktoken
+                    _ENCODERS[name] = tiktoken.get_encoding(name)
+                except Exception:
+                    _ENCODERS[name] = None
+    return _ENCODERS[name]
+
+def count_tokens(text: str, encoding: Optional[str] = None) -> int:
+    enc = get_encoder(encoding)
+    if enc is None:
+        return len(_APPROX.findall(text))
+    return len(enc.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int, encoding: Optional[str] = None) -> str:
+    enc = get_encoder(encoding)
+    if enc is None:
+        for i, m in enumerate(_APPROX.finditer(text)):
+            if i == max_tokens:
+                return text[:m.start()].rstrip()
+        return text
+    ids = enc.encode(text, disallowed_special=())
+    return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+
+def _overlap(a: List[str], b: List[str]) -> int:
+    """Número de palabras del final de a que repiten el principio de b."""
+    if not a or not b:
+        return 0
+    for i in range(max(len(a) - len(b), 0), len(a)):
+        if a[i] == b[0] and a[i:] == b[:len(a) - i]:
+            return len(a) - i
+    return 0
+
+def dedupe_passages(passages: List[Dict]) -> Tuple[List[Dict], int]:
+    """Pasajes sin solapes entre chunks vecinos de la misma fuente; devuelve también las palabras quitadas."""
+    seen: Dict[Tuple, List[str]] = {}
+    texts = set()
+    out, removed = [], 0
+    for p in passages:
+        if p["text"] in texts:
+            removed += len(_WORD.findall(p["text"]))
+            continue
+        texts.add(p["text"])
+        spans = [m.span() for m in _WORD.finditer(p["text"])]
+        words = [p["text"][s:e] for s, e in spans]
+        cid = p.get("chunk_id")
+        head = tail = 0
+        if isinstance(cid, int):
+            prev = seen.get((p.get("source"), cid - 1))
+            nxt = seen.get((p.get("source"), cid + 1))
+            head = _overlap(prev, words) if prev else 0
+            tail = _overlap(words[head:], nxt) if nxt else 0
+            seen[(p.get("source"), cid)] = words
+        keep = spans[head:len(spans) - tail]
+        removed += len(spans) - len(keep)
+        if not keep:
+            continue
+        if head or tail:
+            p = {**p, "text": p["text"][keep[0][0]:keep[-1][1]]}
+        out.append(p)
+    return out, removed
+
+@dataclass
+class PromptContext:
+    prompt: str
+    passages: List[Dict]   # pasajes incluidos, numerados [1..n] en el prompt
+    prompt_tokens: int
+    dropped: int           # pasajes que no cupieron en el presupuesto
+    dedup_words: int       # palabras repetidas eliminadas
+
+def build_context(query: str, passages: List[Dict], max_tokens: Optional[int] = None,
+                  min_passage_tokens: Optional[int] = None, encoding: Optional[str] = None) -> PromptContext:
+    budget = settings.prompt_max_tokens if max_tokens is None else max_tokens
+    min_tokens = settings.prompt_min_passage_tokens if min_passage_tokens is None else min_passage_tokens
+    unique, removed = dedupe_passages(passages)
+    used = count_tokens(ollama.prompt_header(query), encoding)
+    packed: List[Dict] = []
+    for p in unique:
+        i = len(packed) + 1
+        cost = count_tokens(ollama.format_passage(i, p), encoding)
+        if budget <= 0 or used + cost <= budget:
+            packed.append(p)
+            used += cost
+            continue
+        # No cabe entero: se recorta el texto al sitio que queda (descontando la cabecera [i] (source...))
+        room = budget - used - (cost - count_tokens(p["text"], encoding))
+        if room >= min_tokens:
+            packed.append({**p, "text": truncate_tokens(p["text"], room, encoding)})
+        break
+    prompt = ollama.build_prompt(query, packed)
+    return PromptContext(prompt, packed, count_tokens(prompt, encoding), len(unique) - len(packed), removed)
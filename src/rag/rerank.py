@@ -0,0 +1,135 @@
+"""
+Reordenado de candidatos con un cross-encoder local (CPU, sentence-transformers).
+
+El pipeline pide RERANK_CANDIDATES pasajes al retriever y el cross-encoder, que lee
+pregunta y pasaje juntos, se queda con los top_k mejores: contextos más cortos y más
+precisos que subir top_k, y por tanto prompts (y generaciones) más rápidos.
+
+- Puntuación por lotes (RERANK_BATCH_SIZE pares por forward).
+- Caché LRU de puntuaciones por (consulta normalizada, hash del texto del pasaje).
+- Presupuesto de latencia (RERANK_BUDGET_MS): antes de cada lote se estima su coste con
+  la media móvil del tiempo por par; si no cabe, se abandona el reordenado y se devuelve
+  el orden denso (las puntuaciones ya calculadas quedan en caché para la próxima vez).
+  Tras PROBE_EVERY peticiones degradadas seguidas, el primer lote se ejecuta igualmente
+  y su medida reemplaza la estimación: un lote lento puntual no desactiva el reordenado
+  para siempre.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from .emb_cache import normalize_text
+
+class CrossEncoderReranker:
+    PROBE_EVERY = 8  # peticiones degradadas seguidas antes de volver a medir con un lote real
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        batch_size: int = 16,
+        budget_ms: float = 500.0,
+        cache_size: int = 10_000,
+        max_length: int = 512,
+    ):
+        self.model_name = model_name
+        self.batch_size = max(batch_size, 1)
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, bytes], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pair_s: Optional[float] = None  # media móvil de segundos por par
+        self._skips = 0  # peticiones degradadas desde el último lote medido
+        self.reranked = 0
+        self.degraded = 0
+        self.cache_hits = 0
+        self.pairs_scored = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    @staticmethod
+    def _key(query: str, text: str) -> Tuple[str, bytes]:
+        return normalize_text(query).lower(), hashlib.blake2b(text.encode("utf-8"), digest_size=12).digest()
+
+    def _cached(self, keys: List[Tuple[str, bytes]]) -> List[Optional[float]]:
+        out = []
+        with self._lock:
+            for k in keys:
+                score = self._scores.get(k)
+                if score is not None:
+                    self._scores.move_to_end(k)
+                out.append(score)
+        return out
+
+    def _remember(self, keys: List[Tuple[str, bytes]], scores: List[float]) -> None:
+        with self._lock:
+            for k, s in zip(keys, scores):
+                self._scores[k] = s
+                self._scores.move_to_end(k)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def _predict(self, pairs: List[Tuple[str, str]], fresh: bool = False) -> List[float]:
+        # fresh: la medida sustituye a la media (sondeo tras degradar; la media quedó obsoleta)
+        t0 = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        per_pair = (time.perf_counter() - t0) / len(pairs)
+        self._pair_s = per_pair if self._pair_s is None or fresh else 0.8 * self._pair_s + 0.2 * per_pair
+        return [float(s) for s in scores]
+
+    def rerank(self, query: str, passages: List[Dict], top_k: int) -> List[Dict]:
+        """Los top_k pasajes según el cross-encoder, o los top_k en orden denso si no hay tiempo."""
+        if len(passages) <= 1:
+            return passages[:top_k]
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        keys = [self._key(query, p["text"]) for p in passages]
+        scores = self._cached(keys)
+        missing = [i for i, s in enumerate(scores) if s is None]
+        with self._lock:
+            self.cache_hits += len(passages) - len(missing)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            probe = start == 0 and self._skips >= self.PROBE_EVERY
+            if not probe and self._pair_s is not None and time.perf_counter() + self._pair_s * len(batch) > deadline:
+                with self._lock:
+                    self.degraded += 1
+                    self._skips += 1
+                return passages[:top_k]
+            new = self._predict([(query, passages[i]["text"]) for i in batch], fresh=probe)
+            self._remember([keys[i] for i in batch], new)
+            for i, s in zip(batch, new):
+                scores[i] = s
+            with self._lock:
+                self.pairs_scored += len(batch)
+                self._skips = 0
+        order = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)[:top_k]
+        with self._lock:
+            self.reranked += 1
+        # score conserva la similitud densa; el logit del cross-encoder va aparte
+        return [{**passages[i], "rerank_score": scores[i], "dense_rank": i + 1} for i in order]
+
+    def warmup(self) -> None:
+        # Carga el modelo y hace el primer forward. No alimenta la estimación: un lote de un
+        # par incluye el coste fijo de la llamada y sobreestimaría el tiempo por par
+        self.model.predict([("warmup", "warmup")], batch_size=1, show_progress_bar=False)
+
+    def stats(self) -> Dict:
+        return {
+            "reranked": self.reranked,
+            "degraded": self.degraded,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self._scores),
+            "ms_per_pair": round(self._pair_s * 1000, 3) if self._pair_s is not None else None,
+        }
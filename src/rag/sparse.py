@@ -0,0 +1,274 @@
+"""
+Índice invertido BM25 en disco, complemento léxico de la búsqueda densa.
+Acierta donde los embeddings fallan: términos exactos (SKUs, números de póliza, ids de ticket).
+
+Formato (directorio processed_dir/bm25, arrays .npy abiertos con mmap):
+- vocab.npy   uint64, hash (blake2b-8) de cada término, ordenado -> búsqueda con searchsorted
+- indptr.npy  int64, posting list del término t = docs[indptr[t]:indptr[t+1]] (CSR)
+- docs.npy    int32, posición del documento (fila de ids.npy)
+- tfs.npy     uint16, frecuencia del término en el documento
+- doclen.npy  uint32, longitud en términos de cada documento
+- ids.npy     id del chunk en el vector store
+Ocupa ~6 bytes por posting (+16 por término) y ningún objeto Python por término.
+
+La ingesta incremental no re-tokeniza lo ya indexado: las postings vigentes se
+filtran por bloques desde los arrays mapeados y se fusionan con las de los chunks
+nuevos con operaciones vectorizadas, sin cargar el índice anterior en memoria.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from functools import lru_cache
+import hashlib
+import json
+import re
+import shutil
+import numpy as np
+
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT = re.compile(r"[-./]")
+_MAX_TF = np.iinfo("uint16").max
+
+def tokenize(text: str) -> List[str]:
+    """Términos en minúsculas; los compuestos (ABC-123, 2023/45) cuentan entero y por partes."""
+    out = []
+    for tok in _TOKEN.findall(text.lower()):
+        out.append(tok)
+        parts = _SPLIT.split(tok)
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+@lru_cache(maxsize=1 << 18)
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _hashes(terms: List[str]) -> np.ndarray:
+    return np.fromiter((term_hash(t) for t in terms), dtype="uint64", count=len(terms))
+
+class SparseIndex:
+    """Índice BM25 de solo lectura (arrays mapeados en memoria)."""
+    FILES = ("vocab", "indptr", "docs", "tfs", "doclen", "ids")
+
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in self.FILES}
+        self.vocab, self.indptr, self.docs = arrays["vocab"], arrays["indptr"], arrays["docs"]
+        self.tfs, self.doclen, self.ids = arrays["tfs"], arrays["doclen"], arrays["ids"]
+        self.k1 = k1
+        avgdl = float(self.doclen.mean()) if len(self.doclen) else 1.0
+        # Normalización por longitud precalculada: k1 * (1 - b + b * dl / avgdl)
+        self._norm = (k1 * (1 - b + b * np.asarray(self.doclen, dtype="float32") / max(avgdl, 1.0))).astype("float32")
+        self._version = version_of(path)
+
+    @classmethod
+    def load(cls, path: Path, k1: float = 1.2, b: float = 0.75) -> Optional["SparseIndex"]:
+        if not (path / "meta.json").exists():
+            return None
+        return cls(path, k1=k1, b=b)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def version(self):
+        return self._version
+
+    def stale(self) -> bool:
+        return version_of(self.path) != self._version
+
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[float, object]]:
+        """Devuelve [(score BM25, id de chunk)] ordenados de mayor a menor."""
+        n = len(self.ids)
+        terms = np.unique(_hashes(tokenize(query)))
+        if not n or not len(terms) or not len(self.vocab):
+            return []
+        pos = np.searchsorted(self.vocab, terms)
+        inside = pos < len(self.vocab)
+        pos, terms = pos[inside], terms[inside]
+        pos = pos[self.vocab[pos] == terms]
+        if not len(pos):
+            return []
+        doc_parts, score_parts = [], []
+        for t in pos:
+            lo, hi = int(self.indptr[t]), int(self.indptr[t + 1])
+            docs = np.asarray(self.docs[lo:hi])
+            tf = np.asarray(self.tfs[lo:hi], dtype="float32")
+            idf = np.log1p((n - (hi - lo) + 0.5) / ((hi - lo) + 0.5))
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        uniq, inv = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(score_parts))
+        k = min(top_k, len(uniq))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[j]), self.ids[uniq[j]].item()) for j in best]
+
+def version_of(path: Path):
+    try:
+        st = (path / "meta.json").stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class SparseIndexBuilder:
+    """
+    Construye el índice durante la ingesta: conserva las postings de los chunks vigentes
+    del índice anterior (salvo rebuild) y añade las de los lotes nuevos.
+
+    Las postings anteriores no se cargan en memoria: al cerrar se recorren por bloques desde
+    los arrays mapeados, se filtran y se copian directamente a su posición en el CSR nuevo.
+    En memoria solo quedan las postings de los chunks nuevos y arrays por término/documento.
+    """
+    BLOCK = 1 << 20  # postings por bloque al recorrer el índice anterior
+
+    def __init__(self, path: Path, deleted_ids: List, rebuild: bool, chunks_parquet: Optional[Path] = None):
+        self.path = path
+        self._terms: List[np.ndarray] = []   # hash de término por posting (chunks nuevos)
+        self._docs: List[np.ndarray] = []    # posición de documento por posting
+        self._tfs: List[np.ndarray] = []
+        self._doclen: List[np.ndarray] = []
+        self._ids: List[np.ndarray] = []
+        self._n_docs = 0
+        self._old: Optional[SparseIndex] = None
+        self._remap: Optional[np.ndarray] = None  # posición anterior -> nueva (-1 si se borra)
+        if rebuild:
+            return
+        old = SparseIndex.load(path)
+        if old is not None:
+            self._keep(old, deleted_ids)
+        elif chunks_parquet is not None and chunks_parquet.exists():
+            # Primera ingesta con BM25 sobre un índice ya existente: se indexan los chunks vigentes
+            self._seed(chunks_parquet, deleted_ids)
+
+    def _keep(self, old: SparseIndex, deleted_ids: List) -> None:
+        ids = np.asarray(old.ids)
+        alive = ~np.isin(ids, np.asarray(deleted_ids, dtype=ids.dtype)) if deleted_ids else np.ones(len(ids), bool)
+        self._remap = np.full(len(ids), -1, dtype="int64")
+        self._remap[alive] = np.arange(int(alive.sum()))
+        self._old = old
+        self._doclen.append(np.asarray(old.doclen)[alive])
+        self._ids.append(ids[alive])
+        self._n_docs = int(alive.sum())
+
+    def _old_blocks(self):
+        """(término, documento nuevo, tf) de las postings vigentes del índice anterior, por bloques."""
+        old = self._old
+        indptr = np.asarray(old.indptr)
+        for lo in range(0, len(old.docs), self.BLOCK):
+            hi = min(lo + self.BLOCK, len(old.docs))
+            docs = self._remap[np.asarray(old.docs[lo:hi])]
+            live = docs >= 0
+            terms = np.searchsorted(indptr, np.arange(lo, hi)[live], side="right") - 1
+            yield terms, docs[live], np.asarray(old.tfs[lo:hi])[live]
+
+    def _seed(self, chunks_parquet: Path, deleted_ids: List) -> None:
+        import pyarrow.parquet as pq
+        table = pq.ParquetFile(chunks_parquet)
+        if "id" not in table.schema_arrow.names:
+            return
+        deleted = set(deleted_ids)
+        for batch in table.iter_batches(batch_size=4096, columns=["id", "text"]):
+            cols = batch.to_pydict()
+            keep = [j for j, i in enumerate(cols["id"]) if i not in deleted]
+            self.add([cols["id"][j] for j in keep], [cols["text"][j] for j in keep])
+
+    def add(self, ids: List, texts: List[str]) -> None:
+        if not texts:
+            return
+        terms, docs, tfs, lens = [], [], [], []
+        for j, text in enumerate(texts):
+            toks = tokenize(text)
+            counts = Counter(toks)
+            terms.extend(counts.keys())
+            tfs.extend(counts.values())
+            docs.extend([self._n_docs + j] * len(counts))
+            lens.append(len(toks))
+        self._terms.append(_hashes(terms))
+        self._docs.append(np.asarray(docs, dtype="int64"))
+        self._tfs.append(np.minimum(np.asarray(tfs, dtype="int64"), _MAX_TF).astype("uint16"))
+        self._doclen.append(np.asarray(lens, dtype="uint32"))
+        self._ids.append(np.asarray(ids))
+        self._n_docs += len(texts)
+
+    def close(self) -> None:
+        if not self._n_docs:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        # Postings nuevas ordenadas por (término, documento)
+        terms = np.concatenate(self._terms) if self._terms else np.zeros(0, "uint64")
+        docs = np.concatenate(self._docs) if self._docs else np.zeros(0, "int64")
+        tfs = np.concatenate(self._tfs) if self._tfs else np.zeros(0, "uint16")
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        new_vocab, new_counts = np.unique(terms, return_counts=True)
+
+        # Vocabulario fusionado y tamaño de cada posting list
+        old_vocab = np.asarray(self._old.vocab) if self._old is not None else np.zeros(0, "uint64")
+        old_counts = np.zeros(len(old_vocab), dtype="int64")
+        if self._old is not None:
+            for t, _, _ in self._old_blocks():
+                old_counts += np.bincount(t, minlength=len(old_vocab))
+        vocab = np.union1d(old_vocab[old_counts > 0], new_vocab).astype("uint64")
+        old_pos = np.minimum(np.searchsorted(vocab, old_vocab), max(len(vocab) - 1, 0))
+        new_pos = np.searchsorted(vocab, new_vocab)
+        counts = np.zeros(len(vocab), dtype="int64")
+        np.add.at(counts, old_pos[old_counts > 0], old_counts[old_counts > 0])
+        np.add.at(counts, new_pos, new_counts)
+        indptr = np.zeros(len(vocab) + 1, dtype="int64")
+        np.cumsum(counts, out=indptr[1:])
+
+        # Se escribe en un directorio temporal y se intercambia: los lectores nunca ven un índice a medias
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        total = int(indptr[-1])
+        out_docs = np.lib.format.open_memmap(tmp / "docs.npy", mode="w+", dtype="int32", shape=(total,))
+        out_tfs = np.lib.format.open_memmap(tmp / "tfs.npy", mode="w+", dtype="uint16", shape=(total,))
+        filled = np.zeros(len(vocab), dtype="int64")
+
+        def scatter(pos: np.ndarray, d: np.ndarray, tf: np.ndarray) -> None:
+            # pos (término en el vocabulario nuevo) viene ordenado: cada término es un tramo contiguo
+            if not len(pos):
+                return
+            uniq, first, n = np.unique(pos, return_index=True, return_counts=True)
+            dest = indptr[pos] + filled[pos] + (np.arange(len(pos)) - np.repeat(first, n))
+            out_docs[dest] = d
+            out_tfs[dest] = tf
+            filled[uniq] += n
+
+        # Dentro de cada término, los documentos anteriores preceden a los nuevos
+        if self._old is not None:
+            for t, d, tf in self._old_blocks():
+                scatter(old_pos[t], d, tf)
+        scatter(np.repeat(new_pos, new_counts), docs, tfs)
+        out_docs.flush()
+        out_tfs.flush()
+        del out_docs, out_tfs
+
+        arrays = {
+            "vocab": vocab,
+            "indptr": indptr,
+            "doclen": np.concatenate(self._doclen).astype("uint32"),
+            "ids": np.concatenate(self._ids),
+        }
+        for name, arr in arrays.items():
+            np.save(tmp / f"{name}.npy", arr)
+        meta: Dict = {"docs": self._n_docs, "terms": len(vocab), "postings": total}
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        self._old = None  # suelta los mmap del índice anterior antes del intercambio
+        old = self.path.with_name(self.path.name + ".old")
+        shutil.rmtree(old, ignore_errors=True)
+        if self.path.exists():
+            self.path.rename(old)
+        tmp.rename(self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+def rrf_fuse(rankings: List[List], k: int = 60, top_k: int = 5) -> List[Tuple[float, object]]:
+    """Reciprocal rank fusion: score(d) = sum 1 / (k + rango). Cada ranking es una lista de ids."""
+    scores: Dict = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [(s, d) for d, s in fused]
@@ -1,91 +1,800 @@
 """
 Almacenamiento vectorial local:
 - FAISS (por defecto, sin red)
+- FAISS particionado en N shards con búsqueda en paralelo (faiss_sharded)
 - Qdrant (opcional, vía docker-compose)
-Ambos ofrecen: add(texts, metadatas), search(query_vec, top_k) -> (scores, payloads)
+Todos ofrecen: add(texts, metadatas) -> ids, delete(ids), clear(), search(query_vec, top_k) -> (scores, payloads),
+get_many(ids) -> payloads (con su "id")
+y search_many(query_vecs, top_k): una sola búsqueda matricial para un lote de consultas.
+search/search_many aceptan filters (SearchFilter: fuente, tipo de documento, fechas), que
+cada backend aplica dentro de la búsqueda: sin sobre-pedir resultados ni filtrar después.
+version()/stale() permiten a la API detectar que una ingesta externa ha cambiado el índice.
 """
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from itertools import islice
 import numpy as np
 from pathlib import Path
+import hashlib
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
 
-from .embeddings import Embeddings
+from .chunkstore import ChunkStore, VectorFile
+from .filters import SearchFilter
 
 # FAISS
 import faiss
 import pickle
 
-# Qdrant opcional
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter
+# Qdrant opcional: se importa solo al usar QdrantStore (el cliente tarda en importarse)
+
+log = logging.getLogger(__name__)
 
 class BaseVectorStore:
-    def add(self, texts: List[str], metadatas: List[Dict]) -> None: ...
-    def search(self, query_vec: np.ndarray, top_k: int = 5) -> List[Tuple[float, Dict]]: ...
+    # Con autosave=False los cambios se persisten solo al llamar a save() (ingesta por lotes)
+    autosave: bool = True
+
+    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> List: ...
+    def delete(self, ids: List) -> None: ...
+    def clear(self, dim: Optional[int] = None) -> None: ...
+    def search_many(self, query_vecs: np.ndarray, top_k: int = 5,
+                    filters: Optional[SearchFilter] = None) -> List[List[Tuple[float, Dict]]]: ...
+    def save(self) -> None: ...
+    def get_many(self, ids: List) -> List[Optional[Dict]]: ...
+
+    def version(self):
+        # Versión de los datos cargados (None = desconocida: solo caduca por TTL en cachés)
+        return None
+
+    def stale(self) -> bool:
+        # True si los datos en disco han cambiado desde la carga
+        return False
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5,
+               filters: Optional[SearchFilter] = None) -> List[Tuple[float, Dict]]:
+        return self.search_many(query_vec[:1], top_k=top_k, filters=filters)[0]
+
+INDEX_KINDS = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+PRECISIONS = ("fp32", "fp16", "sq8", "pq")
+
+@dataclass
+class IndexConfig:
+    """Tipo de índice FAISS y parámetros de construcción/búsqueda."""
+    kind: str = "flat"          # flat (exacto) | hnsw | ivf_flat | ivf_pq
+    precision: str = "fp32"     # almacenamiento de vectores: fp32 | fp16 | sq8 (int8) | pq
+    nlist: int = 1024           # IVF: número de listas (se reduce si hay pocos vectores de entrenamiento)
+    pq_m: int = 16              # PQ: subcuantizadores (se ajusta a un divisor de la dimensión)
+    hnsw_m: int = 32            # HNSW: vecinos por nodo
+    ef_construction: int = 200  # HNSW: calidad de construcción
+    nprobe: int = 16            # IVF: listas visitadas por búsqueda
+    ef_search: int = 64         # HNSW: tamaño de la cola de búsqueda
+    train_size: int = 100_000   # IVF/SQ8/PQ: vectores usados para entrenar
+    rerank: int = 0             # >0: guarda vectores float32 en disco y reordena top_k*rerank candidatos
+
+    @classmethod
+    def from_settings(cls) -> "IndexConfig":
+        from ..app.config import settings
+        return cls(
+            kind=settings.faiss_index.lower(),
+            precision=settings.faiss_precision.lower(),
+            nlist=settings.faiss_nlist,
+            pq_m=settings.faiss_pq_m,
+            hnsw_m=settings.faiss_hnsw_m,
+            ef_construction=settings.faiss_ef_construction,
+            nprobe=settings.faiss_nprobe,
+            ef_search=settings.faiss_ef_search,
+            train_size=settings.faiss_train_size,
+            rerank=settings.faiss_rerank,
+        )
+
+    @property
+    def needs_training(self) -> bool:
+        # IVF entrena centroides; SQ8 rangos por dimensión; PQ sus diccionarios
+        return self.kind.startswith("ivf") or self.precision in ("sq8", "pq")
+
+    def build_params(self) -> Dict:
+        # Parámetros que fijan la estructura del índice: si cambian hay que reconstruirlo
+        return {"kind": self.kind, "precision": self.precision, "nlist": self.nlist, "pq_m": self.pq_m,
+                "hnsw_m": self.hnsw_m, "rerank": self.rerank > 0}
+
+def _codec(config: IndexConfig, dim: int, n_train: int) -> str:
+    # Codificación de los vectores almacenados (sintaxis de index_factory)
+    precision = "pq" if config.kind == "ivf_pq" else config.precision
+    if precision == "fp16":
+        return "SQfp16"
+    if precision == "sq8":
+        return "SQ8"
+    if precision == "pq":
+        m = max(d for d in range(1, min(config.pq_m, dim) + 1) if dim % d == 0)
+        nbits = int(min(8, max(1, np.floor(np.log2(max(n_train, 2))))))
+        return f"PQ{m}x{nbits}"
+    return "Flat"
+
+def make_index(config: IndexConfig, dim: int, train: Optional[np.ndarray] = None):
+    """
+    Fábrica de índices FAISS (producto interno: requiere embeddings normalizados).
+    Flat y HNSW van envueltos en IndexIDMap2 para tener ids estables; IVF gestiona ids
+    de forma nativa. IVF, SQ8 y PQ necesitan una muestra de entrenamiento.
+    Memoria por vector (d=384): fp32 1536 B, fp16 768 B, sq8 384 B, pq pq_m B (+ grafo en HNSW).
+    """
+    if config.kind not in INDEX_KINDS:
+        raise ValueError(f"FAISS_INDEX desconocido: {config.kind}. Opciones: {', '.join(INDEX_KINDS)}")
+    if config.precision not in PRECISIONS:
+        raise ValueError(f"FAISS_PRECISION desconocida: {config.precision}. Opciones: {', '.join(PRECISIONS)}")
+    if config.kind == "hnsw" and config.precision == "pq":
+        raise ValueError("HNSW con PQ no admite producto interno en FAISS: usa FAISS_INDEX=ivf_pq")
+    if config.needs_training and (train is None or not len(train)):
+        raise ValueError(f"El índice {config.kind}/{config.precision} necesita vectores de entrenamiento")
+    n = len(train) if train is not None else 0
+    codec = _codec(config, dim, n)
+    if config.kind == "flat":
+        spec = codec
+    elif config.kind == "hnsw":
+        spec = f"HNSW{config.hnsw_m}" + ("" if codec == "Flat" else f",{codec}")
+    else:
+        nlist = min(config.nlist, max(1, n // 39))  # FAISS recomienda >= 39 puntos por centroide
+        spec = f"IVF{nlist},{codec}"
+    index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+    if config.kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = config.ef_construction
+    if config.needs_training:
+        index.train(train)
+    return index if config.kind.startswith("ivf") else faiss.IndexIDMap2(index)
+
+def _base_index(index):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.downcast_index(ivf)
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+def index_kind(index) -> str:
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_pq" if isinstance(base, faiss.IndexIVFPQ) else "ivf_flat"
+    return "hnsw" if isinstance(base, faiss.IndexHNSW) else "flat"
+
+def index_precision(index) -> str:
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "fp32"
+
+def rerank_exact(query_vecs: np.ndarray, ids: np.ndarray, lookup) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reordena candidatos (ids de la búsqueda aproximada, -1 = hueco) por producto interno
+    exacto con sus vectores float32 (lookup(ids) -> matriz). Devuelve (scores, ids).
+    """
+    valid = ids >= 0
+    safe = np.where(valid, ids, 0)
+    cand = np.asarray(lookup(safe.ravel()), dtype="float32").reshape(*ids.shape, -1)
+    scores = np.einsum("qkd,qd->qk", cand, np.asarray(query_vecs, dtype="float32"))
+    scores[~valid] = -np.inf
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def search_params(config: IndexConfig, kind: str, sel=None):
+    # sel: IDSelector opcional (filtros por metadatos), aplicado dentro de la búsqueda
+    extra = {"sel": sel} if sel is not None else {}
+    if kind.startswith("ivf"):
+        return faiss.SearchParametersIVF(nprobe=config.nprobe, **extra)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=config.ef_search, **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+def _file_version(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
 class FaissStore(BaseVectorStore):
-    def __init__(self, dim: int, index_path: Path, meta_path: Path):
-        self.dim = dim
+    """
+    Índice FAISS con ids estables (IndexIDMap2 o ids nativos de IVF), de modo que la
+    ingesta incremental puede borrar y reemplazar los vectores de un documento.
+    Textos y metadatos viven en un ChunkStore mapeado en memoria, direccionado por id.
+
+    El tipo de índice (Flat, HNSW, IVF-Flat, IVF-PQ) sale de IndexConfig. Los IVF se
+    entrenan con los primeros train_size vectores añadidos (o con los que haya al
+    guardar). HNSW no admite borrados: se marcan como huérfanos (sin metadatos), se
+    filtran en la búsqueda y el índice se compacta cuando superan el 25%.
+
+    La precisión de almacenamiento (fp32, fp16, sq8, pq) también sale de IndexConfig. Con
+    rerank > 0 se guardan además los vectores float32 en vectors_path (mmap, en disco) y los
+    top_k*rerank candidatos aproximados se reordenan por producto interno exacto. Si faltan
+    vectores (índice creado sin rerank) se mantiene el orden aproximado, con un aviso.
+
+    Los filtros se resuelven con bitmaps de ids (uno por valor de metadato, cacheados hasta
+    el siguiente cambio) combinados con AND/OR y pasados a FAISS como IDSelectorBitmap.
+    """
+    def __init__(self, dim: Optional[int], index_path: Path, chunks_path: Path, config: Optional[IndexConfig] = None,
+                 vectors_path: Optional[Path] = None):
         self.index_path = index_path
-        self.meta_path = meta_path
+        self.config = config or IndexConfig()
+        self.vectors_path = vectors_path if self.config.rerank > 0 else None
+        self._vectors: Optional[VectorFile] = None
+        self._warned_vectors = False
+        self.chunks = ChunkStore(chunks_path)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []  # (vectores, ids) a la espera de entrenamiento
+        self._bitmaps: Dict[Tuple, np.ndarray] = {}  # (campo, código) -> bitmap de ids
         if index_path.exists():
             self.index = faiss.read_index(str(index_path))
-            self.metadatas: List[Dict] = pickle.loads(meta_path.read_bytes())
+            self._migrate_pickle(index_path.parent / "faiss_meta.pkl")
+            self.dim = self.index.d
+            self.kind = index_kind(self.index)  # el índice en disco manda sobre la configuración
+            self.precision = index_precision(self.index)
         else:
-            self.index = faiss.IndexFlatIP(dim)  # IP requiere embeddings normalizados
-            self.metadatas = []
+            self.dim = dim
+            self.kind = self.config.kind
+            self.precision = self.config.precision
+            # Abrir nunca borra: los chunks en disco pueden ser de una ingesta aún sin guardar
+            # (autosave=False). Sin índice no son buscables; la ingesta los limpia con clear().
+            self.index = self._new_index(dim)
+        self._params = search_params(self.config, self.kind)
+        self._version = _file_version(index_path)
+
+    @property
+    def next_id(self) -> int:
+        return self.chunks.next_id
+
+    @property
+    def vectors(self) -> Optional[VectorFile]:
+        # Vectores float32 para el reordenado exacto (None si rerank está desactivado)
+        if self._vectors is None and self.vectors_path is not None and self.dim is not None:
+            self._vectors = VectorFile(self.vectors_path, self.dim)
+        return self._vectors
+
+    def _new_index(self, dim: Optional[int]):
+        # Sin dimensión conocida (índice vacío y nada que embeber) o IVF/SQ8/PQ sin entrenar: sin índice aún
+        if dim is None or self.config.needs_training:
+            return None
+        return make_index(self.config, dim)
+
+    def _migrate_pickle(self, meta_path: Path) -> None:
+        # Versiones anteriores guardaban los metadatos en un pickle completo
+        if not meta_path.exists():
+            return
+        metadatas = pickle.loads(meta_path.read_bytes())
+        if isinstance(metadatas, list):
+            # Formato más antiguo (posición == id): pasamos a ids explícitos
+            vecs = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else None
+            self.index = make_index(IndexConfig(kind="flat"), self.index.d)
+            if vecs is not None:
+                self.index.add_with_ids(vecs, np.arange(len(vecs), dtype="int64"))
+            self._write_index()
+            metadatas = dict(enumerate(metadatas))
+        self.chunks.clear()
+        ids = sorted(metadatas)
+        self.chunks.put_many(ids, [metadatas[i] for i in ids])
+        meta_path.unlink()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
 
-    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> None:
+    @property
+    def _pending_count(self) -> int:
+        return sum(len(ids) for _, ids in self._pending)
+
+    def _train_pending(self) -> None:
+        if not self._pending:
+            return
+        vecs = np.concatenate([v for v, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending = []
+        rng = np.random.default_rng(0)
+        sample = vecs if len(vecs) <= self.config.train_size else vecs[rng.choice(len(vecs), self.config.train_size, replace=False)]
+        self.index = make_index(self.config, self.dim, sample)
+        self.index.add_with_ids(vecs, ids)
+
+    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> List[int]:
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        if self.index is None and not self.config.needs_training:
+            self.index = self._new_index(self.dim)
         assert embeddings.shape[1] == self.dim
-        self.index.add(embeddings)
-        for i, m in enumerate(metadatas):
-            self.metadatas.append({**m, "text": texts[i]})
-        faiss.write_index(self.index, str(self.index_path))
-        self.meta_path.write_bytes(pickle.dumps(self.metadatas))
-
-    def search(self, query_vec: np.ndarray, top_k: int = 5) -> List[Tuple[float, Dict]]:
-        D, I = self.index.search(query_vec, top_k)
-        out = []
-        for score, idx in zip(D[0], I[0]):
-            if idx < 0 or idx >= len(self.metadatas):
-                continue
-            m = self.metadatas[idx]
-            out.append((float(score), m))
+        ids = np.arange(self.next_id, self.next_id + len(texts), dtype="int64")
+        if self.index is None:
+            self._pending.append((np.ascontiguousarray(embeddings), ids))
+            if self._pending_count >= self.config.train_size:
+                self._train_pending()
+        else:
+            self.index.add_with_ids(embeddings, ids)
+        if self.vectors is not None:
+            self.vectors.put(ids, embeddings)
+        self.chunks.put_many(ids.tolist(), [{**m, "text": t} for m, t in zip(metadatas, texts)])
+        self._bitmaps = {}
+        if self.autosave:
+            self.save()
+        return ids.tolist()
+
+    def delete(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        self.chunks.delete(ids)
+        self._bitmaps = {}
+        if self.index is None:
+            gone = np.asarray(ids, dtype="int64")
+            kept = []
+            for v, i in self._pending:
+                keep = ~np.isin(i, gone)
+                kept.append((v[keep], i[keep]))
+            self._pending = kept
+        elif self.kind != "hnsw":
+            self.index.remove_ids(np.asarray(ids, dtype="int64"))
+        if self.autosave:
+            self.save()
+
+    def _compact_hnsw(self) -> None:
+        # Reconstruye el grafo solo con los vectores vivos (HNSW no soporta remove_ids)
+        live = self.chunks.live_ids()
+        if not len(live):
+            self.index.reset()  # conserva el entrenamiento (SQ8)
+            return
+        vecs = self._live_vectors(live)
+        config = replace(self.config, kind="hnsw", precision=self.precision)
+        self.index = make_index(config, self.dim, vecs[:config.train_size] if config.needs_training else None)
+        self.index.add_with_ids(vecs, live)
+
+    def _live_vectors(self, live: np.ndarray) -> np.ndarray:
+        # Con vectores float32 guardados se evita re-cuantizar vectores ya cuantizados
+        if self.vectors is not None and self.vectors.has(live).all():
+            return self.vectors.get(live)
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)  # ids arbitrarios
+        return self.index.reconstruct_batch(live)
+
+    def rebuild(self, config: Optional[IndexConfig] = None) -> None:
+        """Reconstruye el índice (con otra configuración, si se pasa) a partir de los vectores vivos, conservando ids."""
+        self._train_pending()
+        live = self.chunks.live_ids()
+        vecs = self._live_vectors(live) if self.index is not None and len(live) else None
+        if config is not None:
+            self.config = config
+        self.kind = self.config.kind
+        self.precision = self.config.precision
+        self._params = search_params(self.config, self.kind)
+        self._bitmaps = {}
+        self.index = self._new_index(self.dim)
+        if vecs is not None:
+            if self.index is None:
+                self._pending = [(vecs, live)]  # IVF/SQ8/PQ: se entrena al guardar
+            else:
+                self.index.add_with_ids(vecs, live)
+        self.save()
+
+    def clear(self, dim: Optional[int] = None) -> None:
+        self.dim = dim or self.dim
+        self.kind = self.config.kind
+        self.precision = self.config.precision
+        if self.vectors is not None:
+            self.vectors.clear()
+        self._vectors = None
+        self._params = search_params(self.config, self.kind)
+        self._pending = []
+        self.index = self._new_index(self.dim)
+        self.chunks.clear()
+        self._bitmaps = {}
+        if self.autosave:
+            self.save()
+
+    def save(self) -> None:
+        self._train_pending()
+        if self.index is None:
+            # Índice vacío: no dejamos en disco restos de un índice anterior
+            self.index_path.unlink(missing_ok=True)
+            self._version = None
+            return
+        if self.kind == "hnsw" and self.index.ntotal - len(self.chunks) > 0.25 * max(self.index.ntotal, 1):
+            self._compact_hnsw()
+        # Los chunks ya están en disco (se escriben al añadir); solo falta el índice
+        self._write_index()
+
+    def _write_index(self) -> None:
+        # Escritura atómica: un proceso que recarga el índice nunca ve un fichero a medias
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        faiss.write_index(self.index, str(tmp))
+        os.replace(tmp, self.index_path)
+        self._version = _file_version(self.index_path)
+
+    def version(self):
+        return self._version
+
+    def stale(self) -> bool:
+        return _file_version(self.index_path) != self._version
+
+    def get_many(self, ids: List[int]) -> List[Optional[Dict]]:
+        return self.chunks.get_many(ids)
+
+    def _bitmap(self, key: Tuple, build) -> np.ndarray:
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            bitmap = self._bitmaps[key] = np.packbits(build(), bitorder="little")
+        return bitmap
+
+    def _column(self, field: str) -> np.ndarray:
+        # Columna filtrable alineada con los ids (los ids sin atributos quedan como -1 / 0)
+        n = self.chunks.next_id
+        attrs = self.chunks.attrs()
+        col = np.full(n, 0 if field == "mtime" else -1, dtype="int64")
+        m = min(n, len(attrs))
+        col[:m] = attrs[field][:m]
+        return col
+
+    def filter_bitmap(self, filters: SearchFilter) -> np.ndarray:
+        """Bitmap (orden de bits little, como FAISS) de los ids vivos que cumplen el filtro."""
+        mask = self._bitmap(("live",), self.chunks.live_mask).copy()
+        for field, values in filters.categorical().items():
+            col = None
+            acc = np.zeros_like(mask)
+            for code in self.chunks.codes(field, values):
+                if (field, code) not in self._bitmaps and col is None:
+                    col = self._column(field)
+                acc |= self._bitmap((field, code), lambda: col == code)
+            mask &= acc
+        if filters.mtime_from is not None or filters.mtime_to is not None:
+            mtime = self._column("mtime")
+            cond = np.ones(len(mtime), dtype=bool)
+            if filters.mtime_from is not None:
+                cond &= mtime >= filters.mtime_from
+            if filters.mtime_to is not None:
+                cond &= mtime < filters.mtime_to
+            mask &= np.packbits(cond, bitorder="little")
+        return mask
+
+    def search_many(self, query_vecs: np.ndarray, top_k: int = 5,
+                    filters: Optional[SearchFilter] = None) -> List[List[Tuple[float, Dict]]]:
+        self._train_pending()
+        if self.index is None or not self.index.ntotal:
+            return [[] for _ in range(len(query_vecs))]
+        params = self._params
+        if filters is not None:
+            bitmap = self.filter_bitmap(filters)
+            if not bitmap.any():
+                return [[] for _ in range(len(query_vecs))]
+            params = search_params(self.config, self.kind, faiss.IDSelectorBitmap(bitmap))
+        # Con huérfanos (HNSW) pedimos de más para seguir devolviendo top_k vivos;
+        # con reordenado exacto, rerank veces más candidatos
+        fetch = top_k * self.config.rerank if self.vectors is not None else top_k
+        k = min(fetch + max(self.index.ntotal - len(self.chunks), 0), self.index.ntotal)
+        query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+        D, I = self.index.search(query_vecs, k, params=params)
+        if self.vectors is not None:
+            if self.vectors.has(I[I >= 0]).all():
+                D, I = rerank_exact(query_vecs, I, self.vectors.get)
+            elif not self._warned_vectors:
+                # Índice creado antes de guardar los vectores: el reordenado puntuaría 0 a todos
+                log.warning("Faltan vectores float32 en %s: se mantiene el orden aproximado. "
+                            "Re-ingesta para activar el reordenado exacto.", self.vectors_path)
+                self._warned_vectors = True
+        results = []
+        for scores, idxs in zip(D, I):
+            out = []
+            for score, idx in zip(scores, idxs):
+                m = self.chunks.get(int(idx)) if idx >= 0 else None
+                if m is None:
+                    continue
+                out.append((float(score), m))
+                if len(out) == top_k:
+                    break
+            results.append(out)
+        return results
+
+SHARD_MODES = ("source", "round_robin")
+
+def shard_of(source, n_shards: int) -> int:
+    # Hash estable entre procesos (hash() de Python cambia con PYTHONHASHSEED)
+    digest = hashlib.blake2b(str(source).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_shards
+
+class ShardedFaissStore(BaseVectorStore):
+    """
+    N FaissStore independientes (<root>/shard_XX/) detrás de la interfaz de un único store,
+    para corpus que no caben en un índice (RAM) o que una búsqueda no aprovecha (núcleos).
+
+    - Reparto por hash de la fuente (los chunks de un documento quedan juntos y la ingesta
+      incremental solo toca su shard) o round-robin (shards equilibrados).
+    - Id global = id local * N + shard: entero estable (BM25 y el manifiesto lo guardan) que
+      se traduce sin tablas auxiliares.
+    - Búsqueda scatter-gather: cada shard busca en un pool de hilos (FAISS libera el GIL) y
+      sus top_k, ya ordenados, se mezclan con un heap.
+    - Cada shard se carga, guarda, recarga y reconstruye por separado (reload_shard,
+      rebuild_shard); stale() recarga solo los shards que otro proceso ha cambiado. La lista
+      de shards se sustituye entera (copia) bajo un lock: una búsqueda en curso sigue con
+      la lista que tomó al empezar.
+    N y el modo de reparto se guardan en <root>/shards.json y mandan sobre la configuración al
+    abrir; clear() (reconstrucción en la ingesta) aplica el reparto configurado si es otro.
+    """
+    def __init__(self, root: Path, dim: Optional[int], n_shards: int = 4, shard_by: str = "source",
+                 config: Optional[IndexConfig] = None, workers: int = 0):
+        if shard_by not in SHARD_MODES or n_shards < 1:
+            raise ValueError(f"Reparto no válido: {n_shards} shards por {shard_by!r} (modos: {', '.join(SHARD_MODES)})")
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._configured = (n_shards, shard_by)
+        self._workers = workers
+        layout = root / "shards.json"
+        if layout.exists():
+            info = json.loads(layout.read_text(encoding="utf-8"))
+            n_shards, shard_by = info["shards"], info["shard_by"]
+        self.n_shards = n_shards
+        self.shard_by = shard_by
+        self._write_layout()
+        self.config = config or IndexConfig()
+        self._pool = ThreadPoolExecutor(max_workers=workers or n_shards, thread_name_prefix="faiss-shard")
+        self._lock = threading.Lock()  # serializa recargas, reconstrucciones y cambios de reparto
+        self.shards: List[FaissStore] = list(self._pool.map(lambda i: self._open(i, dim), range(n_shards)))
+        self._next_rr = sum(len(s) for s in self.shards)
+
+    @classmethod
+    def from_settings(cls, processed_dir: Path, dim: Optional[int],
+                      config: Optional[IndexConfig] = None) -> "ShardedFaissStore":
+        from ..app.config import settings
+        return cls(processed_dir / "faiss_shards", dim=dim, n_shards=settings.faiss_shards,
+                   shard_by=settings.faiss_shard_by.lower(), config=config or IndexConfig.from_settings(),
+                   workers=settings.faiss_shard_workers)
+
+    def _write_layout(self) -> None:
+        layout = self.root / "shards.json"
+        tmp = layout.with_name(layout.name + ".tmp")
+        tmp.write_text(json.dumps({"shards": self.n_shards, "shard_by": self.shard_by}), encoding="utf-8")
+        os.replace(tmp, layout)
+
+    def _open(self, i: int, dim: Optional[int]) -> FaissStore:
+        d = self.root / f"shard_{i:02d}"
+        d.mkdir(parents=True, exist_ok=True)
+        store = FaissStore(dim=dim, index_path=d / "faiss.index", chunks_path=d / "faiss_chunks",
+                           config=self.config, vectors_path=d / "faiss_vectors.f32")
+        store.autosave = False  # el store particionado decide cuándo persistir
+        return store
+
+    @property
+    def dim(self) -> Optional[int]:
+        return next((s.dim for s in self.shards if s.dim is not None), None)
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self.shards)
+
+    def _global(self, meta: Optional[Dict], shard: int) -> Optional[Dict]:
+        return None if meta is None else {**meta, "id": meta["id"] * self.n_shards + shard}
+
+    def _split(self, ids: List[int]) -> Dict[int, List[int]]:
+        # posiciones de `ids` agrupadas por shard
+        groups: Dict[int, List[int]] = {}
+        for pos, i in enumerate(ids):
+            groups.setdefault(int(i) % self.n_shards, []).append(pos)
+        return groups
+
+    def _assign(self, metadatas: List[Dict]) -> np.ndarray:
+        if self.shard_by == "source":
+            return np.array([shard_of(m.get("source"), self.n_shards) for m in metadatas], dtype="int64")
+        targets = (self._next_rr + np.arange(len(metadatas))) % self.n_shards
+        self._next_rr += len(metadatas)
+        return targets
+
+    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> List[int]:
+        targets = self._assign(metadatas)
+        ids = np.empty(len(texts), dtype="int64")
+
+        def add_to(shard: int) -> None:
+            pos = np.flatnonzero(targets == shard)
+            local = self.shards[shard].add([texts[p] for p in pos], [metadatas[p] for p in pos], embeddings[pos])
+            ids[pos] = np.asarray(local, dtype="int64") * self.n_shards + shard
+
+        list(self._pool.map(add_to, np.unique(targets).tolist()))
+        if self.autosave:
+            self.save()
+        return ids.tolist()
+
+    def delete(self, ids: List[int]) -> None:
+        for shard, pos in self._split(ids).items():
+            self.shards[shard].delete([int(ids[p]) // self.n_shards for p in pos])
+        if self.autosave:
+            self.save()
+
+    def clear(self, dim: Optional[int] = None) -> None:
+        dim = dim or self.dim
+        with self._lock:
+            if (self.n_shards, self.shard_by) != self._configured:
+                self._relayout()
+            for s in self.shards:
+                s.clear(dim)
+        self._next_rr = 0
+        if self.autosave:
+            self.save()
+
+    def _relayout(self) -> None:
+        # Otro N o modo de reparto: los ids globales cambian, así que solo al vaciar el store
+        for d in self.root.glob("shard_*"):
+            shutil.rmtree(d, ignore_errors=True)
+        self.n_shards, self.shard_by = self._configured
+        self._write_layout()
+        old_pool = self._pool
+        self._pool = ThreadPoolExecutor(max_workers=self._workers or self.n_shards, thread_name_prefix="faiss-shard")
+        old_pool.shutdown(wait=True)
+        self.shards = [self._open(i, None) for i in range(self.n_shards)]
+
+    def save(self) -> None:
+        list(self._pool.map(lambda s: s.save(), self.shards))
+
+    def reload_shard(self, i: int) -> None:
+        """Vuelve a cargar el shard i desde disco (p. ej. reconstruido por otro proceso)."""
+        with self._lock:
+            self._replace({i: self._open(i, self.dim)})
+
+    def _replace(self, fresh: Dict[int, FaissStore]) -> None:
+        # Copia y asignación de la lista (atómica): nunca se muta la que usa una búsqueda
+        shards = list(self.shards)
+        for i, store in fresh.items():
+            shards[i] = store
+        self.shards = shards
+
+    def rebuild_shard(self, i: int, config: Optional[IndexConfig] = None) -> None:
+        """
+        Reconstruye solo el índice del shard i (con otra configuración, si se pasa), conservando ids,
+        a partir de lo guardado en disco. Se construye en un FaissStore nuevo y se sustituye como en
+        reload_shard: las búsquedas en curso terminan sobre el anterior.
+        """
+        with self._lock:
+            fresh = self._open(i, self.dim)
+            fresh.rebuild(config)
+            self._replace({i: fresh})
+
+    def version(self):
+        return tuple(s.version() for s in self.shards)
+
+    def stale(self) -> bool:
+        """Recarga aquí mismo los shards cambiados en disco; True si ha recargado alguno (cambia version())."""
+        if not any(s.stale() for s in self.shards):
+            return False
+        with self._lock:
+            dim = self.dim
+            fresh = {i: self._open(i, dim) for i, s in enumerate(self.shards) if s.stale()}
+            if fresh:
+                self._replace(fresh)
+        return bool(fresh)
+
+    def get_many(self, ids: List[int]) -> List[Optional[Dict]]:
+        out: List[Optional[Dict]] = [None] * len(ids)
+        for shard, pos in self._split(ids).items():
+            metas = self.shards[shard].get_many([int(ids[p]) // self.n_shards for p in pos])
+            for p, m in zip(pos, metas):
+                out[p] = self._global(m, shard)
         return out
 
+    def search_many(self, query_vecs: np.ndarray, top_k: int = 5,
+                    filters: Optional[SearchFilter] = None) -> List[List[Tuple[float, Dict]]]:
+        query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+        parts = list(self._pool.map(
+            lambda s: s.search_many(query_vecs, top_k=top_k, filters=filters), self.shards))
+        results = []
+        for q in range(len(query_vecs)):
+            # Cada lista ya viene ordenada por score: mezcla de k vías y corte en top_k
+            ranked = [[(score, shard, m) for score, m in part[q]] for shard, part in enumerate(parts)]
+            merged = islice(heapq.merge(*ranked, key=lambda h: -h[0]), top_k)
+            results.append([(score, self._global(m, shard)) for score, shard, m in merged])
+        return results
+
+# Espacio de nombres para ids deterministas: el mismo (source, chunk_id) siempre es el mismo punto
+QDRANT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "rag-bi/chunks")
+
+def point_id(source: str, chunk_id) -> str:
+    return str(uuid.uuid5(QDRANT_ID_NAMESPACE, f"{source}#{chunk_id}"))
+
 class QdrantStore(BaseVectorStore):
-    def __init__(self, collection: str = "rag_chunks", host="127.0.0.1", port=6333, dim: int = 384):
-        self.client = QdrantClient(host=host, port=port)
+    """
+    Colección Qdrant (distancia coseno) con ids deterministas derivados de (source, chunk_id):
+    re-ingerir un documento sobrescribe sus puntos en lugar de duplicarlos.
+    Las subidas van por upload_collection en lotes de batch_size con parallel procesos,
+    preferentemente por gRPC. location=":memory:" (o una ruta) usa el modo local sin servidor.
+    """
+    def __init__(self, collection: str = "rag_chunks", host="127.0.0.1", port=6333, dim: int = 384,
+                 grpc_port: int = 6334, prefer_grpc: bool = True, location: Optional[str] = None,
+                 batch_size: int = 256, parallel: int = 1):
+        from qdrant_client import QdrantClient
+        if location:
+            self.client = QdrantClient(location=location)
+        else:
+            self.client = QdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc)
         self.collection = collection
+        self.dim = dim
+        self.batch_size = batch_size
+        self.parallel = parallel
         # Crea colección si no existe
-        if collection not in [c.name for c in self.client.get_collections().collections]:
-            self.client.recreate_collection(
-                collection_name=collection,
-                vectors_config=VectorParams(size=dim, distance=Distance.COSINE)
-            )
-
-    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> None:
-        points = []
-        for i in range(len(texts)):
-            payload = {**metadatas[i], "text": texts[i]}
-            points.append(PointStruct(id=None, vector=embeddings[i].tolist(), payload=payload))
-        self.client.upsert(collection_name=self.collection, points=points)
-
-    def search(self, query_vec: np.ndarray, top_k: int = 5) -> List[Tuple[float, Dict]]:
-        res = self.client.search(
+        if not self.client.collection_exists(collection):
+            self._create(dim)
+
+    @classmethod
+    def from_settings(cls, dim: int) -> "QdrantStore":
+        from ..app.config import settings
+        return cls(
+            collection=settings.qdrant_collection,
+            host=settings.qdrant_host,
+            port=settings.qdrant_port,
+            grpc_port=settings.qdrant_grpc_port,
+            prefer_grpc=settings.qdrant_prefer_grpc,
+            location=settings.qdrant_location or None,
+            dim=dim,
+            batch_size=settings.qdrant_batch_size,
+            parallel=settings.qdrant_parallel,
+        )
+
+    def _create(self, dim: int) -> None:
+        from qdrant_client.models import Distance, PayloadSchemaType, VectorParams
+        if self.client.collection_exists(self.collection):
+            self.client.delete_collection(self.collection)
+        self.client.create_collection(
             collection_name=self.collection,
-            query_vector=query_vec[0].tolist(),
-            limit=top_k
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE)
         )
-        out = []
-        for p in res:
-            out.append((1 - float(p.score), p.payload))  # COSINE -> 1 - score como "distancia"
-        return out
+        # Índices de payload para que los filtros no recorran la colección entera
+        for field, schema in (("source", PayloadSchemaType.KEYWORD), ("doc_type", PayloadSchemaType.KEYWORD),
+                              ("mtime", PayloadSchemaType.INTEGER)):
+            self.client.create_payload_index(self.collection, field_name=field, field_schema=schema)
+
+    def add(self, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray) -> List[str]:
+        ids = [point_id(m["source"], m["chunk_id"]) if "source" in m and "chunk_id" in m else str(uuid.uuid4())
+               for m in metadatas]
+        # El cliente trocea el array numpy en lotes; sin listas de PointStruct ni .tolist() por vector
+        self.client.upload_collection(
+            collection_name=self.collection,
+            vectors=np.ascontiguousarray(embeddings, dtype="float32"),
+            payload=({**m, "text": t} for m, t in zip(metadatas, texts)),
+            ids=ids,
+            batch_size=self.batch_size,
+            parallel=self.parallel,
+            wait=True,
+        )
+        return ids
+
+    def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        from qdrant_client.models import PointIdsList
+        self.client.delete(collection_name=self.collection, points_selector=PointIdsList(points=list(ids)))
+
+    def clear(self, dim: Optional[int] = None) -> None:
+        self.dim = dim or self.dim
+        self._create(self.dim)
+
+    def search_many(self, query_vecs: np.ndarray, top_k: int = 5,
+                    filters: Optional[SearchFilter] = None) -> List[List[Tuple[float, Dict]]]:
+        from qdrant_client.models import SearchRequest
+        qfilter = filters.to_qdrant() if filters is not None else None
+        requests = [SearchRequest(vector=q.tolist(), limit=top_k, filter=qfilter, with_payload=True) for q in query_vecs]
+        res = self.client.search_batch(collection_name=self.collection, requests=requests)
+        # COSINE -> 1 - score como "distancia"
+        return [[(1 - float(p.score), {**p.payload, "id": str(p.id)}) for p in hits] for hits in res]
+
+    def get_many(self, ids: List[str]) -> List[Optional[Dict]]:
+        points = {str(p.id): p for p in self.client.retrieve(collection_name=self.collection, ids=list(ids), with_payload=True)}
+        return [{**points[i].payload, "id": i} if i in points else None for i in map(str, ids)]
+
+def has_local_index(backend: str, processed_dir: Path) -> bool:
+    """True si hay un índice FAISS en disco (su dimensión manda sobre la del modelo)."""
+    if backend.lower() == "faiss_sharded":
+        return any((processed_dir / "faiss_shards").glob("shard_*/faiss.index"))
+    return backend.lower() != "qdrant" and (processed_dir / "faiss.index").exists()
 
-def build_store(backend: str, dim: int, processed_dir: Path):
+def build_store(backend: str, dim: Optional[int], processed_dir: Path, index_config: Optional[IndexConfig] = None):
     if backend.lower() == "qdrant":
-        return QdrantStore(dim=dim)
+        return QdrantStore.from_settings(dim=dim or 384)
+    if backend.lower() == "faiss_sharded":
+        return ShardedFaissStore.from_settings(processed_dir, dim=dim, config=index_config)
     # FAISS por defecto
     return FaissStore(dim=dim,
                       index_path=processed_dir / "faiss.index",
-                      meta_path=processed_dir / "faiss_meta.pkl")
+                      chunks_path=processed_dir / "faiss_chunks",
+                      config=index_config or IndexConfig.from_settings(),
+                      vectors_path=processed_dir / "faiss_vectors.f32")
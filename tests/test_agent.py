@@ -0,0 +1,111 @@
+import asyncio
+import time
+import pytest
+import src.agent.orchestrator as orch
+from src.app.config import settings
+from src.rag.answer_cache import AnswerCache
+
+_data_version = orch.data_version
+
+QUERY = "Ventas por región y, según los documentos, política de devoluciones"
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    # Caché nueva por test y versión fija (no carga índice ni motor BI)
+    monkeypatch.setattr(orch, "_cache", AnswerCache("agent_test", max_entries=16, ttl=60))
+    monkeypatch.setattr(orch, "data_version", lambda route: 1)
+    monkeypatch.setattr(settings, "generator_mode", "stub")
+
+def _slow_bi(delay):
+    def run(intent):
+        time.sleep(delay)
+        return {"intent": intent, "sql": "SELECT 1", "result": [{"x": 1}]}
+    return run
+
+def _slow_rag(delay):
+    def answer(query, top_k=5):
+        time.sleep(delay)
+        return {"query": query, "answer": "respuesta", "mode": "stub", "citations": []}
+    return answer
+
+def test_both_branches_run_concurrently(monkeypatch):
+    monkeypatch.setattr(orch.sql_exec, "run", _slow_bi(0.3))
+    monkeypatch.setattr(orch, "rag_answer", _slow_rag(0.3))
+    t0 = time.perf_counter()
+    out = orch.agent_answer(QUERY)
+    elapsed = time.perf_counter() - t0
+    assert out["mode"] == "both" and not out["partial"]
+    assert "[BI/sales_total]" in out["answer"] and "[RAG/stub] respuesta" in out["answer"]
+    assert elapsed < 0.55  # ~ la rama más lenta, no la suma
+    assert out["timings"]["bi_ms"] >= 300 and out["timings"]["rag_ms"] >= 300
+
+def test_branch_timeout_returns_partial_answer(monkeypatch):
+    monkeypatch.setattr(orch.sql_exec, "run", _slow_bi(0.05))
+    monkeypatch.setattr(orch, "rag_answer", _slow_rag(1.0))
+    monkeypatch.setattr(settings, "agent_rag_timeout", 0.2)
+    out = orch.agent_answer(QUERY)
+    assert out["partial"] and out["timed_out"] == ["rag"]
+    assert out["rag"] is None and out["bi"]["result"] == [{"x": 1}]
+    assert out["timings"]["rag_ms"] is None and out["timings"]["total_ms"] < 500
+
+def test_streaming_agent_emits_bi_and_rag(monkeypatch):
+    monkeypatch.setattr(orch.sql_exec, "run", _slow_bi(0.01))
+
+    async def fake_stream(query, top_k=5):
+        yield {"event": "meta", "query": query, "citations": []}
+        await asyncio.sleep(0.05)
+        yield {"event": "token", "text": "hola"}
+        yield {"event": "done", "answer": "hola", "mode": "stub"}
+    monkeypatch.setattr(orch, "rag_astream", fake_stream)
+
+    async def collect():
+        return [ev async for ev in orch.astream_agent_answer(QUERY)]
+    events = asyncio.run(collect())
+    names = [e["event"] for e in events]
+    assert names[0] == "route" and names[-1] == "done" and "bi" in names and "token" in names
+    assert events[-1]["answer"].startswith("[BI/sales_total]") and not events[-1]["partial"]
+
+def test_streaming_agent_survives_bi_error(monkeypatch):
+    def broken(intent):
+        raise RuntimeError("duckdb caído")
+    monkeypatch.setattr(orch.sql_exec, "run", broken)
+
+    async def fake_stream(query, top_k=5):
+        yield {"event": "token", "text": "hola"}
+        yield {"event": "done", "answer": "hola", "mode": "stub"}
+    monkeypatch.setattr(orch, "rag_astream", fake_stream)
+
+    async def collect():
+        return [ev async for ev in orch.astream_agent_answer(QUERY)]
+    events = asyncio.run(collect())
+    bi = next(e for e in events if e["event"] == "bi")
+    assert bi["error"] == "RuntimeError: duckdb caído"
+    assert events[-1]["event"] == "done" and events[-1]["partial"]
+    assert events[-1]["answer"] == "[RAG/stub] hola"
+
+def test_full_answers_are_cached_partial_are_not(monkeypatch):
+    monkeypatch.setattr(orch.sql_exec, "run", _slow_bi(0.01))
+    monkeypatch.setattr(orch, "rag_answer", _slow_rag(0.5))
+    monkeypatch.setattr(settings, "agent_rag_timeout", 0.1)
+    assert orch.agent_answer(QUERY)["partial"]
+    monkeypatch.setattr(settings, "agent_rag_timeout", 5)
+    first = orch.agent_answer(QUERY)
+    assert first["cached"] is None and not first["partial"]
+    t0 = time.perf_counter()
+    second = orch.agent_answer(QUERY.upper())
+    assert time.perf_counter() - t0 < 0.1
+    assert second["cached"] == "exact" and second["answer"] == first["answer"]
+
+def test_rag_fallback_answers_are_not_cached(monkeypatch):
+    monkeypatch.setattr(orch.sql_exec, "run", _slow_bi(0.01))
+    monkeypatch.setattr(orch, "rag_answer", _slow_rag(0.01))  # modo "stub"
+    monkeypatch.setattr(settings, "generator_mode", "ollama")
+    orch.agent_answer(QUERY)
+    assert orch.agent_answer(QUERY)["cached"] is None
+
+def test_bi_only_route_does_not_load_index(monkeypatch):
+    def no_index():
+        raise AssertionError("una ruta solo-BI no debe cargar el índice")
+    monkeypatch.setattr(orch, "index_version", no_index)
+    monkeypatch.setattr(orch, "get_engine", lambda: type("E", (), {"version": lambda self: 7})())
+    assert _data_version(orch.classify("Ventas por región")) == (None, 7)
@@ -0,0 +1,48 @@
+import time
+import numpy as np
+from src.rag.answer_cache import AnswerCache
+
+def _unit(v):
+    v = np.asarray(v, dtype="float32")
+    return v / np.linalg.norm(v)
+
+def test_exact_hit_on_normalized_text():
+    cache = AnswerCache("t_exact", max_entries=4, ttl=60)
+    cache.put("¿Política de  devoluciones?", 5, "v1", {"answer": "a"})
+    assert cache.get("¿política de devoluciones?", 5, "v1") == {"answer": "a"}
+    assert cache.get("¿política de devoluciones?", 3, "v1") is None  # otro top_k
+    st = cache.stats()
+    assert st["hits"] == 1 and st["misses"] == 1
+
+def test_lru_eviction_and_ttl():
+    cache = AnswerCache("t_lru", max_entries=2, ttl=0.05)
+    cache.put("a", 5, 1, {"answer": "a"})
+    cache.put("b", 5, 1, {"answer": "b"})
+    cache.get("a", 5, 1)  # "a" pasa a ser la más reciente
+    cache.put("c", 5, 1, {"answer": "c"})
+    assert cache.get("b", 5, 1) is None and cache.get("a", 5, 1) is not None
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.06)
+    assert cache.get("a", 5, 1) is None
+    assert cache.stats()["expirations"] == 1
+
+def test_version_change_invalidates():
+    cache = AnswerCache("t_version", max_entries=4, ttl=60)
+    cache.put("a", 5, ("idx", 1), {"answer": "a"})
+    assert cache.get("a", 5, ("idx", 2)) is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["size"] == 0
+
+def test_semantic_hit_above_threshold():
+    cache = AnswerCache("t_sem", max_entries=4, ttl=60, semantic_threshold=0.95)
+    cache.put("plazo de devolución", 5, 1, {"answer": "30 días"}, query_vec=_unit([1, 0, 0]))
+    assert cache.get("plazo para devolver", 5, 1) is None  # sin acierto exacto
+    assert cache.get_similar(_unit([1, 0.1, 0]), 5, 1) == {"answer": "30 días"}
+    assert cache.get_similar(_unit([1, 0.1, 0]), 3, 1) is None  # otro top_k
+    assert cache.get_similar(_unit([0, 1, 0]), 5, 1) is None
+    st = cache.stats()
+    assert st["semantic_hits"] == 1 and st["misses"] == 2
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache("t_off", max_entries=0)
+    cache.put("a", 5, 1, {"answer": "a"})
+    assert not cache.enabled and cache.get("a", 5, 1) is None
@@ -0,0 +1,25 @@
+import json
+from src.app.config import settings
+from src.bench import run as bench
+from src.bi.load_data import load_golden
+
+def test_load_golden_accepts_legacy_repr(tmp_path):
+    path = tmp_path / "golden.jsonl"
+    path.write_text("{'question': '¿Qué es?', 'expected_contains': 'POC'}\n"
+                    '{"question": "Otra", "expected_contains": "x"}\n', encoding="utf-8")
+    assert [g["question"] for g in load_golden(path)] == ["¿Qué es?", "Otra"]
+
+def test_offline_benchmark_report(tmp_path):
+    processed = settings.processed_dir
+    out = tmp_path / "report.json"
+    bench.main(["--docs", "8", "--words", "200", "--queries", "4", "--requests", "6", "--concurrency", "2",
+                "--bi-repeat", "2", "--workers", "1", "--json", str(out)])
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["ingest"]["docs"] >= 8 and report["ingest"]["chunks_per_s"] > 0
+    assert report["search"]["recall@5"] == 1.0  # índice flat: idéntico a la búsqueda exacta
+    assert report["ask"]["errors"] == 0 and report["agent_ask"]["errors"] == 0
+    assert set(report["bi"]) == {"sales_total", "sales_by_region", "sales_by_product", "sales_trend_m", "support_kpis"}
+    # El benchmark deja la configuración como estaba
+    assert settings.processed_dir == processed
+    rows = bench.compare(report, report)
+    assert rows and all(r["change_%"] in (0.0, None) for r in rows)
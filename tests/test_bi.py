@@ -7,3 +7,143 @@ def test_bi_data_shapes():
     assert {"created_at","resolved_at","priority","resolution_hours"}.issubset(set(support.columns))
     assert len(sales) > 0
     assert len(support) > 0
+    assert str(sales["region"].dtype) == "category" and str(support["priority"].dtype) == "category"
+    assert str(sales["sales"].dtype) == "int32"
+
+def test_ensure_helpers_return_dataframes():
+    from src.bi.load_data import ensure_sales, ensure_support, sales_csv
+    assert sales_csv().suffix == ".csv"
+    assert len(ensure_sales()) == 24 * 9 and str(ensure_sales()["date"].dtype).startswith("datetime64")
+    assert "resolution_hours" in ensure_support().columns
+
+def test_sql_exec_intents():
+    from src.agent import sql_exec
+    for intent in sql_exec.INTENT_SQL:
+        out = sql_exec.run(intent)
+        assert out["sql"] and len(out["result"]) > 0
+    assert sql_exec.run("desconocido") == {"intent": "desconocido", "sql": "", "result": []}
+
+def test_engine_cache_invalidated_when_source_changes(tmp_path):
+    import os
+    from src.bi.engine import AnalyticsEngine
+    csv = tmp_path / "sales.csv"
+    csv.write_text("date,region,product,sales,cost\n2024-01-01,Norte,Alpha,100,40\n", encoding="utf-8")
+    support = tmp_path / "support.csv"
+    support.write_text("created_at,resolved_at,priority,resolution_hours\n2024-01-01,2024-01-02 00:00:00,low,24.0\n", encoding="utf-8")
+    engine = AnalyticsEngine({"sales": csv, "support": support}, tmp_path / "bi")
+    sql = "SELECT SUM(sales) s FROM sales"
+    assert engine.query(sql) == [{"s": 100}]
+    assert engine.query(sql) == [{"s": 100}] and engine.hits == 1
+
+    with open(csv, "a", encoding="utf-8") as f:
+        f.write("2024-02-01,Sur,Beta,50,20\n")
+    os.utime(csv, ns=(csv.stat().st_atime_ns, csv.stat().st_mtime_ns + 1_000_000))
+    assert engine.query(sql) == [{"s": 150}]
+    # Otro proceso reutiliza el Parquet ya convertido
+    assert AnalyticsEngine({"sales": csv, "support": support}, tmp_path / "bi").query(sql) == [{"s": 150}]
+
+def _engine_with_sources(tmp_path):
+    from src.bi.engine import AnalyticsEngine
+    sales = tmp_path / "sales.csv"
+    sales.write_text("date,region,product,sales,cost\n"
+                     "2024-01-05,Norte,Alpha,100,40\n2024-01-20,Sur,Alpha,30,10\n2024-02-01,Norte,Beta,50,20\n",
+                     encoding="utf-8")
+    support = tmp_path / "support.csv"
+    support.write_text("created_at,resolved_at,priority,resolution_hours\n"
+                       "2024-01-01,2024-01-02 00:00:00,low,24.0\n2024-01-03,2024-01-03 12:00:00,high,12.0\n",
+                       encoding="utf-8")
+    return sales, support, lambda: AnalyticsEngine({"sales": sales, "support": support}, tmp_path / "bi")
+
+def _touch_append(path, text):
+    import os
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+
+def test_intents_are_routed_to_rollups_with_same_results(tmp_path):
+    from src.agent.sql_exec import INTENTS, INTENT_SQL
+    _, _, make = _engine_with_sources(tmp_path)
+    engine = make()
+    for intent, spec in INTENTS.items():
+        sql, rows = engine.aggregate(spec)
+        assert "rollup_" in sql
+        assert rows == engine.cursor().execute(INTENT_SQL[intent]).fetchdf().to_dict(orient="records")
+
+def test_intents_keep_the_original_result_contract(tmp_path):
+    from src.agent.sql_exec import INTENTS
+    _, support, make = _engine_with_sources(tmp_path)
+    _touch_append(support, "2024-01-04,,low,\n")  # ticket sin resolver: resolution_hours nulo
+    engine = make()
+    _, trend = engine.aggregate(INTENTS["sales_trend_m"])
+    assert list(trend[0]) == ["m", "s"]
+    _, kpis = engine.aggregate(INTENTS["support_kpis"])
+    baseline = engine.cursor().execute("SELECT COUNT(*) tickets, AVG(resolution_hours) avg_h FROM support").fetchone()
+    assert (kpis[0]["tickets"], kpis[0]["avg_h"]) == baseline == (3, 18.0)
+
+def test_routing_picks_a_rollup_only_when_it_can_answer(tmp_path):
+    from src.bi.rollups import Aggregate
+    _, _, make = _engine_with_sources(tmp_path)
+    engine = make()
+    # Mes derivado del rollup diario de soporte; el día de ventas no está en ningún rollup
+    assert "rollup_support_day_priority" in engine.plan(Aggregate("support", ("month",), (("n", "{tickets}"),)))
+    assert "FROM sales " in engine.plan(Aggregate("sales", ("day",), (("s", "{sales}"),)))
+
+def test_rollups_refresh_incrementally_on_append(tmp_path):
+    from src.bi.rollups import Aggregate
+    sales, _, make = _engine_with_sources(tmp_path)
+    engine = make()
+    by_region = Aggregate("sales", ("region",), (("s", "{sales}"),), order_by="1")
+    assert engine.aggregate(by_region)[1] == [{"region": "Norte", "s": 150}, {"region": "Sur", "s": 30}]
+    assert engine.rollups.rebuilds == 2 and engine.rollups.incremental == 0
+
+    _touch_append(sales, "2024-02-10,Sur,Gamma,70,30\n")
+    assert engine.aggregate(by_region)[1] == [{"region": "Norte", "s": 150}, {"region": "Sur", "s": 100}]
+    assert engine.rollups.incremental == 1 and engine.rollups.rebuilds == 2
+
+    # Otro proceso reutiliza los rollups persistidos sin recalcular
+    other = make()
+    assert other.rollups.rebuilds == 0 and other.rollups.incremental == 0
+    assert other.aggregate(by_region)[1] == [{"region": "Norte", "s": 150}, {"region": "Sur", "s": 100}]
+
+    # Un cambio que no es solo-añadido reconstruye desde la tabla base
+    sales.write_text("date,region,product,sales,cost\n2024-03-01,Centro,Beta,10,5\n", encoding="utf-8")
+    assert engine.aggregate(by_region)[1] == [{"region": "Centro", "s": 10}]
+    assert engine.rollups.rebuilds == 3
+
+def test_arrow_results_are_shared_from_cache(tmp_path):
+    from src.bi.rollups import Aggregate
+    sales, _, make = _engine_with_sources(tmp_path)
+    engine = make()
+    spec = Aggregate("sales", ("month",), (("s", "{sales}"),), order_by="1")
+    first = engine.aggregate_arrow(spec)
+    assert engine.aggregate_arrow(spec) is first and engine.hits == 1
+    assert first.column_names == ["month", "s"] and first.column("s").to_pylist() == [130, 50]
+    _touch_append(sales, "2024-02-10,Sur,Gamma,70,30\n")
+    assert engine.aggregate_arrow(spec).column("s").to_pylist() == [130, 120]
+
+def test_load_prunes_columns_and_months(tmp_path):
+    _, _, make = _engine_with_sources(tmp_path)
+    engine = make()
+    assert sorted(p.name for p in (tmp_path / "bi" / "sales").iterdir()) == ["period=2024-01", "period=2024-02"]
+    df = engine.load("sales", ["date", "sales"], start="2024-01-10", end="2024-02-28")
+    assert list(df.columns) == ["date", "sales"] and df["sales"].tolist() == [30, 50]
+
+def test_partitioned_parquet_source_and_incremental_files(tmp_path):
+    from src.bi.engine import AnalyticsEngine
+    from src.bi.load_data import support_csv, write_fixture
+    from src.bi.rollups import Aggregate
+    fixture = tmp_path / "sales"
+    assert write_fixture("sales", fixture, rows=10_000, months=3, batch_rows=2_000) == 6
+    engine = AnalyticsEngine({"sales": fixture, "support": support_csv()}, tmp_path / "bi")
+    total = Aggregate("sales", select=(("n", "{n_rows}"), ("s", "{sales}")))
+    _, rows = engine.aggregate(total)
+    raw = engine.cursor().execute("SELECT COUNT(*) n, SUM(sales) s FROM sales").fetchone()
+    assert rows[0]["n"] == 10_000 and (rows[0]["n"], rows[0]["s"]) == raw
+
+    # Un fichero nuevo en una partición se agrega de forma incremental
+    write_fixture("sales", tmp_path / "extra", rows=500, months=1, seed=1)
+    new = next((tmp_path / "extra").rglob("*.parquet"))
+    dest = fixture / new.parent.name / "part-99999.parquet"
+    new.rename(dest)
+    assert engine.aggregate(total)[1][0]["n"] == 10_500
+    assert engine.rollups.incremental == 1
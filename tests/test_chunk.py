@@ -0,0 +1,29 @@
+import pytest
+from src.bench.chunking import legacy_chunk_text, synthetic_document
+from src.rag.chunk import chunk_text
+
+def test_word_windows_match_previous_chunker():
+    text = synthetic_document(pages=3)
+    new = chunk_text(text, 120, 20, metadata={"source": "x"})
+    old = legacy_chunk_text(text, 120, 20)
+    # Mismas ventanas de palabras (y mismos chunk_id) que el chunker original
+    assert [c["text"].split() for c in new] == [c["text"].split() for c in old]
+    for c in new:
+        m = c["metadata"]
+        assert m["source"] == "x" and text[m["char_start"]:m["char_end"]] == c["text"]
+
+def test_sentence_mode_ends_on_sentence_or_line():
+    text = "Título\nPrimera frase corta. Segunda frase algo más larga que la primera. Tercera frase.\nÚltima línea sin punto"
+    chunks = chunk_text(text, target_tokens=12, overlap_tokens=3, mode="sentences")
+    # La ventana de 12 palabras acabaría en "Tercera": se corta al final de la frase anterior
+    assert chunks[0]["text"] == "Título\nPrimera frase corta. Segunda frase algo más larga que la primera."
+    for c in chunks[:-1]:
+        end = c["metadata"]["char_end"]
+        assert c["text"][-1] in ".!?" or text[end:].startswith("\n")
+    assert chunks[-1]["text"].endswith("sin punto")
+    assert " ".join(c["text"] for c in chunks).split()[-1] == "punto"
+
+def test_empty_and_unknown_mode():
+    assert chunk_text("   \n ") == []
+    with pytest.raises(ValueError):
+        chunk_text("hola", mode="paragraphs")
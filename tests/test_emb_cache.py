@@ -0,0 +1,44 @@
+import numpy as np
+from src.rag.emb_cache import EmbeddingCache
+from src.rag.embeddings import Embeddings
+
+def _vecs(n, dim=4, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+
+def test_cache_roundtrip_and_persistence(tmp_path):
+    cache = EmbeddingCache(tmp_path, "modelo/x", max_entries=100, initial_capacity=2)
+    texts = [f"texto {i}" for i in range(5)]
+    keys = [cache.key(t) for t in texts]
+    vecs = _vecs(5)
+    cache.put_many(keys, vecs)
+    # La normalización de espacios comparte clave
+    assert cache.key("texto   0 ") == keys[0]
+    found, got = cache.get_many(keys)
+    assert found.all() and np.allclose(got, vecs)
+    cache.flush()
+
+    reopened = EmbeddingCache(tmp_path, "modelo/x", max_entries=100)
+    found, got = reopened.get_many(keys[::-1])
+    assert found.all() and np.allclose(got, vecs[::-1])
+    # Otro modelo no comparte entradas
+    other = EmbeddingCache(tmp_path, "modelo/y", max_entries=100)
+    assert not other.get_many([other.key("texto 0")])[0].any()
+
+def test_cache_eviction_respects_cap(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", max_entries=10, initial_capacity=4)
+    old = [cache.key(f"viejo {i}") for i in range(10)]
+    cache.put_many(old, _vecs(10))
+    cache.get_many(old[5:])  # las últimas cinco pasan a ser las más recientes
+    new = [cache.key(f"nuevo {i}") for i in range(3)]
+    cache.put_many(new, _vecs(3, seed=1))
+    assert len(cache) <= 10
+    assert cache.capacity == 10
+    assert cache.evictions >= 3
+    assert cache.get_many(new)[0].all()
+    assert cache.get_many(old[5:])[0].all()
+
+def test_encode_empty_batch_with_cache(tmp_path):
+    emb = Embeddings("modelo/x", cache_dir=tmp_path, cache_max_entries=10)
+    emb._dim = 4  # sin cargar el modelo
+    out = emb.encode([])
+    assert out.shape == (0, 4) and out.dtype == np.float32
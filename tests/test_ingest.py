@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import src.rag.ingest as ingest
+from src.app.config import settings
+from src.rag.sparse import SparseIndex
+from src.rag.vectorstore import FaissStore
+
+class FakeEmbeddings:
+    # Embeddings deterministas y sin descarga de modelo para probar la ingesta
+    calls = []
+
+    def __init__(self, model_name: str = "", **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def encode(self, texts):
+        FakeEmbeddings.calls.append(list(texts))
+        rng = np.random.default_rng(len(texts))
+        v = rng.normal(size=(len(texts), 8)).astype("float32")
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def _setup(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    (data_dir / "raw").mkdir(parents=True)
+    proc = data_dir / "processed"
+    proc.mkdir(parents=True)
+    monkeypatch.setattr(settings, "data_dir", data_dir)
+    monkeypatch.setattr(settings, "processed_dir", proc)
+    monkeypatch.setattr(settings, "rag_backend", "faiss")
+    monkeypatch.setattr(ingest, "Embeddings", FakeEmbeddings)
+    FakeEmbeddings.calls = []
+    return data_dir / "raw", proc
+
+def _store(proc):
+    return FaissStore(dim=None, index_path=proc / "faiss.index", chunks_path=proc / "faiss_chunks")
+
+def test_incremental_ingest(tmp_path, monkeypatch):
+    raw, proc = _setup(tmp_path, monkeypatch)
+    (raw / "a.md").write_text("Documento A. " * 50, encoding="utf-8")
+    (raw / "b.txt").write_text("Documento B con política de devoluciones.", encoding="utf-8")
+
+    ingest.run_ingest()
+    n_first = len(_store(proc))
+    assert n_first >= 2
+
+    # Segunda ejecución sin cambios: no se embebe nada ni se duplican vectores
+    FakeEmbeddings.calls = []
+    ingest.run_ingest()
+    assert FakeEmbeddings.calls == []
+    assert len(_store(proc)) == n_first
+
+    # Cambia un fichero y se borra otro: solo se re-embebe el modificado
+    (raw / "b.txt").write_text("Documento B revisado.", encoding="utf-8")
+    (raw / "a.md").unlink()
+    ingest.run_ingest()
+    assert len(FakeEmbeddings.calls) == 1
+    store = _store(proc)
+    chunks = store.chunks.get_many(store.chunks.live_ids())
+    assert {m["source"] for m in chunks} == {str(raw / "b.txt")}
+    assert all("revisado" in m["text"] for m in chunks)
+
+    manifest = ingest.load_manifest(proc)
+    assert list(manifest["files"]) == [str(raw / "b.txt")]
+    df = pd.read_parquet(proc / "chunks.parquet")
+    assert sorted(df["id"]) == store.chunks.live_ids().tolist()
+    # El índice BM25 cubre exactamente los mismos chunks
+    bm25 = SparseIndex.load(proc / "bm25")
+    assert sorted(np.asarray(bm25.ids).tolist()) == sorted(df["id"])
+    assert bm25.search("revisado") and not bm25.search("política")
+
+    # Si se borran todos los documentos, el índice se vacía
+    (raw / "b.txt").unlink()
+    ingest.run_ingest()
+    assert len(_store(proc)) == 0
+    assert ingest.load_manifest(proc)["files"] == {}
+    bm25 = SparseIndex.load(proc / "bm25")
+    assert bm25 is None or not bm25.search("revisado")
+
+def test_missing_index_artifacts_force_rebuild(tmp_path, monkeypatch):
+    raw, proc = _setup(tmp_path, monkeypatch)
+    (raw / "a.md").write_text("Documento A. " * 50, encoding="utf-8")
+    ingest.run_ingest()
+    n = len(_store(proc))
+    # Como `make clean` antiguo: se borran los chunks pero quedan manifiesto e índice
+    for p in proc.glob("faiss_chunks*"):
+        p.unlink()
+    FakeEmbeddings.calls = []
+    ingest.run_ingest()
+    assert FakeEmbeddings.calls and len(_store(proc)) == n
+
+def test_pipelined_ingest_batches(tmp_path, monkeypatch):
+    raw, proc = _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(settings, "ingest_workers", 2)
+    monkeypatch.setattr(settings, "ingest_batch_size", 3)
+    monkeypatch.setattr(settings, "ingest_queue_depth", 1)
+    monkeypatch.setattr(settings, "chunk_target_tokens", 20)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 5)
+    for i in range(4):
+        (raw / f"doc{i}.txt").write_text(" ".join(f"w{i}_{j}" for j in range(60)), encoding="utf-8")
+
+    ingest.run_ingest()
+    # Lotes de tamaño fijo (el último puede ser menor)
+    assert all(len(c) == 3 for c in FakeEmbeddings.calls[:-1])
+    store = _store(proc)
+    df = pd.read_parquet(proc / "chunks.parquet")
+    assert len(df) == len(store) == sum(len(c) for c in FakeEmbeddings.calls)
+    manifest = ingest.load_manifest(proc)
+    assert sum(len(e["ids"]) for e in manifest["files"].values()) == len(store)
+
+def test_pdf_pages_extracted_in_parallel_and_cached(tmp_path, monkeypatch):
+    from tests.test_pdf import make_pdf
+    import src.rag.pdf as pdf
+    raw, proc = _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(settings, "ingest_workers", 2)
+    monkeypatch.setattr(settings, "pdf_pages_per_task", 2)
+    monkeypatch.setattr(settings, "chunk_target_tokens", 8)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 0)
+    make_pdf(raw / "manual.pdf", [f"Pagina {i} uno dos tres" for i in range(6)])
+
+    ingest.run_ingest()
+    df = pd.read_parquet(proc / "chunks.parquet")
+    assert df["page"].tolist() == [1, 2, 4, 5] and df["page_end"].tolist() == [2, 4, 5, 6]
+    assert len(list((proc / "pdf_pages").rglob("*-*.json"))) == 3
+
+    # Cambiar el chunking reconstruye el índice sin volver a parsear el PDF
+    def fail(*args, **kwargs):
+        raise AssertionError("el PDF no debería volver a parsearse")
+    monkeypatch.setattr(pdf, "PdfReader", fail)
+    monkeypatch.setattr(settings, "ingest_workers", 1)
+    monkeypatch.setattr(settings, "chunk_target_tokens", 30)
+    ingest.run_ingest()
+    df = pd.read_parquet(proc / "chunks.parquet")
+    assert df["page"].tolist() == [1] and df["page_end"].tolist() == [6]
+
+def test_incremental_ingest_with_sharded_store(tmp_path, monkeypatch):
+    from src.rag.vectorstore import ShardedFaissStore
+    raw, proc = _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(settings, "rag_backend", "faiss_sharded")
+    monkeypatch.setattr(settings, "faiss_shards", 3)
+    for name in ("a", "b", "c"):
+        (raw / f"{name}.txt").write_text(f"Documento {name}. " * 40, encoding="utf-8")
+    ingest.run_ingest()
+    (raw / "b.txt").unlink()
+    ingest.run_ingest()
+
+    store = ShardedFaissStore(proc / "faiss_shards", dim=None)
+    df = pd.read_parquet(proc / "chunks.parquet")
+    assert {m["source"] for m in store.get_many(df["id"].tolist())} == {str(raw / "a.txt"), str(raw / "c.txt")}
+    assert len(store) == len(df)
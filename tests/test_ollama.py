@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from src.app.config import settings
+from src.rag import ollama
+
+class FakeOllama(BaseHTTPRequestHandler):
+    # Servidor Ollama falso: /api/generate con y sin streaming NDJSON
+    protocol_version = "HTTP/1.1"
+    tokens = ["Hola", ", ", "mundo", "."]
+    peers = set()
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        FakeOllama.peers.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(FakeOllama.delay)
+        if not body.get("stream"):
+            data = json.dumps({"response": "".join(self.tokens), "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = [{"response": t, "done": False} for t in self.tokens] + [{"response": "", "done": True}]
+        for line in lines:
+            chunk = (json.dumps(line) + "\n").encode()
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeOllama.peers = set()
+    FakeOllama.delay = 0.0
+    monkeypatch.setattr(settings, "ollama_base_url", f"http://127.0.0.1:{server.server_port}")
+    yield server
+    asyncio.run(ollama.aclose())
+    server.shutdown()
+
+def test_generate_reuses_pooled_connection(fake_ollama):
+    assert ollama.generate("p") == "Hola, mundo."
+    assert ollama.generate("p") == "Hola, mundo."
+    assert len(FakeOllama.peers) == 1  # keep-alive: una sola conexión TCP
+
+def test_astream_yields_tokens(fake_ollama):
+    async def collect():
+        return [t async for t in ollama.astream("p")]
+    assert asyncio.run(collect()) == FakeOllama.tokens
+
+def test_concurrency_limit_falls_back(fake_ollama, monkeypatch):
+    monkeypatch.setattr(settings, "ollama_max_concurrency", 1)
+    monkeypatch.setattr(settings, "ollama_queue_timeout", 0.05)
+    asyncio.run(ollama.aclose())  # recrea clientes con el nuevo límite
+    FakeOllama.delay = 0.3
+
+    async def collect():
+        return [t async for t in ollama.astream("p")]
+
+    async def both():
+        return await asyncio.gather(collect(), collect())
+    results = asyncio.run(both())
+    # Una generación completa; la otra no obtiene hueco a tiempo y sale vacía (fallback)
+    assert sorted(len(r) for r in results) == [0, len(FakeOllama.tokens)]
+
+def test_unavailable_returns_empty(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_base_url", "http://127.0.0.1:9")
+    assert ollama.generate("p") == ""
+
+    async def collect():
+        return [t async for t in ollama.astream("p")]
+    assert asyncio.run(collect()) == []
+    asyncio.run(ollama.aclose())
@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import List
+import src.rag.pdf as pdf
+from src.rag.chunk import chunk_pages
+from src.rag.pdf import PageCache, missing_ranges, read_pdf_pages
+
+def make_pdf(path: Path, pages: List[str]) -> Path:
+    # PDF mínimo con una línea de texto (Helvetica) por página
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                    b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objs))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    path.write_bytes(bytes(out))
+    return path
+
+def test_missing_ranges():
+    assert missing_ranges(7, {}, 3) == [(0, 3), (3, 6), (6, 7)]
+    assert missing_ranges(7, {2: "", 3: ""}, 3) == [(0, 2), (4, 7)]
+
+def test_pages_are_cached_by_hash_and_page(tmp_path, monkeypatch):
+    path = make_pdf(tmp_path / "manual.pdf", [f"Pagina {i} del manual" for i in range(5)])
+    cache = PageCache(tmp_path / "pdf_pages")
+    pages = read_pdf_pages(path, "abc", cache, pages_per_task=2)
+    assert [p.strip() for p in pages] == [f"Pagina {i} del manual" for i in range(5)]
+    assert cache.page_count("abc") == 5 and len(list((tmp_path / "pdf_pages" / "abc").glob("*-*.json"))) == 3
+
+    # Segunda lectura: todo sale de la caché, sin abrir el PDF
+    def fail(*args, **kwargs):
+        raise AssertionError("el PDF no debería volver a parsearse")
+    monkeypatch.setattr(pdf, "PdfReader", fail)
+    assert read_pdf_pages(path, "abc", cache) == pages
+    assert cache.prune({"otro"}) == 1 and cache.get("abc") == {}
+
+def test_chunks_carry_page_numbers():
+    pages = [" ".join(f"p{p}w{i}" for i in range(10)) for p in range(4)]
+    chunks = chunk_pages(pages, target_tokens=15, overlap_tokens=0)
+    assert [(c["metadata"]["page"], c["metadata"]["page_end"]) for c in chunks] == [(1, 2), (2, 3), (4, 4)]
+    assert chunks[0]["text"].split()[0] == "p0w0" and chunks[1]["text"].split()[0] == "p1w5"
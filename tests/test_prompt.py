@@ -0,0 +1,37 @@
+from src.rag.chunk import chunk_text
+from src.rag.prompt import build_context, count_tokens, dedupe_passages
+
+def _passages(chunks, source="doc.md"):
+    return [{"score": 1.0, "text": c["text"], "source": source, "chunk_id": c["metadata"]["chunk_id"]} for c in chunks]
+
+def test_overlap_between_consecutive_chunks_is_removed():
+    words = [f"w{i}" for i in range(100)]
+    chunks = chunk_text(" ".join(words), target_tokens=40, overlap_tokens=10)
+    # Orden de relevancia arbitrario: el chunk 1 antes que sus vecinos
+    passages = _passages([chunks[1], chunks[0], chunks[2]])
+    out, removed = dedupe_passages(passages)
+    assert removed == 20
+    joined = " ".join(p["text"] for p in sorted(out, key=lambda p: p["chunk_id"]))
+    assert joined.split() == words[:40 + 30 + 30]
+
+def test_other_sources_and_duplicates():
+    a = {"score": 1.0, "text": "uno dos tres", "source": "a.md", "chunk_id": 0}
+    b = {"score": 0.9, "text": "tres cuatro", "source": "b.md", "chunk_id": 1}
+    dup = {**a, "source": "c.md"}
+    out, removed = dedupe_passages([a, b, dup])
+    assert [p["text"] for p in out] == ["uno dos tres", "tres cuatro"]  # otra fuente: sin recorte
+    assert removed == 3
+
+def test_packing_respects_budget():
+    passages = _passages(chunk_text(" ".join(f"palabra{i}" for i in range(2000)), 200, 0))
+    ctx = build_context("¿Qué dice el documento?", passages, max_tokens=600, min_passage_tokens=32)
+    assert ctx.prompt_tokens == count_tokens(ctx.prompt)
+    assert ctx.prompt_tokens <= 600
+    assert 0 < len(ctx.passages) < len(passages)
+    assert ctx.dropped == len(passages) - len(ctx.passages)
+    assert f"[{len(ctx.passages)}]" in ctx.prompt and f"[{len(ctx.passages) + 1}]" not in ctx.prompt
+
+def test_no_budget_keeps_everything():
+    passages = _passages(chunk_text(" ".join(f"p{i}" for i in range(300)), 100, 0))
+    ctx = build_context("q", passages, max_tokens=0)
+    assert len(ctx.passages) == len(passages) and ctx.dropped == 0
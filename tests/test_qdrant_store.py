@@ -0,0 +1,42 @@
+import numpy as np
+from src.rag.filters import SearchFilter
+from src.rag.vectorstore import QdrantStore, point_id
+
+def _vecs(n, dim=8, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def _store(**kw):
+    # Modo local en memoria: sin servidor Qdrant
+    return QdrantStore(location=":memory:", dim=8, batch_size=16, **kw)
+
+def _metas(n, source="a.pdf"):
+    return [{"source": source, "chunk_id": i, "doc_type": "pdf", "mtime": 1_700_000_000} for i in range(n)]
+
+def test_batched_upload_is_idempotent():
+    store = _store()
+    vecs = _vecs(50)
+    ids = store.add([f"t{i}" for i in range(50)], _metas(50), vecs)
+    assert ids[3] == point_id("a.pdf", 3)
+    # Re-ingerir los mismos chunks sobrescribe, no duplica
+    again = store.add([f"t{i}" for i in range(50)], _metas(50), vecs)
+    assert again == ids
+    assert store.client.count(store.collection).count == 50
+
+def test_batch_search_filters_and_delete():
+    store = _store()
+    vecs = _vecs(40)
+    ids = store.add([f"t{i}" for i in range(20)], _metas(20), vecs[:20])
+    store.add([f"u{i}" for i in range(20)], _metas(20, source="b.md"), vecs[20:])
+
+    res = store.search_many(vecs[[3, 25]], top_k=2)
+    assert [r[0][1]["text"] for r in res] == ["t3", "u5"]
+    assert res[0][0][1]["id"] == ids[3]
+
+    only_b = store.search(vecs[3:4], top_k=5, filters=SearchFilter.build(source="b.md"))
+    assert len(only_b) == 5 and all(m["source"] == "b.md" for _, m in only_b)
+
+    store.delete(ids[:10])
+    assert store.client.count(store.collection).count == 30
+    assert store.get_many([ids[0], ids[15]])[0] is None
+    assert store.get_many([ids[15]])[0]["text"] == "t15"
@@ -1,4 +1,6 @@
 from pathlib import Path
+import numpy as np
+from src.rag import pipeline
 from src.rag.ingest import run_ingest
 from src.rag.pipeline import answer
 from src.app.config import settings
@@ -27,3 +29,30 @@ def test_ingest_and_answer(tmp_path, monkeypatch):
     res = answer("¿Qué es esta POC?")
     assert "POC" in res["answer"] or "evidencia" in res["answer"].lower()
     assert len(res["citations"]) >= 1
+
+class _FakeEmbeddings:
+    def encode_queries(self, queries):
+        return np.eye(len(queries), 4, dtype="float32")
+
+class _RecordingStore:
+    # Store en memoria que registra cada búsqueda matricial
+    def __init__(self):
+        self.calls = []
+
+    def search_many(self, query_vecs, top_k=5, filters=None):
+        self.calls.append(len(query_vecs))
+        hits = [(0.9 - i / 10, {"id": i, "text": f"pasaje {i}", "source": "doc.md", "chunk_id": i}) for i in range(top_k)]
+        return [hits for _ in range(len(query_vecs))]
+
+def test_answer_many_batch(monkeypatch):
+    store = _RecordingStore()
+    monkeypatch.setattr(pipeline, "get_embeddings", lambda: _FakeEmbeddings())
+    monkeypatch.setattr(pipeline, "get_store", lambda: store)
+    monkeypatch.setattr(settings, "hybrid_search", False)
+    monkeypatch.setattr(settings, "rerank_enabled", False)
+    monkeypatch.setattr(settings, "generator_mode", "stub")
+    queries = ["¿Qué es esta POC?", "¿Qué contiene el documento de ejemplo?"]
+    res = pipeline.answer_many(queries, top_k=2)
+    assert store.calls == [2]  # una sola búsqueda para las dos consultas
+    assert [r["query"] for r in res] == queries
+    assert all(len(r["citations"]) == 2 for r in res)
@@ -0,0 +1,80 @@
+import time
+from src.rag.rerank import CrossEncoderReranker
+
+class FakeCrossEncoder:
+    """Puntúa por número de palabras de la consulta presentes en el pasaje."""
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(len(pairs))
+        time.sleep(self.delay * len(pairs))
+        return [sum(w in p.split() for w in q.split()) for q, p in pairs]
+
+def _passages(texts):
+    return [{"score": 1.0 - i / 10, "text": t, "source": "s.md", "chunk_id": i} for i, t in enumerate(texts)]
+
+def _reranker(model, **kw):
+    rr = CrossEncoderReranker("fake", **kw)
+    rr._model = model
+    return rr
+
+def test_rerank_orders_by_cross_encoder_in_batches():
+    model = FakeCrossEncoder()
+    rr = _reranker(model, batch_size=2, budget_ms=10_000)
+    passages = _passages(["nada", "plazo", "plazo de devolución", "otra cosa", "devolución"])
+    out = rr.rerank("plazo de devolución", passages, top_k=2)
+    assert [p["chunk_id"] for p in out] == [2, 1]
+    assert out[0]["rerank_score"] == 3 and out[0]["dense_rank"] == 3
+    assert out[0]["score"] == passages[2]["score"]  # la similitud densa no se pisa
+    assert model.calls == [2, 2, 1]
+
+def test_scores_are_cached_per_query_and_passage():
+    model = FakeCrossEncoder()
+    rr = _reranker(model, batch_size=8, budget_ms=10_000)
+    passages = _passages(["a b", "b", "c"])
+    rr.rerank("b", passages, top_k=2)
+    rr.rerank(" B ", passages, top_k=2)  # misma consulta normalizada
+    assert model.calls == [3]
+    rr.rerank("c", passages, top_k=2)
+    assert model.calls == [3, 3]
+    assert rr.stats()["cache_hits"] == 3
+
+def test_budget_exceeded_falls_back_to_dense_order():
+    model = FakeCrossEncoder(delay=0.01)
+    rr = _reranker(model, batch_size=2, budget_ms=30)
+    passages = _passages(["x", "y", "z", "w", "q y z", "v"])
+    out = rr.rerank("q y z", passages, top_k=3)
+    # El primer lote mide el coste por par; los siguientes no caben en el presupuesto
+    assert [p["chunk_id"] for p in out] == [0, 1, 2]
+    assert rr.stats()["degraded"] == 1
+    assert model.calls == [2]
+
+def test_budget_estimate_recovers_after_slow_batch():
+    model = FakeCrossEncoder(delay=0.05)
+    rr = _reranker(model, batch_size=2, budget_ms=60)
+    passages = _passages(["x", "y", "z", "w", "q y z", "v"])
+    rr.rerank("q y z", passages, top_k=3)  # un lote lento dispara la estimación (1ª degradación)
+    model.delay = 0.0
+    for i in range(rr.PROBE_EVERY - 1):
+        assert [p["chunk_id"] for p in rr.rerank(f"q y z {i}", passages, top_k=3)] == [0, 1, 2]
+    # Tras PROBE_EVERY degradaciones se mide de nuevo y el reordenado vuelve
+    out = rr.rerank("q y z", passages, top_k=3)
+    assert out[0]["chunk_id"] == 4
+    assert rr.rerank("z", passages, top_k=1)[0]["chunk_id"] in (2, 4)
+    assert rr.stats()["ms_per_pair"] < 20
+
+def test_warmup_does_not_seed_estimate():
+    rr = _reranker(FakeCrossEncoder(delay=0.05))
+    rr.warmup()
+    assert rr.stats()["ms_per_pair"] is None
+
+def test_citations_keep_dense_score_and_expose_rerank(monkeypatch):
+    from src.rag import pipeline
+    rr = _reranker(FakeCrossEncoder(), batch_size=8, budget_ms=10_000)
+    passages = _passages(["nada", "plazo de devolución"])
+    citations = pipeline._citations(rr.rerank("plazo de devolución", passages, top_k=2))
+    assert citations[0]["chunk_id"] == 1
+    assert citations[0]["score"] == passages[1]["score"]
+    assert (citations[0]["rerank_score"], citations[0]["dense_rank"]) == (3, 2)
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+from src.rag.vectorstore import FaissStore, IndexConfig, ShardedFaissStore, build_store, shard_of
+
+def _vecs(n, dim=16, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def _docs(n):
+    texts = [f"t{i}" for i in range(n)]
+    metas = [{"source": f"doc{i % 7}.md", "chunk_id": i // 7} for i in range(n)]
+    return texts, metas, _vecs(n)
+
+def test_scatter_gather_matches_single_index(tmp_path):
+    texts, metas, vecs = _docs(200)
+    single = FaissStore(dim=16, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks")
+    single.add(texts, metas, vecs)
+    sharded = ShardedFaissStore(tmp_path / "shards", dim=16, n_shards=3)
+    ids = sharded.add(texts, metas, vecs)
+
+    # Los chunks de una fuente viven en un shard y el id global codifica cuál
+    assert len(set(ids)) == 200 and all(i % 3 == shard_of(m["source"], 3) for i, m in zip(ids, metas))
+    queries = _vecs(5, seed=1)
+    for got, want in zip(sharded.search_many(queries, top_k=8), single.search_many(queries, top_k=8)):
+        assert [m["text"] for _, m in got] == [m["text"] for _, m in want]
+        assert np.allclose([s for s, _ in got], [s for s, _ in want], atol=1e-5)
+        assert all(m == sharded.get_many([m["id"]])[0] for _, m in got)
+
+def test_delete_reload_and_layout_on_disk(tmp_path):
+    texts, metas, vecs = _docs(60)
+    store = ShardedFaissStore(tmp_path, dim=16, n_shards=4, shard_by="round_robin")
+    ids = store.add(texts, metas, vecs)
+    assert [len(s) for s in store.shards] == [15, 15, 15, 15]
+    store.delete(ids[:10])
+    assert store.get_many(ids[:2]) == [None, None] and store.get_many([ids[10]])[0]["text"] == "t10"
+
+    reloaded = ShardedFaissStore(tmp_path, dim=None, n_shards=2, shard_by="source")  # manda lo guardado
+    assert (reloaded.n_shards, reloaded.shard_by, len(reloaded)) == (4, "round_robin", 50)
+    hit = reloaded.search(vecs[20:21], top_k=1)[0][1]
+    assert hit["text"] == "t20" and hit["id"] == ids[20]
+
+def test_clear_applies_configured_layout(tmp_path):
+    texts, metas, vecs = _docs(30)
+    ShardedFaissStore(tmp_path, dim=16, n_shards=2, shard_by="round_robin").add(texts, metas, vecs)
+    store = ShardedFaissStore(tmp_path, dim=None, n_shards=3, shard_by="source")
+    assert (store.n_shards, store.shard_by) == (2, "round_robin")  # al abrir manda lo guardado
+
+    store.clear(16)  # reconstrucción: se aplica la configuración
+    ids = store.add(texts, metas, vecs)
+    assert json.loads((tmp_path / "shards.json").read_text()) == {"shards": 3, "shard_by": "source"}
+    assert sorted(d.name for d in tmp_path.glob("shard_*")) == ["shard_00", "shard_01", "shard_02"]
+    reloaded = ShardedFaissStore(tmp_path, dim=None)
+    assert (reloaded.n_shards, len(reloaded)) == (3, 30)
+    assert reloaded.search(vecs[7:8], top_k=1)[0][1]["id"] == ids[7]
+
+def test_shards_rebuild_and_reload_independently(tmp_path):
+    texts, metas, vecs = _docs(120)
+    store = ShardedFaissStore(tmp_path, dim=16, n_shards=2, shard_by="round_robin")
+    ids = store.add(texts, metas, vecs)
+    before, version, shards = store.shards[0].version(), store.version(), store.shards
+
+    other = ShardedFaissStore(tmp_path, dim=None)  # otro proceso reconstruye el shard 1 como HNSW
+    old = other.shards[1]
+    other.rebuild_shard(1, IndexConfig(kind="hnsw", hnsw_m=8))
+    assert other.shards[1] is not old and old.kind == "flat"  # se construye aparte y se sustituye
+    assert store.stale() is True  # recarga solo el shard cambiado...
+    assert store.stale() is False and store.version() != version
+    assert store.shards[0].version() == before and store.shards[1].kind == "hnsw"
+    # ...sustituyendo la lista entera: una búsqueda en curso conserva la suya
+    assert store.shards is not shards and shards[1].kind == "flat"
+    top = store.search(vecs[41:42], top_k=1)[0][1]
+    assert top["text"] == "t41" and top["id"] == ids[41]
+
+def test_build_store_sharded_backend(tmp_path, monkeypatch):
+    from src.app.config import settings
+    monkeypatch.setattr(settings, "faiss_shards", 3)
+    store = build_store("faiss_sharded", dim=16, processed_dir=tmp_path)
+    assert isinstance(store, ShardedFaissStore) and store.n_shards == 3
+    assert (tmp_path / "faiss_shards" / "shard_02").is_dir()
@@ -0,0 +1,64 @@
+import numpy as np
+from src.rag.sparse import SparseIndex, SparseIndexBuilder, rrf_fuse, tokenize
+
+DOCS = {
+    10: "La política de devoluciones permite 30 días para el SKU ABC-123.",
+    11: "El envío estándar tarda entre 3 y 5 días laborables.",
+    12: "Ticket TCK-9981: el cliente reclama el reembolso del pedido.",
+    13: "Política de privacidad y tratamiento de datos personales.",
+}
+
+def _build(path, docs, deleted=(), rebuild=True):
+    builder = SparseIndexBuilder(path, list(deleted), rebuild)
+    builder.add(list(docs), list(docs.values()))
+    builder.close()
+    return SparseIndex.load(path)
+
+def test_tokenize_keeps_compound_identifiers():
+    assert tokenize("SKU ABC-123.") == ["sku", "abc-123", "abc", "123"]
+
+def test_exact_terms_rank_first(tmp_path):
+    index = _build(tmp_path / "bm25", DOCS)
+    assert index.search("abc-123")[0][1] == 10
+    assert index.search("tck-9981 reembolso")[0][1] == 12
+    assert [i for _, i in index.search("política")] in ([10, 13], [13, 10])
+    assert index.search("inexistente") == []
+
+def test_incremental_merge_keeps_and_deletes(tmp_path):
+    path = tmp_path / "bm25"
+    _build(path, DOCS)
+    index = _build(path, {20: "Nuevo documento sobre garantía"}, deleted=[12], rebuild=False)
+    assert len(index) == 4
+    assert index.search("tck-9981") == []
+    assert index.search("garantía")[0][1] == 20
+    assert index.search("abc-123")[0][1] == 10
+    assert index.stale() is False
+
+def test_incremental_merge_matches_rebuild(tmp_path, monkeypatch):
+    # Bloques diminutos: las postings anteriores se recorren en muchos tramos
+    monkeypatch.setattr(SparseIndexBuilder, "BLOCK", 3)
+    extra = {20: "Nuevo documento sobre garantía y devoluciones", 21: "SKU ABC-123 agotado"}
+    _build(tmp_path / "inc", DOCS)
+    inc = _build(tmp_path / "inc", extra, deleted=[11], rebuild=False)
+    full = _build(tmp_path / "full", {**{k: v for k, v in DOCS.items() if k != 11}, **extra})
+    for name in SparseIndex.FILES:
+        assert np.array_equal(getattr(inc, name), getattr(full, name)), name
+
+def test_rrf_fusion():
+    fused = rrf_fuse([[1, 2, 3], [3, 4]], k=60, top_k=3)
+    assert [d for _, d in fused] == [3, 1, 2]
+
+def test_fuse_fetches_lexical_only_hits(tmp_path):
+    from src.rag import pipeline
+    from src.rag.vectorstore import FaissStore
+    store = FaissStore(dim=4, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks")
+    texts = list(DOCS.values())
+    ids = store.add(texts, [{"source": "s", "chunk_id": i} for i in range(4)], np.eye(4, dtype="float32"))
+    index = _build(tmp_path / "bm25", dict(zip(ids, texts)))
+    dense = store.search(np.eye(4, dtype="float32")[1:2], top_k=1)  # solo el doc de envíos
+    passages = pipeline._fuse(store, dense, index.search("abc-123"), top_k=2)
+    assert {p["text"] for p in passages} == {texts[0], texts[1]}
+    # score sigue siendo la similitud densa (None si solo acierta BM25); la fusión va aparte
+    by_text = {p["text"]: p for p in passages}
+    assert by_text[texts[1]]["score"] == dense[0][0] and by_text[texts[0]]["score"] is None
+    assert all(0 < p["rrf_score"] < 0.05 for p in passages)
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+
+def test_importing_api_does_not_load_model():
+    # Importar la API (y el pipeline) no debe cargar torch ni sentence-transformers
+    code = (
+        "import sys, src.app.server, src.agent.orchestrator; "
+        "print(any(m in sys.modules for m in ('torch', 'sentence_transformers', 'qdrant_client')))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+def test_health_reports_readiness(monkeypatch):
+    from src.app.server import app
+    from src.rag import pipeline
+    monkeypatch.setattr(pipeline, "_ready", type(pipeline._ready)())
+    client = TestClient(app)  # sin context manager: no se ejecuta el warmup
+    assert client.get("/health").json() == {"status": "ok", "ready": False}
+    pipeline._ready.set()
+    assert client.get("/health").json()["ready"] is True
@@ -0,0 +1,105 @@
+import time
+from fastapi.testclient import TestClient
+import src.agent.orchestrator as orch
+from src.app import telemetry
+from src.app.config import settings
+from src.app.telemetry import Histogram, span, trace
+from src.rag.answer_cache import AnswerCache
+
+def test_spans_feed_trace_and_histogram():
+    telemetry.STAGES.clear()
+    with trace("test") as tr:
+        with span("search.dense", backend="faiss"):
+            time.sleep(0.01)
+        with span("search.dense", backend="faiss"):
+            pass
+    with span("fuera"):  # sin traza activa solo alimenta el histograma
+        pass
+    t = tr.timings()
+    assert set(t["stages"]) == {"search.dense"} and t["stages"]["search.dense"] >= 10
+    text = telemetry.render()
+    assert 'app_stage_seconds_count{backend="faiss",stage="search.dense"} 2' in text
+    assert 'app_stage_seconds_count{stage="fuera"} 1' in text
+    assert 'app_request_seconds_count{endpoint="test"}' in text
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("x_seconds", "x", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5):
+        h.observe(v, intent='a"b')
+    lines = h.render()
+    assert 'x_seconds_bucket{intent="a\\"b",le="0.1"} 1' in lines
+    assert 'x_seconds_bucket{intent="a\\"b",le="1.0"} 2' in lines
+    assert 'x_seconds_bucket{intent="a\\"b",le="+Inf"} 3' in lines
+
+def test_agent_branches_report_into_request_trace(monkeypatch):
+    monkeypatch.setattr(orch, "_cache", AnswerCache("agent_telemetry", max_entries=4, ttl=60))
+    monkeypatch.setattr(orch, "data_version", lambda route: 1)
+
+    def bi(intent):
+        with span("bi.query", intent=intent):
+            return {"intent": intent, "sql": "SELECT 1", "result": [{"x": 1}]}
+
+    def rag(query, top_k=5):
+        with span("generate", generator="stub"):
+            return {"query": query, "answer": "r", "mode": "stub", "citations": []}
+
+    monkeypatch.setattr(orch.sql_exec, "run", bi)
+    monkeypatch.setattr(orch, "rag_answer", rag)
+    from src.app.server import app
+    out = TestClient(app).post("/agent_ask", json={"query": "Ventas por región y política de devoluciones",
+                                                    "timings": True}).json()
+    assert {"bi.query", "generate"} <= set(out["timings"]["stages"])
+    metrics = TestClient(app).get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'app_stage_seconds_count{intent="sales_total",stage="bi.query"}' in metrics.text
+    assert 'app_request_seconds_count{endpoint="agent_ask"}' in metrics.text
+
+def test_slow_request_profile_is_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "processed_dir", tmp_path)
+    monkeypatch.setattr(settings, "profile_slow_ms", 30)
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+    monkeypatch.setattr(settings, "profile_interval_ms", 1)
+
+    def busy_loop(seconds):
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            sum(range(1000))
+
+    with trace("rapida"):
+        pass
+    with trace("lenta"):
+        busy_loop(0.1)
+    files = list((tmp_path / "profiles").glob("*.collapsed"))
+    assert len(files) == 1 and "_lenta_" in files[0].name
+    assert "test_telemetry.py:busy_loop" in files[0].read_text(encoding="utf-8")
+
+def test_profile_only_samples_threads_working_for_the_request(tmp_path, monkeypatch):
+    import contextvars
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.app.telemetry import run_traced
+    monkeypatch.setattr(settings, "processed_dir", tmp_path)
+    monkeypatch.setattr(settings, "profile_slow_ms", 30)
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+    monkeypatch.setattr(settings, "profile_interval_ms", 1)
+
+    def spin(seconds):
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            sum(range(1000))
+
+    def mine():
+        spin(0.15)
+
+    def other_request():
+        spin(0.3)
+
+    # Hilo del pool del agente atendiendo otra petición a la vez
+    other = threading.Thread(target=other_request, name="agent_other")
+    other.start()
+    with ThreadPoolExecutor(1, thread_name_prefix="agent") as pool:
+        with trace("propia"):
+            pool.submit(contextvars.copy_context().run, run_traced, mine).result()
+    other.join()
+    text = next((tmp_path / "profiles").glob("*_propia_*.collapsed")).read_text(encoding="utf-8")
+    assert "test_telemetry.py:mine" in text and "other_request" not in text
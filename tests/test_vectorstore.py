@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from src.rag.vectorstore import FaissStore, IndexConfig
+
+def _vecs(n, dim=16, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def _store(tmp_path, kind, **kw):
+    cfg = IndexConfig(kind=kind, nlist=4, pq_m=4, hnsw_m=8, nprobe=4, ef_search=64, train_size=kw.pop("train_size", 100))
+    return FaissStore(dim=16, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks", config=cfg)
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf_flat", "ivf_pq"])
+def test_index_kinds_add_search_delete_reload(tmp_path, kind):
+    store = _store(tmp_path, kind)
+    vecs = _vecs(300)
+    texts = [f"t{i}" for i in range(300)]
+    ids = store.add(texts, [{"source": "s", "chunk_id": i} for i in range(300)], vecs)
+    assert ids == list(range(300))
+
+    hits = store.search(vecs[7:8], top_k=3)
+    assert len(hits) == 3
+    if kind != "ivf_pq":  # PQ es con pérdida: el vecino exacto puede no ser el primero
+        assert hits[0][1]["text"] == "t7"
+
+    store.delete([7])
+    assert all(m["text"] != "t7" for _, m in store.search(vecs[7:8], top_k=5))
+    assert len(store) == 299
+
+    reloaded = _store(tmp_path, "flat")  # el tipo en disco manda sobre la configuración
+    assert reloaded.kind == kind
+    assert len(reloaded) == 299
+    assert len(reloaded.search(vecs[8:9], top_k=5)) == 5
+
+def test_ivf_trains_on_first_batches(tmp_path):
+    store = _store(tmp_path, "ivf_flat", train_size=50)
+    store.autosave = False
+    store.add(["a"] * 30, [{"source": "s", "chunk_id": i} for i in range(30)], _vecs(30))
+    assert store.index is None  # aún esperando muestra de entrenamiento
+    store.add(["b"] * 30, [{"source": "s", "chunk_id": i} for i in range(30)], _vecs(30, seed=1))
+    assert store.index is not None and store.index.is_trained and store.index.ntotal == 60
+
+def test_chunk_store_append_delete_reopen(tmp_path):
+    from src.rag.chunkstore import ChunkStore
+    cs = ChunkStore(tmp_path / "c")
+    cs.put_many([0, 1, 2], [{"text": "uno"}, {"text": "dós"}, {"text": "tres"}])
+    cs.delete([1])
+    cs.put_many([3], [{"text": "cuatro", "source": "x.md"}])
+    blob_size = cs.blob_path.stat().st_size
+
+    reopened = ChunkStore(tmp_path / "c")
+    assert reopened.get(1) is None and reopened.get(99) is None
+    assert reopened.get(3) == {"text": "cuatro", "source": "x.md", "id": 3}
+    assert reopened.live_ids().tolist() == [0, 2, 3]
+    assert len(reopened) == 3 and reopened.next_id == 4
+    # Añadir solo escribe los registros nuevos
+    reopened.put_many([4], [{"text": "cinco"}])
+    assert reopened.blob_path.stat().st_size == blob_size + len('{"text": "cinco"}')
+    # Un lector abierto ve lo que otro escribe después
+    assert cs.get(4)["text"] == "cinco"
+
+def test_legacy_pickle_metadata_is_migrated(tmp_path):
+    import faiss, pickle
+    vecs = _vecs(3)
+    legacy = faiss.IndexFlatIP(16)
+    legacy.add(vecs)
+    faiss.write_index(legacy, str(tmp_path / "faiss.index"))
+    (tmp_path / "faiss_meta.pkl").write_bytes(pickle.dumps([{"text": f"t{i}", "source": "s", "chunk_id": i} for i in range(3)]))
+
+    store = _store(tmp_path, "flat")
+    assert not (tmp_path / "faiss_meta.pkl").exists()
+    assert store.search(vecs[2:3], top_k=1)[0][1]["text"] == "t2"
+    assert store.add(["t3"], [{"source": "s", "chunk_id": 3}], _vecs(1, seed=5)) == [3]
+
+def test_search_many_matches_single_searches(tmp_path):
+    store = _store(tmp_path, "flat")
+    vecs = _vecs(50)
+    store.add([f"t{i}" for i in range(50)], [{"source": "s", "chunk_id": i} for i in range(50)], vecs)
+    batch = store.search_many(vecs[:10], top_k=4)
+    assert len(batch) == 10
+    for i, hits in enumerate(batch):
+        single = store.search(vecs[i:i + 1], top_k=4)
+        assert [m["id"] for _, m in hits] == [m["id"] for _, m in single]
+        assert hits[0][1]["text"] == f"t{i}"
+
+def test_external_save_marks_store_stale(tmp_path):
+    writer = _store(tmp_path, "flat")
+    writer.add(["a"], [{"source": "s", "chunk_id": 0}], _vecs(1))
+    reader = _store(tmp_path, "flat")
+    assert not reader.stale() and reader.version() == writer.version()
+    writer.add(["b"], [{"source": "s", "chunk_id": 1}], _vecs(1, seed=1))
+    assert reader.stale()
+    assert not (tmp_path / "faiss.index.tmp").exists()
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf_flat"])
+def test_filtered_search_uses_id_bitmaps(tmp_path, kind):
+    from src.rag.filters import SearchFilter
+    from datetime import datetime, timezone
+    store = _store(tmp_path, kind)
+    vecs = _vecs(200)
+    metas = [{"source": f"doc{i % 4}.pdf", "chunk_id": i, "doc_type": "pdf" if i % 2 else "md",
+              "mtime": 1_700_000_000 + i * 86400} for i in range(200)]
+    store.add([f"t{i}" for i in range(200)], metas, vecs)
+    store.delete([1])
+
+    flt = SearchFilter.build(source=["doc1.pdf", "doc3.pdf"])
+    hits = store.search(vecs[0:1], top_k=10, filters=flt)
+    assert len(hits) == 10 and all(m["source"] in ("doc1.pdf", "doc3.pdf") for _, m in hits)
+    assert all(m["chunk_id"] != 1 for _, m in hits)  # los borrados no vuelven por el filtro
+
+    day = datetime.fromtimestamp(1_700_000_000 + 50 * 86400, tz=timezone.utc).date()
+    flt = SearchFilter.build(doc_type="md", date_from=day, date_to=day)
+    assert [m["chunk_id"] for _, m in store.search(vecs[0:1], top_k=10, filters=flt)] == [50]
+
+    assert store.search(vecs[0:1], top_k=5, filters=SearchFilter.build(source="otro.pdf")) == []
+    # Los bitmaps sobreviven a una recarga (columnas en disco)
+    reloaded = _store(tmp_path, kind)
+    assert len(reloaded.search(vecs[0:1], top_k=10, filters=SearchFilter.build(doc_type="pdf"))) == 10
+
+@pytest.mark.parametrize("kind,precision", [("flat", "fp16"), ("flat", "sq8"), ("flat", "pq"), ("hnsw", "sq8"), ("ivf_flat", "sq8")])
+def test_quantized_storage_with_exact_rerank(tmp_path, kind, precision):
+    cfg = IndexConfig(kind=kind, precision=precision, nlist=4, pq_m=4, hnsw_m=8, nprobe=4, train_size=100, rerank=4)
+    make = lambda: FaissStore(dim=16, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks",
+                              config=cfg, vectors_path=tmp_path / "faiss_vectors.f32")
+    store = make()
+    vecs = _vecs(300)
+    store.add([f"t{i}" for i in range(300)], [{"source": "s", "chunk_id": i} for i in range(300)], vecs)
+    hits = store.search(vecs[7:8], top_k=3)
+    # Con rerank los scores son el producto interno exacto en float32
+    assert hits[0][1]["text"] == "t7" and hits[0][0] == pytest.approx(1.0, abs=1e-5)
+
+    store.delete(list(range(0, 300, 2)))  # en HNSW fuerza la compactación al guardar
+    reloaded = make()
+    assert (reloaded.kind, reloaded.precision) == (kind, precision)
+    assert reloaded.search(vecs[9:10], top_k=1)[0][1]["text"] == "t9"
+    assert len(reloaded.search(vecs[8:9], top_k=5)) == 5
+
+def test_rerank_without_stored_vectors_keeps_ann_order(tmp_path, caplog):
+    vecs = _vecs(50)
+    old = FaissStore(dim=16, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks",
+                     config=IndexConfig(kind="flat", precision="fp16"))
+    old.add([f"t{i}" for i in range(50)], [{"source": "s", "chunk_id": i} for i in range(50)], vecs)
+    # Mismo índice abierto con rerank: no hay vectores float32 guardados
+    store = FaissStore(dim=16, index_path=tmp_path / "faiss.index", chunks_path=tmp_path / "faiss_chunks",
+                       config=IndexConfig(kind="flat", precision="fp16", rerank=4),
+                       vectors_path=tmp_path / "faiss_vectors.f32")
+    with caplog.at_level("WARNING"):
+        hits = store.search(vecs[7:8], top_k=3)
+    assert hits[0][1]["text"] == "t7" and hits[0][0] > 0.9
+    assert "Faltan vectores" in caplog.text
+
+def test_opening_store_does_not_drop_unsaved_chunks(tmp_path):
+    writer = _store(tmp_path, "flat")
+    writer.autosave = False
+    vecs = _vecs(5)
+    writer.add([f"t{i}" for i in range(5)], [{"source": "s", "chunk_id": i} for i in range(5)], vecs)
+    reader = _store(tmp_path, "flat")  # p. ej. el warmup de la API antes de que la ingesta guarde
+    assert reader.search(vecs[0:1], top_k=1) == []
+    writer.save()
+    assert reader.stale()
+    hits = _store(tmp_path, "flat").search(vecs[3:4], top_k=1)
+    assert hits[0][1]["text"] == "t3"
+
+def test_hnsw_with_pq_is_rejected():
+    from src.rag.vectorstore import make_index
+    with pytest.raises(ValueError):
+        make_index(IndexConfig(kind="hnsw", precision="pq"), 16, _vecs(100))